@@ -0,0 +1,74 @@
+##############################################################################
+# admin.py
+##############################################################################
+
+"""
+Admin control channel of a running server (started with --admin-socket PATH).
+
+Requests and replies are single lines of JSON over the server's UNIX socket:
+    {"command": "kick", "args": ["alice"]}
+    {"ok": true, "kicked": 1}
+Failed commands reply {"ok": false, "error": "..."}.
+
+    python admin.py trivia-admin.sock stats
+    python admin.py trivia-admin.sock sessions
+    python admin.py trivia-admin.sock kick alice
+    python admin.py trivia-admin.sock reset-score alice      # or --all
+    python admin.py trivia-admin.sock snapshot
+    python admin.py trivia-admin.sock load-questions /path/to/questions.txt
+"""
+
+import json
+import socket
+import sys
+
+
+COMMANDS = ("stats", "sessions", "kick", "reset-score", "snapshot", "load-questions")
+MAX_LINE_LENGTH = 64 * 1024  # Longest request the server accepts
+TIMEOUT = 300  # Seconds to wait for a reply, bulk question imports can take a while
+
+
+def encode(message):
+    """
+    Returns: the message (dict) as one line of JSON (bytes)
+    """
+    return json.dumps(message).encode() + b"\n"
+
+
+def decode(line):
+    """
+    Parses one line of JSON.
+    Returns: dict. Raises ValueError if the line is not a JSON object
+    """
+    message = json.loads(line)
+    if not isinstance(message, dict):
+        raise ValueError("Expected a JSON object")
+    return message
+
+
+def send_command(path, command, args=(), timeout=TIMEOUT):
+    """
+    Sends one command to the server's admin socket and waits for the reply.
+    Parameters: path (str) - the server's --admin-socket, command (str), args (list of str), timeout (seconds)
+    Returns: the reply (dict). Raises OSError if the server cannot be reached
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(encode({"command": command, "args": list(args)}))
+        reply = b""
+        while not reply.endswith(b"\n"):
+            data = sock.recv(65536)
+            if not data:
+                raise ConnectionError("The server closed the admin connection")
+            reply += data
+    return decode(reply)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[2] not in COMMANDS:
+        print(f"Usage: python admin.py ADMIN_SOCKET {{{','.join(COMMANDS)}}} [ARGS...]")
+        sys.exit(1)
+    result = send_command(sys.argv[1], sys.argv[2], sys.argv[3:])
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result.get("ok") else 1)
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import time
+
+import admin
+import chatlib
+import triviaclient
+from checks import check, catch, write_test_data, start_server, stop_server
+
+
+PORT = 5721
+
+
+def protocol_checks():
+    check("request round trip", admin.decode(admin.encode({"command": "kick", "args": ["a"]})),
+          {"command": "kick", "args": ["a"]})
+    check("only objects", catch(admin.decode, b"[1, 2]\n"), ValueError)
+
+
+def command_checks(directory):
+    write_test_data(directory, question_count=5, users=(("alice", "a"), ("bob", "b")))
+    path = os.path.join(directory, "admin.sock")
+    process = start_server(directory, PORT, "--admin-socket", path)
+    pushes = []
+    alice = triviaclient.TriviaClient("127.0.0.1", PORT, push_handler=lambda code, data: pushes.append(code))
+    bob = triviaclient.TriviaClient("127.0.0.1", PORT, reconnect=False)
+    try:
+        alice.connect()
+        alice.login("alice", "a")
+        bob.connect()
+        bob.login("bob", "b")
+        question = bob.get_question()
+        bob.send_answer(question.id, 1)
+
+        # STATS AND SESSIONS
+        stats = admin.send_command(path, "stats")
+        check("stats", (stats["ok"], stats["clients"], stats["logged_in"], stats["users"], stats["questions"]),
+              (True, 2, 2, 2, 5))
+        sessions = admin.send_command(path, "sessions")["sessions"]
+        check("sessions", sorted(session["username"] for session in sessions), ["alice", "bob"])
+        check("unknown command", admin.send_command(path, "nope")["ok"], False)
+
+        # RESET SCORE
+        check("bob scored", bob.get_score(), 5)
+        check("reset unknown user", admin.send_command(path, "reset-score", ["carol"])["ok"], False)
+        check("reset one user", admin.send_command(path, "reset-score", ["bob"]), {"ok": True, "reset": 1})
+        check("score reset", bob.get_score(), 0)
+
+        # KICK
+        check("kick", admin.send_command(path, "kick", ["alice"]), {"ok": True, "kicked": 1})
+        time.sleep(1)  # Longer than the first reconnect delay
+        check("kicked client told", pushes, [chatlib.PROTOCOL_SERVER["kicked_msg"]])
+        check("kicked client does not reconnect", (alice.connected.is_set(), alice.connection_count), (False, 1))
+        check("one session left", admin.send_command(path, "stats")["logged_in"], 1)
+
+        # LOAD QUESTIONS
+        with open(os.path.join(directory, "more.txt"), "w") as file:
+            file.write("Question 1?|right|wrong|wrong|wrong|1\n")  # Already in the pool
+            file.write("Imported?|right|wrong|wrong|wrong|1\n")
+            file.write("not a question\n")
+        check("load questions", admin.send_command(path, "load-questions", ["more.txt"])["ok"], True)
+        check("only the new question added", admin.send_command(path, "stats")["questions"], 6)
+        check("missing file", admin.send_command(path, "load-questions", ["missing.txt"])["ok"], False)
+
+        # SNAPSHOT
+        reply = admin.send_command(path, "snapshot")
+        check("snapshot", reply, {"ok": True, "saved": ["users.txt", "questions.txt", "question_stats.bin"]})
+        with open(os.path.join(directory, "questions.txt")) as file:
+            check("snapshot has the imported question", "Imported?" in file.read(), True)
+        os.remove(os.path.join(directory, "questions.txt"))
+        os.mkdir(os.path.join(directory, "questions.txt"))  # Cannot be replaced by a file
+        check("failed snapshot reported", admin.send_command(path, "snapshot")["ok"], False)
+        os.rmdir(os.path.join(directory, "questions.txt"))
+    finally:
+        alice.close()
+        bob.close()
+        stop_server(process)
+
+
+def main():
+
+    # PROTOCOL
+    protocol_checks()
+
+    # COMMANDS
+    with tempfile.TemporaryDirectory() as directory:
+        command_checks(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+##############################################################################
+# analytics.py
+##############################################################################
+
+"""
+Offline analytics over the server's event log (see eventlog.py).
+
+The segments are replayed as a stream of events through generators, so only
+the running totals are kept in memory, never the log itself.
+
+    python analytics.py events leaderboard --window 3600 --top 10
+    python analytics.py events questions --questions questions.txt --top 20
+"""
+
+import argparse
+import datetime
+import heapq
+
+import eventlog
+import questionstats
+
+
+def answers(events):
+    """
+    Yields: the ANSWER events
+    """
+    return (event for event in events if event.kind == eventlog.ANSWER)
+
+
+def windowed_leaderboards(events, window, top):
+    """
+    Tumbling-window leaderboards of the points players earned.
+    Parameters: events (iterable of eventlog.Event, oldest first), window (seconds), top (int)
+    Yields: (window start, list of (username, points), best first) for every window with points
+    """
+    current = None
+    points = {}
+    for event in answers(events):
+        start = event.time - event.time % window
+        if current is None or start > current:
+            if points:
+                yield current, heapq.nlargest(top, points.items(), key=lambda item: item[1])
+            current, points = start, {}
+        if event.points:
+            points[event.username] = points.get(event.username, 0) + event.points
+    if points:
+        yield current, heapq.nlargest(top, points.items(), key=lambda item: item[1])
+
+
+def question_totals(events):
+    """
+    Per-question totals, grouped by question key (the same question keeps its key when its ID changes).
+    Returns: {question key: {"id": last question ID, "served": , "attempts": , "correct": , "seconds": total}}
+    """
+    totals = {}
+    for event in events:
+        if event.kind not in (eventlog.QUESTION, eventlog.ANSWER):
+            continue
+        entry = totals.get(event.question_key)
+        if entry is None:
+            entry = totals[event.question_key] = {"id": event.question_id, "served": 0, "attempts": 0, "correct": 0,
+                                                  "seconds": 0.0}
+        entry["id"] = event.question_id
+        if event.kind == eventlog.QUESTION:
+            entry["served"] += 1
+        else:
+            entry["attempts"] += 1
+            entry["correct"] += event.correct
+            entry["seconds"] += event.seconds
+    return totals
+
+
+def load_question_texts(file_path):
+    """
+    Returns: {question key: question text} of a questions.txt file
+    """
+    texts = {}
+    with open(file_path, "r") as file:
+        for line in file:
+            parts = line.strip().split("|")
+            if len(parts) >= 6:
+                text = parts[1] if parts[0].isdigit() and len(parts) >= 7 else parts[0]
+                texts[questionstats.question_key(text)] = text
+    return texts
+
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
+
+
+def parse_time(text):
+    return datetime.datetime.fromisoformat(text).timestamp() if text else None
+
+
+def print_leaderboards(events, window, top):
+    for start, table in windowed_leaderboards(events, window, top):
+        print(f"{format_time(start)} - {format_time(start + window)}: "
+              + ", ".join(f"{username} {points}" for username, points in table))
+
+
+def print_question_totals(events, top, texts):
+    totals = question_totals(events)
+    answered = [(key, entry) for key, entry in totals.items() if entry["attempts"]]
+    # Hardest first: lowest share of correct answers
+    for key, entry in heapq.nsmallest(top, answered, key=lambda item: item[1]["correct"] / item[1]["attempts"]):
+        label = texts.get(key, f"#{entry['id']} ({key.hex()})")
+        print(f"{entry['correct']}/{entry['attempts']} correct, {entry['seconds'] / entry['attempts']:.1f} s average, "
+              f"served {entry['served']} times: {label}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trivia event log analytics")
+    parser.add_argument("directory", help="event log directory (the server's --event-log)")
+    parser.add_argument("--since", help="only events from this time on (ISO format, e.g. 2024-05-01T12:00)")
+    parser.add_argument("--until", help="only events before this time (ISO format)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    leaderboard = commands.add_parser("leaderboard", help="best players of every time window")
+    leaderboard.add_argument("--window", type=int, default=3600, help="window length in seconds")
+    leaderboard.add_argument("--top", type=int, default=10)
+    question_report = commands.add_parser("questions", help="hardest questions by share of correct answers")
+    question_report.add_argument("--top", type=int, default=20)
+    question_report.add_argument("--questions", help="questions.txt to show the question texts from")
+    args = parser.parse_args()
+
+    events = eventlog.replay(args.directory, parse_time(args.since), parse_time(args.until))
+    if args.command == "leaderboard":
+        print_leaderboards(events, args.window, args.top)
+    else:
+        texts = load_question_texts(args.questions) if args.questions else {}
+        print_question_totals(events, args.top, texts)
+
+
+if __name__ == '__main__':
+    main()
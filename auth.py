@@ -0,0 +1,113 @@
+##############################################################################
+# auth.py
+##############################################################################
+
+import hashlib
+import hmac
+import os
+import time
+from collections import deque
+
+
+HASH_ALGORITHM = "pbkdf2_sha256"
+HASH_ITERATIONS = 200000
+SALT_LENGTH = 16  # In bytes
+HASH_SEPARATOR = "$"  # Must never be the users.txt field delimiter ('|')
+
+MAX_FAILED_LOGINS = 5  # Failed attempts allowed per address inside the window
+FAILED_LOGIN_WINDOW = 60  # In seconds
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def hash_password(password, iterations=HASH_ITERATIONS):
+    """
+    Hashes a plaintext password with a fresh random salt.
+    Returns: str in the format 'pbkdf2_sha256$iterations$salt_hex$hash_hex'
+    """
+    salt = os.urandom(SALT_LENGTH)
+    digest = _pbkdf2(password, salt, iterations)
+    return HASH_SEPARATOR.join([HASH_ALGORITHM, str(iterations), salt.hex(), digest.hex()])
+
+
+def is_hashed(stored):
+    """
+    Checks whether a stored password is already in the hashed format
+    Returns: True if hashed, False if it is a legacy plaintext entry
+    """
+    parts = stored.split(HASH_SEPARATOR)
+    return len(parts) == 4 and parts[0] == HASH_ALGORITHM and parts[1].isdigit()
+
+
+def verify_password(password, stored):
+    """
+    Checks a login password against the stored entry (hashed or legacy plaintext).
+    This runs the KDF, so it is slow on purpose - call it off the select loop.
+    Returns: (ok, new_stored) - new_stored is a fresh hash when the stored entry
+    should be replaced (plaintext or outdated iteration count), otherwise None
+    """
+    if not is_hashed(stored):
+        # Legacy plaintext entry - migrate it once the password is proven
+        ok = hmac.compare_digest(password.encode(), stored.encode())
+        return ok, hash_password(password) if ok else None
+
+    _, iterations, salt_hex, digest_hex = stored.split(HASH_SEPARATOR)
+    iterations = int(iterations)
+    try:
+        salt = bytes.fromhex(salt_hex)
+        expected = bytes.fromhex(digest_hex)
+    except ValueError:
+        return False, None
+
+    ok = hmac.compare_digest(_pbkdf2(password, salt, iterations), expected)
+    if ok and iterations != HASH_ITERATIONS:
+        return ok, hash_password(password)
+    return ok, None
+
+
+class LoginThrottle:
+    """
+    Counts failed logins per client address in a sliding time window.
+    Addresses that never come back are dropped by a sweep of all addresses,
+    at most once per window, so an address scan cannot grow it without bound.
+    """
+
+    def __init__(self, max_failures=MAX_FAILED_LOGINS, window=FAILED_LOGIN_WINDOW):
+        self.max_failures = max_failures
+        self.window = window
+        self.failures = {}  # {address: deque of failure timestamps}
+        self.next_sweep = None  # When the next sweep of expired addresses is due
+
+    def _prune(self, address, now):
+        attempts = self.failures.get(address)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self.failures[address]
+            return None
+        return attempts
+
+    def is_blocked(self, address, now=None):
+        now = time.monotonic() if now is None else now
+        attempts = self._prune(address, now)
+        return attempts is not None and len(attempts) >= self.max_failures
+
+    def record_failure(self, address, now=None):
+        now = time.monotonic() if now is None else now
+        if self.next_sweep is None or now >= self.next_sweep:
+            self.sweep(now)
+        self._prune(address, now)
+        self.failures.setdefault(address, deque()).append(now)
+
+    def sweep(self, now=None):
+        """
+        Drops the addresses whose failures are all older than the window
+        """
+        now = time.monotonic() if now is None else now
+        for address in [address for address, attempts in self.failures.items() if attempts[-1] <= now - self.window]:
+            del self.failures[address]
+        self.next_sweep = now + self.window
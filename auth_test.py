@@ -0,0 +1,65 @@
+import auth
+from checks import check
+
+
+def hash_checks():
+    stored = auth.hash_password("secret", iterations=1000)
+    check("hash format", (auth.is_hashed(stored), stored.split(auth.HASH_SEPARATOR)[:2]),
+          (True, [auth.HASH_ALGORITHM, "1000"]))
+    check("no '|' in hash", "|" in stored, False)
+    check("fresh salt per hash", stored == auth.hash_password("secret", iterations=1000), False)
+
+    current = auth.hash_password("secret")
+    check("right password", auth.verify_password("secret", current), (True, None))
+    check("wrong password", auth.verify_password("Secret", current), (False, None))
+    check("broken hash", auth.verify_password("secret", current[:-3] + "xyz"), (False, None))
+
+    # Hashes with an outdated iteration count are replaced on the next good login
+    ok, new_stored = auth.verify_password("secret", stored)
+    check("old iteration count rehashed", (ok, new_stored is not None and auth.is_hashed(new_stored)), (True, True))
+    check("rehash uses current iterations", new_stored.split(auth.HASH_SEPARATOR)[1], str(auth.HASH_ITERATIONS))
+    check("rehash verifies", auth.verify_password("secret", new_stored), (True, None))
+    check("wrong password not rehashed", auth.verify_password("nope", stored), (False, None))
+
+
+def plaintext_checks():
+    check("plaintext detected", auth.is_hashed("secret"), False)
+    ok, new_stored = auth.verify_password("secret", "secret")
+    check("plaintext migrated", (ok, auth.is_hashed(new_stored)), (True, True))
+    check("migrated hash verifies", auth.verify_password("secret", new_stored), (True, None))
+    check("wrong plaintext password", auth.verify_password("secrets", "secret"), (False, None))
+
+
+def throttle_checks():
+    throttle = auth.LoginThrottle(max_failures=3, window=10)
+    for now in (0, 1, 2):
+        check(f"not blocked before failure at {now}", throttle.is_blocked("a", now), False)
+        throttle.record_failure("a", now)
+    check("blocked after max failures", throttle.is_blocked("a", 5), True)
+    check("other address not blocked", throttle.is_blocked("b", 5), False)
+    check("first failure left the window", throttle.is_blocked("a", 10), False)
+    check("window slides", (throttle.is_blocked("a", 11.5), throttle.is_blocked("a", 12)), (False, False))
+    check("address forgotten when window is empty", "a" in throttle.failures, False)
+
+    # Addresses that fail once and never come back are swept out
+    throttle = auth.LoginThrottle(max_failures=3, window=10)
+    for i in range(1000):
+        throttle.record_failure(f"scan{i}", i * 0.01)
+    throttle.record_failure("late", 25)
+    check("expired addresses swept", list(throttle.failures), ["late"])
+
+
+def main():
+
+    # HASHING
+    hash_checks()
+
+    # PLAINTEXT MIGRATION
+    plaintext_checks()
+
+    # THROTTLE
+    throttle_checks()
+
+
+if __name__ == '__main__':
+    main()
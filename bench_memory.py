@@ -0,0 +1,115 @@
+##############################################################################
+# bench_memory.py
+##############################################################################
+
+"""
+Measures the memory of the question bank and the users' questions_asked sets
+as loaded by the server, with and without interning (see interning.py).
+
+A synthetic questions.txt and users.txt are written to a temporary directory,
+with the repetition real banks have: True/False, numbers, country names and
+"None of the above" answers, a few dozen categories and three difficulties.
+
+    python bench_memory.py
+    python bench_memory.py --questions 200000 --users 2000 --asked 1000
+"""
+
+import argparse
+import gc
+import os
+import random
+import tempfile
+import tracemalloc
+
+import interning
+import questionindex
+import server
+
+
+QUESTIONS = 100000
+USERS = 1000
+ASKED = 500  # Questions asked per user
+CATEGORIES = [f"Category {i}" for i in range(24)]
+COUNTRIES = ["France", "Germany", "Italy", "Spain", "Japan", "China", "India", "Brazil", "Canada", "Mexico",
+             "Egypt", "Kenya", "Peru", "Chile", "Norway", "Sweden", "Poland", "Greece", "Turkey", "Israel"]
+
+
+class NoInterning:
+    """
+    Stand-in for interning.InternTable that keeps every value as parsed, like the server did before
+    """
+
+    def intern(self, value):
+        return value
+
+    def intern_all(self, values):
+        return list(values)
+
+
+def random_answers(rng, i):
+    kind = rng.random()
+    if kind < 0.2:
+        return ["True", "False", "Maybe", "None of the above"]
+    if kind < 0.5:
+        return [str(n) for n in rng.sample(range(1, 200), 4)]
+    if kind < 0.8:
+        return rng.sample(COUNTRIES, 4)
+    return [f"Answer {i}-{n}" for n in range(3)] + ["None of the above"]
+
+
+def write_bank(directory, question_count, user_count, asked):
+    rng = random.Random(1)
+    questions_path = os.path.join(directory, "questions.txt")
+    with open(questions_path, "w") as file:
+        for i in range(1, question_count + 1):
+            answers = "|".join(random_answers(rng, i))
+            file.write(f"{i}|Question number {i}?|{answers}|{rng.randint(1, 4)}|{rng.choice(CATEGORIES)}|"
+                       f"{rng.choice(questionindex.DIFFICULTIES)}\n")
+
+    users_path = os.path.join(directory, "users.txt")
+    with open(users_path, "w") as file:
+        for i in range(user_count):
+            asked_ids = ",".join(str(q_id) for q_id in rng.sample(range(1, question_count + 1), asked))
+            file.write(f"user{i}|pw|0|{asked_ids}|1500.0\n")
+    return questions_path, users_path
+
+
+def measure(table, questions_path, users_path):
+    """
+    Returns: (bytes used by the questions, bytes used by the users), loaded through the table
+    """
+    server.question_strings = table
+    gc.collect()
+    tracemalloc.start()
+    questions = server.load_questions(questions_path)
+    questions_bytes = tracemalloc.get_traced_memory()[0]
+    users = server.load_user_database(users_path)
+    users_bytes = tracemalloc.get_traced_memory()[0] - questions_bytes
+    tracemalloc.stop()
+    del questions, users
+    return questions_bytes, users_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question bank memory benchmark")
+    parser.add_argument("--questions", type=int, default=QUESTIONS)
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--asked", type=int, default=ASKED, help="questions asked per user")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_bank(directory, args.questions, args.users, args.asked)
+        print(f"{args.questions} questions, {args.users} users with {args.asked} asked questions each")
+
+        plain = measure(NoInterning(), *paths)
+        table = interning.InternTable()
+        interned = measure(table, *paths)
+
+    for name, before, after in (("questions", plain[0], interned[0]), ("users", plain[1], interned[1])):
+        print(f"{name}: {before / 2**20:.1f} MB plain, {after / 2**20:.1f} MB interned "
+              f"({100 * (before - after) / before:.0f}% less)")
+    print(f"{len(table)} distinct values for {table.lookups} lookups (the table itself is included above)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+##############################################################################
+# bench_startup.py
+##############################################################################
+
+"""
+Tracks the server's startup time:
+- import time of server.py (python -X importtime), with its heaviest imports
+- time until a started server accepts connections
+- time until it answers a LOGIN, i.e. until the users and questions are loaded
+
+Every server run uses a fresh process in a temporary directory, so users.txt
+is created on the first run and loaded on the next ones.
+
+    python bench_startup.py
+    python bench_startup.py --rounds 10
+"""
+
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import chatlib
+
+
+ROUNDS = 5
+HEAVIEST_IMPORTS = 5
+START_TIMEOUT = 30  # Seconds
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+LOGIN = chatlib.build_message(chatlib.PROTOCOL_CLIENT["login_msg"], chatlib.join_data(["test", "test"])).encode()
+
+
+def import_times():
+    """
+    Imports server.py in a new interpreter.
+    Returns: (microseconds the import took, list of (cumulative microseconds, module) of its heaviest imports)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"],
+                            cwd=os.path.dirname(SERVER), capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative), name))
+    total = next((cumulative for cumulative, name in modules if name.strip() == "server"), None)
+    if total is None:
+        raise RuntimeError(f"Importing server.py failed:\n{result.stderr[-2000:]}")
+    # Modules imported by server.py itself are indented by one level
+    direct = [(cumulative, name.strip()) for cumulative, name in modules if name.startswith("   ") and name[3] != " "]
+    return total, sorted(direct, reverse=True)[:HEAVIEST_IMPORTS]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_and_login(directory):
+    """
+    Starts a server and logs in as soon as it accepts.
+    Returns: (seconds until the first accepted connection, seconds until the LOGIN reply)
+    """
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SERVER, "--port", str(port)], cwd=directory,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                sock = socket.create_connection(("127.0.0.1", port))
+                break
+            except ConnectionRefusedError:
+                if process.poll() is not None or time.perf_counter() - start > START_TIMEOUT:
+                    raise RuntimeError("The server did not start")
+                time.sleep(0.002)
+        accepted = time.perf_counter() - start
+
+        with sock:
+            sock.settimeout(START_TIMEOUT)
+            sock.sendall(LOGIN)
+            if not sock.recv(chatlib.MAX_MSG_LENGTH):
+                raise RuntimeError("The server closed the connection")
+        return accepted, time.perf_counter() - start
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=START_TIMEOUT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server startup benchmark")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    args = parser.parse_args()
+
+    totals = []
+    for _ in range(args.rounds):
+        total, heaviest = import_times()
+        totals.append(total)
+    print(f"import server: {statistics.median(totals) / 1000:.1f} ms (median of {args.rounds}), heaviest imports:")
+    for cumulative, name in heaviest:
+        print(f"    {name}: {cumulative / 1000:.1f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs = [start_and_login(directory) for _ in range(args.rounds)]
+    accepted, ready = zip(*runs)
+    print(f"time to accept: {statistics.median(accepted) * 1000:.0f} ms, "
+          f"time to first reply (data loaded): {statistics.median(ready) * 1000:.0f} ms (median of {args.rounds})")
+
+
+if __name__ == '__main__':
+    main()
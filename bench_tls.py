@@ -0,0 +1,123 @@
+##############################################################################
+# bench_tls.py
+##############################################################################
+
+"""
+Compares the cost of a full TLS handshake with a resumed one.
+
+By default a local TLS server with a throwaway self-signed certificate runs in a
+thread. With --port, a running trivia server started with --tls-cert/--tls-key
+is measured instead (pass its certificate with --ca-file).
+
+    python bench_tls.py
+    python bench_tls.py --port 5678 --ca-file cert.pem
+"""
+
+import argparse
+import socket
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+
+import chatlib
+import tls
+
+
+ROUNDS = 200
+VERSIONS = (ssl.TLSVersion.TLSv1_2, ssl.TLSVersion.TLSv1_3)
+REQUEST = chatlib.build_message(chatlib.PROTOCOL_CLIENT["my_score_msg"], "").encode()
+
+
+def serve_forever(server_socket, context):
+    """
+    Minimal stand-in for the trivia server: handshake, answer one request, wait for the client to leave
+    """
+    while True:
+        try:
+            conn, _ = server_socket.accept()
+        except OSError:
+            return  # The benchmark is over
+        try:
+            with context.wrap_socket(conn, server_side=True) as tls_conn:
+                if tls_conn.recv(chatlib.MAX_MSG_LENGTH):
+                    tls_conn.sendall(chatlib.build_message(chatlib.PROTOCOL_SERVER["error_msg"], "Please log in first").encode())
+                tls_conn.recv(1)
+        except OSError:
+            pass
+
+
+def start_local_server(directory):
+    cert_file, key_file = tls.create_self_signed_cert(directory)
+    server_socket = socket.create_server(("127.0.0.1", 0))
+    thread = threading.Thread(target=serve_forever, args=(server_socket, tls.server_context(cert_file, key_file)),
+                              daemon=True)
+    thread.start()
+    return server_socket, server_socket.getsockname()[1], cert_file
+
+
+def handshake(context, host, port, session=None):
+    """
+    Connects and does one request, so TLS 1.3 session tickets are received.
+    Returns: (seconds the TCP connect and TLS handshake took, whether the session was resumed, session to resume next)
+    """
+    start = time.perf_counter()
+    sock = context.wrap_socket(socket.create_connection((host, port)), server_hostname=host, session=session)
+    elapsed = time.perf_counter() - start
+    try:
+        sock.sendall(REQUEST)
+        sock.recv(chatlib.MAX_MSG_LENGTH)
+        return elapsed, sock.session_reused, sock.session
+    finally:
+        sock.close()
+
+
+def measure(version, host, port, ca_file, rounds):
+    context = tls.client_context(ca_file)
+    context.maximum_version = version
+
+    full = [handshake(context, host, port)[0] for _ in range(rounds)]
+
+    resumed = []
+    reused = 0
+    session = handshake(context, host, port)[2]
+    for _ in range(rounds):
+        elapsed, was_reused, session = handshake(context, host, port, session)
+        resumed.append(elapsed)
+        reused += was_reused
+    return full, resumed, reused
+
+
+def print_result(version, full, resumed, reused):
+    full_ms = statistics.median(full) * 1000
+    resumed_ms = statistics.median(resumed) * 1000
+    print(f"{version.name}: full {full_ms:.2f} ms, resumed {resumed_ms:.2f} ms (median), "
+          f"{full_ms / resumed_ms:.1f}x faster, {reused}/{len(resumed)} sessions resumed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TLS full vs resumed handshake benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="measure a running trivia server instead of a local one")
+    parser.add_argument("--ca-file", help="certificate of the running server")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server_socket = None
+        host, port, ca_file = args.host, args.port, args.ca_file
+        if port is None:
+            server_socket, port, ca_file = start_local_server(directory)
+            host = "127.0.0.1"
+
+        print(f"{args.rounds} connections per measurement to {host}:{port}")
+        for version in VERSIONS:
+            print_result(version, *measure(version, host, port, ca_file, args.rounds))
+
+        if server_socket is not None:
+            server_socket.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+import base64
+import zlib
+
 # Protocol Constants
 
 CMD_FIELD_LENGTH = 16	# Exact length of cmd field (in bytes)
@@ -8,6 +11,22 @@ MAX_MSG_LENGTH = MSG_HEADER_LENGTH + MAX_DATA_LENGTH  # Max size of total messag
 DELIMITER = "|"  # Delimiter character in protocol
 DATA_DELIMITER = "#"  # Delimiter in the data part of the message
 
+# Compression (only used after the COMPRESSION command negotiated it)
+COMPRESSION_FLAG = "*"  # Last character of the cmd field of a compressed message
+COMPRESSION_METHOD = "zlib"
+COMPRESSION_THRESHOLD = 256  # Data shorter than this is always sent as is
+MAX_UNCOMPRESSED_LENGTH = 10**6  # Largest data a compressed message may expand to
+# Preset dictionary: text that shows up in many messages, so even the first
+# occurrence compresses well. Most frequent strings come last.
+COMPRESSION_DICTIONARY = (
+	b"None of the above#All of the above#Which of the following#In which year did #"
+	b"What is the name of the #Who was the first #How many #What was the #"
+	b"United States#United Kingdom#Germany#France#Japan#China#Italy#Spain#Russia#"
+	b"Science#History#Geography#Entertainment#Sports#easy#medium#hard#"
+	b"What is the capital of #Which country #True#False#"
+	b"login#logout#score#: 0\n: 5\n: 10\n: 15\n: 20\n: 50\n: 100\n"
+)
+
 # Protocol Messages 
 # In this dictionary we will have all the client and server command names
 
@@ -16,9 +35,19 @@ PROTOCOL_CLIENT = {
 "logout_msg" : "LOGOUT",
 "logged_msg": "LOGGED",
 "get_question_msg": "GET_QUESTION",
+"get_questions_msg": "GET_QUESTIONS",
 "send_answer_msg": "SEND_ANSWER",
 "my_score_msg": "MY_SCORE",
-"highscore_msg": "HIGHSCORE"
+"highscore_msg": "HIGHSCORE",
+"compression_msg": "COMPRESSION",
+"create_room_msg": "CREATE_ROOM",
+"join_room_msg": "JOIN_ROOM",
+"leave_room_msg": "LEAVE_ROOM",
+"start_room_msg": "START_ROOM",
+"room_answer_msg": "ROOM_ANSWER",
+"subscribe_msg": "SUBSCRIBE",
+"unsubscribe_msg": "UNSUBSCRIBE",
+"shard_top_msg": "SHARD_TOP"
 } # .. Add more commands if needed
 
 
@@ -26,12 +55,26 @@ PROTOCOL_SERVER = {
 "login_ok_msg" : "LOGIN_OK",
 "logged_answer_msg": "LOGGED_ANSWER",
 "your_question_msg": "YOUR_QUESTION",
+"your_questions_msg": "YOUR_QUESTIONS",
 "correct_answer_msg": "CORRECT_ANSWER",
 "wrong_answer_msg": "WRONG_ANSWER",
 "your_score_msg": "YOUR_SCORE",
 "all_score_msg": "ALL_SCORE",
+"compression_ok_msg": "COMPRESSION_OK",
 "error_msg" : "ERROR",
-"no_questions_msg": "NO_QUESTIONS"
+"no_questions_msg": "NO_QUESTIONS",
+"room_ok_msg": "ROOM_OK",
+"room_members_msg": "ROOM_MEMBERS",
+"room_question_msg": "ROOM_QUESTION",
+"room_answer_ok_msg": "ROOM_ANSWER_OK",
+"room_result_msg": "ROOM_RESULT",
+"room_over_msg": "ROOM_OVER",
+"subscribe_ok_msg": "SUBSCRIBE_OK",
+"events_msg": "EVENTS",
+"server_shutdown_msg": "SERVER_SHUTDOWN",
+"kicked_msg": "KICKED",
+"redirect_msg": "REDIRECT",
+"shard_top_ok_msg": "SHARD_TOP_OK"
 } # ..  Add more commands if needed
 
 
@@ -40,17 +83,58 @@ PROTOCOL_SERVER = {
 ERROR_RETURN = None  # What is returned in case of an error
 
 
-def build_message(cmd, data):
+def compress_data(data):
+	"""
+	Helper method. Compresses a data field with zlib and the preset dictionary.
+	Returns: str (base64, so it is safe inside a text message)
+	"""
+	
+	compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=COMPRESSION_DICTIONARY)
+	packed = compressor.compress(data.encode()) + compressor.flush()
+	return base64.b64encode(packed).decode()
+
+
+def decompress_data(data):
+	"""
+	Helper method. Reverses compress_data().
+	Returns: str, or None if the data is invalid or expands beyond MAX_UNCOMPRESSED_LENGTH
+	"""
+	
+	try:
+		decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=COMPRESSION_DICTIONARY)
+		unpacked = decompressor.decompress(base64.b64decode(data, validate=True), MAX_UNCOMPRESSED_LENGTH)
+		if decompressor.unconsumed_tail:
+			return ERROR_RETURN
+		return unpacked.decode()
+	except (ValueError, zlib.error):
+		return ERROR_RETURN
+
+
+def build_message(cmd, data, compress=False):
 	"""
-	Gets command name (str) and data field (str) and creates a valid protocol message
+	Gets command name (str) and data field (str) and creates a valid protocol message.
+	With compress=True, data of at least COMPRESSION_THRESHOLD characters is compressed
+	(when that makes it shorter), and may then be longer than MAX_DATA_LENGTH.
 	Returns: str, or None if error occured
 	"""
     
-	if len(cmd) > CMD_FIELD_LENGTH or len(data) > MAX_DATA_LENGTH:
+	if len(cmd) > CMD_FIELD_LENGTH or len(data) > MAX_UNCOMPRESSED_LENGTH:
+		return ERROR_RETURN
+	
+	cmd_padded = ERROR_RETURN
+	if compress and len(data) >= COMPRESSION_THRESHOLD and len(cmd) < CMD_FIELD_LENGTH:
+		packed = compress_data(data)
+		if len(packed) < len(data):
+			# Flag the message as compressed in the last character of the cmd field
+			cmd_padded = cmd + " " * (CMD_FIELD_LENGTH - 1 - len(cmd)) + COMPRESSION_FLAG
+			data = packed
+	
+	if len(data) > MAX_DATA_LENGTH:
 		return ERROR_RETURN
     
     # Pad the command to exactly CMD_FIELD_LENGTH
-	cmd_padded = cmd + " " * (CMD_FIELD_LENGTH - len(cmd))
+	if cmd_padded is ERROR_RETURN:
+		cmd_padded = cmd + " " * (CMD_FIELD_LENGTH - len(cmd))
     
     # Get the length of the data as a string, and pad it to LENGTH_FIELD_LENGTH
 	data_length = str(len(data))
@@ -62,9 +146,11 @@ def build_message(cmd, data):
 	return full_msg
 
 
-def parse_message(data):
+def parse_message(data, allow_compressed=True):
 	"""
-	Parses protocol message and returns command name and data field
+	Parses protocol message and returns command name and data field.
+	Compressed messages are decompressed, or rejected if allow_compressed is False
+	(the sender never negotiated compression).
 	Returns: cmd (str), data (str). If some error occured, returns None, None
 	"""
     
@@ -81,12 +167,18 @@ def parse_message(data):
 	if (len(cmd) != CMD_FIELD_LENGTH):
 		return (ERROR_RETURN, ERROR_RETURN)
 	
+	compressed = cmd.endswith(COMPRESSION_FLAG)
+	if compressed:
+		if not allow_compressed:
+			return (ERROR_RETURN, ERROR_RETURN)
+		cmd = cmd[:-1]
+	
 	 # Strip any extra spaces from the command
 	cmd = cmd.strip()
 
 	length_field = data_splitted[1]
 	
-	if len(length_field) != LENGTH_FIELD_LENGTH or not length_field.strip().isdigit():
+	if len(length_field) != LENGTH_FIELD_LENGTH or not is_length_field(length_field):
 		return (ERROR_RETURN, ERROR_RETURN)	
 
 	length_field_int = int(length_field)
@@ -96,10 +188,51 @@ def parse_message(data):
     # Check if the actual length of the message matches the length field
 	if len(msg) != length_field_int or len(msg) > MAX_DATA_LENGTH:
 		return (ERROR_RETURN, ERROR_RETURN)	
+	
+	if compressed:
+		msg = decompress_data(msg)
+		if msg is ERROR_RETURN:
+			return (ERROR_RETURN, ERROR_RETURN)
 		
     # The function should return 2 values
 	return cmd, msg
 
+
+def is_length_field(length_field):
+	"""
+	Helper method. Checks that a length field holds only ASCII digits and padding spaces.
+	str.isdigit() alone also accepts digits like '²' that int() rejects.
+	Returns: True if int(length_field) is a valid length, False otherwise
+	"""
+	
+	return length_field.isascii() and length_field.strip().isdigit()
+
+
+def split_message(buffer):
+	"""
+	Helper method. Gets received text that may hold several messages, or only part of one,
+	and cuts the first complete protocol message off its start.
+	Returns: message (str), rest (str). If the buffer holds only part of a message,
+	returns None, buffer. If the buffer does not start with a valid header, returns None, None
+	"""
+	
+	if len(buffer) < MSG_HEADER_LENGTH:
+		return ERROR_RETURN, buffer
+	
+	# Validate the header the same way parse_message does
+	if buffer[CMD_FIELD_LENGTH] != DELIMITER or buffer[MSG_HEADER_LENGTH - 1] != DELIMITER:
+		return ERROR_RETURN, ERROR_RETURN
+	
+	length_field = buffer[CMD_FIELD_LENGTH + 1:MSG_HEADER_LENGTH - 1]
+	if not is_length_field(length_field):
+		return ERROR_RETURN, ERROR_RETURN
+	
+	msg_length = MSG_HEADER_LENGTH + int(length_field)
+	if len(buffer) < msg_length:
+		return ERROR_RETURN, buffer
+	
+	return buffer[:msg_length], buffer[msg_length:]
+
 	
 def split_data(msg, expected_fields):
 	"""
@@ -14,11 +14,11 @@ def check_build(input_cmd, input_data, expected_output):
 		print(".....\t FAILED, output: ", output)
 
 
-def check_parse(msg_str, expected_output):
+def check_parse(msg_str, expected_output, allow_compressed=True):
 	print("Input: ", msg_str, "\nExpected output: ", expected_output)
 
 	try:
-		output = chatlib.parse_message(msg_str)
+		output = chatlib.parse_message(msg_str, allow_compressed)
 	except Exception as e:
 		output = "Exception raised: " + str(e)
 	
@@ -27,6 +27,36 @@ def check_parse(msg_str, expected_output):
 	else:
 		print(".....\t FAILED, output: ", output)		
 	
+def check_split(buffer, expected_output):
+	print("Input: ", repr(buffer), "\nExpected output: ", expected_output)
+
+	try:
+		output = chatlib.split_message(buffer)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+	
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_compression(cmd, data, expected_compressed):
+	print("Input: ", cmd, len(data), "characters", "\nExpected output: compressed" if expected_compressed else "\nExpected output: plain")
+
+	try:
+		msg = chatlib.build_message(cmd, data, compress=True)
+		compressed = msg[chatlib.CMD_FIELD_LENGTH - 1] == chatlib.COMPRESSION_FLAG
+		output = compressed == expected_compressed and chatlib.parse_message(msg) == (cmd, data)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+	
+	if output is True:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
 def main():
 
 	# BUILD
@@ -63,6 +93,41 @@ def main():
 	check_parse("LOGIN           |	 -4|data",(None, None))
 	check_parse("LOGIN           |	  z|data",(None, None))
 	check_parse("LOGIN           |	  5|data",(None, None))
+	check_parse("LOGIN           |   ²|a",(None, None))
+
+	# SPLIT
+	
+	# Valid inputs
+	# One full message
+	check_split("LOGIN           |0009|aaaa#bbbb", ("LOGIN           |0009|aaaa#bbbb", ""))
+	# Two messages in one buffer
+	check_split("MY_SCORE        |0000|LOGGED          |0000|", ("MY_SCORE        |0000|", "LOGGED          |0000|"))
+	# Partial header and partial data
+	check_split("LOGIN      ", (None, "LOGIN      "))
+	check_split("LOGIN           |0009|aaaa", (None, "LOGIN           |0009|aaaa"))
+	
+	# Invalid inputs
+	check_split("LOGIN           x0009|aaaa#bbbb", (None, None))
+	check_split("LOGIN           |00z9|aaaa#bbbb", (None, None))
+	check_split("LOGIN           |000²|", (None, None))
+	check_split("LOGIN           |٠٠٠٩|aaaa#bbbb", (None, None))
+
+	# COMPRESSION
+	
+	# Short data is sent as is
+	check_compression("LOGIN", "aaaa#bbbb", False)
+	# Large repetitive data is compressed and parsed back
+	check_compression("ALL_SCORE", "\n".join(f"user{i}:{i * 7}" for i in range(500)), True)
+	# Data too long for a plain message fits once compressed
+	check_compression("ALL_SCORE", "a" * (chatlib.MAX_DATA_LENGTH * 2), True)
+	# cmd of the full field width has no room for the flag
+	check_compression("0123456789ABCDEF", "a" * 500, False)
+	
+	# Invalid inputs
+	# Corrupted compressed data
+	check_parse("ALL_SCORE      *|0004|!!!!", (None, None))
+	# Compressed data from a sender that never negotiated compression
+	check_parse(chatlib.build_message("ALL_SCORE", "a" * 500, compress=True), (None, None), allow_compressed=False)
 
 
 
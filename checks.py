@@ -0,0 +1,92 @@
+##############################################################################
+# checks.py
+##############################################################################
+
+"""
+Helpers shared by the *_test.py scripts. Each check prints its input, the
+expected output and SUCCESS or FAILED, like chatlib_test.py. The server
+helpers run server.py in a scratch directory, on questions written there
+(--no-download), so the tests need no network.
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+SERVER_START_TIMEOUT = 30  # Seconds
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+def check(description, output, expected_output):
+    print("Input: ", description, "\nExpected output: ", expected_output)
+    if output == expected_output:
+        print(".....\t SUCCESS")
+    else:
+        print(".....\t FAILED, output: ", output)
+
+
+def catch(func, *args):
+    """
+    Returns: the type of the exception func(*args) raised, or None
+    """
+    try:
+        func(*args)
+    except Exception as e:
+        return type(e)
+    return None
+
+
+def wait_for_port(host, port, timeout=SERVER_START_TIMEOUT):
+    """
+    Returns: True once something listens on host:port, False if nothing did in time
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def write_test_data(directory, question_count=20, users=(("test", "test"),)):
+    """
+    Writes a users file and a questions file (question i has answer 1 right) to directory
+    """
+    with open(os.path.join(directory, "users.txt"), "w") as file:
+        file.writelines(f"{username}|{password}|0|\n" for username, password in users)
+    with open(os.path.join(directory, "questions.txt"), "w") as file:
+        file.writelines(f"{i}|Question {i}?|right|wrong|wrong|wrong|1|General|easy\n"
+                        for i in range(1, question_count + 1))
+
+
+def start_server(directory, port, *args):
+    """
+    Starts server.py in directory with --no-download, output goes to server.log there.
+    Returns: the subprocess.Popen, once the server listens
+    """
+    with open(os.path.join(directory, "server.log"), "ab") as log:
+        process = subprocess.Popen([sys.executable, "-u", SERVER, "--port", str(port), "--no-download"] + list(args),
+                                   cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+    if not wait_for_port("127.0.0.1", port):
+        stop_server(process)
+        raise RuntimeError(f"The server did not start, see {directory}/server.log")
+    return process
+
+
+def stop_server(process):
+    """
+    Stops the server like Ctrl+C does and waits for it to exit
+    """
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=SERVER_START_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
@@ -0,0 +1,164 @@
+##############################################################################
+# eventlog.py
+##############################################################################
+
+import collections
+import glob
+import os
+import queue
+import struct
+import threading
+import time
+
+
+# Event kinds
+LOGIN = 1
+LOGOUT = 2
+QUESTION = 3  # A question was sent to a player
+ANSWER = 4
+KIND_NAMES = {LOGIN: "login", LOGOUT: "logout", QUESTION: "question", ANSWER: "answer"}
+
+SEGMENT_SIZE = 16 * 1024 * 1024  # Bytes written to a segment before the next one is started
+FLUSH_INTERVAL = 1.0  # Seconds events may wait in the writer's buffer
+SEGMENT_MAGIC = b"TEV1"
+SEGMENT_PATTERN = "events-*.log"
+MAX_NAME_LENGTH = 255
+
+# kind, time (seconds since the epoch), question key, question ID, correct, points, answer seconds, username length
+RECORD = struct.Struct("<Bd8sIBhfB")
+
+Event = collections.namedtuple("Event", ["kind", "time", "username", "question_key", "question_id", "correct",
+                                         "points", "seconds"])
+
+
+def pack_event(kind, username, question_key=bytes(8), question_id=0, correct=False, points=0, seconds=0.0,
+               timestamp=None):
+    """
+    Returns: the event as a log record (bytes) - a fixed-size header and the username
+    """
+    name = username.encode()[:MAX_NAME_LENGTH]
+    header = RECORD.pack(kind, time.time() if timestamp is None else timestamp, question_key, question_id,
+                         correct, points, seconds, len(name))
+    return header + name
+
+
+class EventLog:
+    """
+    Append-only log of game events, split into segment files.
+
+    log() only packs the record and queues it; a writer thread appends the
+    records through a buffered file and flushes it every FLUSH_INTERVAL seconds,
+    so the select loop never waits for the disk. When a segment reaches
+    segment_size a new one is started. Segments are named after the time they
+    were started, so sorting their names orders them in time. A crash loses at
+    most the events of the last flush interval, the log is never rewritten.
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.records = queue.SimpleQueue()  # Packed records, None to stop the writer
+        self.segments_started = 0
+        os.makedirs(directory, exist_ok=True)
+        self.writer = threading.Thread(target=self._write_records, name="eventlog", daemon=True)
+        self.writer.start()
+
+    def log(self, kind, username, question_key=bytes(8), question_id=0, correct=False, points=0, seconds=0.0):
+        """
+        Queues an event for writing. Safe to call from any thread.
+        """
+        self.records.put(pack_event(kind, username, question_key, question_id, correct, points, seconds))
+
+    def close(self, timeout=5):
+        """
+        Writes the queued events and stops the writer
+        """
+        self.records.put(None)
+        self.writer.join(timeout)
+
+    def _new_segment(self):
+        self.segments_started += 1
+        name = f"events-{int(time.time() * 1000):013d}-{os.getpid()}-{self.segments_started:04d}.log"
+        file = open(os.path.join(self.directory, name), "ab")
+        file.write(SEGMENT_MAGIC)
+        return file
+
+    def _write_records(self):
+        # Runs on the writer thread
+        file = None
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.records.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = b""  # Nothing new, only flush
+            if record is None:
+                break
+
+            try:
+                if record:
+                    if file is None or file.tell() >= self.segment_size:
+                        if file is not None:
+                            file.close()
+                        file = self._new_segment()
+                    file.write(record)
+                if file is not None and time.monotonic() - last_flush >= self.flush_interval:
+                    file.flush()
+                    last_flush = time.monotonic()
+            except OSError as e:
+                print(f"Error writing event log: {e}")
+
+        if file is not None:
+            file.close()
+
+
+def segment_paths(directory):
+    """
+    Returns: paths of the log's segments, oldest first
+    """
+    return sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN)))
+
+
+def segment_start(path):
+    """
+    Returns: the time (seconds since the epoch) the segment was started
+    """
+    return int(os.path.basename(path).split("-")[1]) / 1000
+
+
+def read_segment(path):
+    """
+    Yields: the Events of one segment, in the order they were written.
+    A record cut short (the server was killed while writing) ends the segment.
+    Raises ValueError if the file is not a segment
+    """
+    with open(path, "rb") as file:
+        if file.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not an event log segment")
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, timestamp, question_key, question_id, correct, points, seconds, name_length = RECORD.unpack(header)
+            name = file.read(name_length)
+            if len(name) < name_length:
+                return
+            yield Event(kind, timestamp, name.decode(errors="replace"), question_key, question_id, bool(correct),
+                        points, seconds)
+
+
+def replay(directory, since=None, until=None):
+    """
+    Yields: the Events of every segment between since and until (seconds since the epoch, None for no limit).
+    Only one segment is open at a time, and segments that end before since are not read at all.
+    """
+    paths = segment_paths(directory)
+    for i, path in enumerate(paths):
+        if since is not None and i + 1 < len(paths) and segment_start(paths[i + 1]) < since:
+            continue  # The next segment started before since, so this one holds nothing newer
+        if until is not None and segment_start(path) >= until:
+            return
+        for event in read_segment(path):
+            if (since is None or event.time >= since) and (until is None or event.time < until):
+                yield event
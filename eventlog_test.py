@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+import analytics
+import eventlog
+from checks import check
+
+
+def log_checks(directory):
+    log = eventlog.EventLog(directory, segment_size=200, flush_interval=0.05)
+    log.log(eventlog.LOGIN, "alice")
+    for i in range(20):
+        log.log(eventlog.QUESTION, "alice", b"question", i)
+        log.log(eventlog.ANSWER, "alice", b"question", i, i % 2 == 0, 5 if i % 2 == 0 else 0, 1.5)
+    log.log(eventlog.LOGOUT, "alice")
+    log.close()
+
+    paths = eventlog.segment_paths(directory)
+    check("segments were rotated", len(paths) > 1, True)
+    events = list(eventlog.replay(directory))
+    check("every event replayed in order", [event.kind for event in events],
+          [eventlog.LOGIN] + [eventlog.QUESTION, eventlog.ANSWER] * 20 + [eventlog.LOGOUT])
+    check("answer fields", events[2][2:], ("alice", b"question", 0, True, 5, 1.5))
+
+    # A record cut short by a crash ends the replay of its segment
+    with open(paths[-1], "ab") as file:
+        file.write(eventlog.pack_event(eventlog.LOGIN, "bob")[:-2])
+    check("cut record skipped", len(list(eventlog.replay(directory))), len(events))
+
+
+def analytics_checks():
+    hour = 3600
+    events = [eventlog.Event(eventlog.ANSWER, time, username, b"q1", 1, points > 0, points, 2.0)
+              for time, username, points in [(10, "alice", 5), (20, "bob", 5), (30, "bob", 5),
+                                             (hour + 10, "alice", 5), (hour + 20, "bob", 0)]]
+    check("leaderboard per hour", list(analytics.windowed_leaderboards(iter(events), hour, 10)),
+          [(0, [("bob", 10), ("alice", 5)]), (hour, [("alice", 5)])])
+    totals = analytics.question_totals(iter(events))
+    check("question totals", (totals[b"q1"]["attempts"], totals[b"q1"]["correct"]), (5, 4))
+
+
+def main():
+
+    # LOG
+    with tempfile.TemporaryDirectory() as directory:
+        log_checks(os.path.join(directory, "events"))
+
+    # ANALYTICS
+    analytics_checks()
+
+
+if __name__ == '__main__':
+    main()
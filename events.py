@@ -0,0 +1,82 @@
+##############################################################################
+# events.py
+##############################################################################
+
+import time
+import chatlib
+
+
+COALESCE_WINDOW = 0.25  # Seconds events are collected before one push goes out
+
+# Event kinds, the first field of every event line
+LOGIN_EVENT = "login"
+LOGOUT_EVENT = "logout"
+SCORE_EVENT = "score"
+
+
+class EventCoalescer:
+    """
+    Collects presence and score changes for a short window and merges them,
+    so each flush sends at most one event per user and kind no matter how
+    many changes happened: a login followed by a logout is sent as the logout,
+    many score changes as the last score.
+    """
+
+    def __init__(self, window=COALESCE_WINDOW):
+        self.window = window
+        self.presence = {}  # {username: LOGIN_EVENT or LOGOUT_EVENT}
+        self.scores = {}  # {username: latest score}
+        self.flush_at = None
+
+    def _changed(self, now):
+        if self.flush_at is None:
+            self.flush_at = (time.monotonic() if now is None else now) + self.window
+
+    def add_presence(self, username, online, now=None):
+        self.presence[username] = LOGIN_EVENT if online else LOGOUT_EVENT
+        self._changed(now)
+
+    def add_score(self, username, score, now=None):
+        self.scores[username] = score
+        self._changed(now)
+
+    def timeout(self, now=None):
+        """
+        Returns: seconds until the next flush is due (for select), or None if nothing is pending
+        """
+        if self.flush_at is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.flush_at - now)
+
+    def flush(self, now=None):
+        """
+        Returns the pending events as the data of EVENTS messages, one event per line:
+        login#username, logout#username or score#username#score. Lines are packed into
+        as few messages as fit in chatlib.MAX_DATA_LENGTH.
+        Returns an empty list if nothing is pending or the window is not over yet.
+        """
+        now = time.monotonic() if now is None else now
+        if self.flush_at is None or now < self.flush_at:
+            return []
+
+        lines = [chatlib.join_data([kind, username]) for username, kind in self.presence.items()]
+        lines += [chatlib.join_data([SCORE_EVENT, username, str(score)]) for username, score in self.scores.items()]
+        self.presence = {}
+        self.scores = {}
+        self.flush_at = None
+
+        messages = []
+        current = []
+        current_length = 0
+        for line in lines:
+            # +1 for the newline between lines
+            if current and current_length + 1 + len(line) > chatlib.MAX_DATA_LENGTH:
+                messages.append("\n".join(current))
+                current = []
+                current_length = 0
+            current_length += len(line) + (1 if current else 0)
+            current.append(line)
+        if current:
+            messages.append("\n".join(current))
+        return messages
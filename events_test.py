@@ -0,0 +1,42 @@
+import chatlib
+import events
+from checks import check
+
+
+def coalesce_checks():
+    coalescer = events.EventCoalescer(window=1)
+    check("nothing pending", (coalescer.timeout(0), coalescer.flush(0)), (None, []))
+
+    coalescer.add_presence("alice", True, now=10)
+    coalescer.add_score("bob", 5, now=10.5)
+    coalescer.add_presence("alice", False, now=10.6)
+    coalescer.add_score("bob", 7, now=10.7)
+    check("timeout from the first change", coalescer.timeout(10.5), 0.5)
+    check("window not over", coalescer.flush(10.9), [])
+    check("merged events", coalescer.flush(11), ["logout#alice\nscore#bob#7"])
+    check("flushed", (coalescer.timeout(11), coalescer.flush(12)), (None, []))
+
+
+def split_checks():
+    coalescer = events.EventCoalescer(window=0)
+    usernames = [f"user{i:05}" for i in range(2000)]
+    for username in usernames:
+        coalescer.add_presence(username, True, now=0)
+    messages = coalescer.flush(0)
+    lines = [line for message in messages for line in message.split("\n")]
+    check("split into several messages", len(messages) > 1, True)
+    check("every message fits", all(len(message) <= chatlib.MAX_DATA_LENGTH for message in messages), True)
+    check("no line lost or cut", lines, [f"login#{username}" for username in usernames])
+
+
+def main():
+
+    # COALESCING
+    coalesce_checks()
+
+    # SPLITTING
+    split_checks()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+##############################################################################
+# interning.py
+##############################################################################
+
+
+class InternTable:
+    """
+    Keeps one canonical object per distinct value (question texts, answers,
+    categories, question IDs). Answers like "True", "1" or country names repeat
+    across thousands of questions, and every user's questions_asked holds the same
+    IDs; interning makes them all references to a single object.
+
+    Unlike sys.intern() this also takes ints (IDs above 256 are separate objects
+    every time they are parsed) and can be measured. intern() is a single
+    dict.setdefault(), so loaders running in the offloader's threads may use it too.
+    """
+
+    def __init__(self):
+        self.values = {}  # {value: the canonical object equal to it}
+        self.lookups = 0
+
+    def intern(self, value):
+        """
+        Returns: the canonical object equal to value (value itself the first time it is seen)
+        """
+        self.lookups += 1
+        return self.values.setdefault(value, value)
+
+    def intern_all(self, values):
+        """
+        Returns: list of the canonical objects of values
+        """
+        return [self.intern(value) for value in values]
+
+    def __len__(self):
+        return len(self.values)
+
+    def shared(self):
+        """
+        Returns: number of lookups that were answered with an object seen before
+        """
+        return self.lookups - len(self.values)
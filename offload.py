@@ -0,0 +1,84 @@
+##############################################################################
+# offload.py
+##############################################################################
+
+import queue
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Offloader:
+    """
+    Runs blocking jobs (KDF, file writes, HTTP) in a thread pool and hands their
+    results back to the select loop.
+
+    Workers never touch server state. When a job finishes, its callback is queued
+    and one byte is written to a socketpair; the select loop watches the other end
+    (wake_socket) and calls run_callbacks(), so every callback runs on the loop thread.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="offload")
+        self.completed = queue.SimpleQueue()  # (callback, future) of finished jobs
+        self.wake_socket, self._wake_writer = socket.socketpair()
+        self.wake_socket.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self.jobs_in_flight = 0
+
+    def submit(self, callback, func, *args):
+        """
+        Runs func(*args) in the pool. When it finishes, callback(future) is called on the loop thread.
+        Parameters: callback (callable), func (callable), args - arguments of func
+        Returns: the concurrent.futures.Future of the job
+        """
+        self.jobs_in_flight += 1
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(lambda done: self._job_done(callback, done))
+        return future
+
+    def _job_done(self, callback, future):
+        # Runs on the worker thread (or on the loop thread if the job already finished)
+        self.completed.put((callback, future))
+        self.wake()
+
+    def wake(self):
+        """
+        Makes the select loop return. Safe to call from any thread.
+        """
+        try:
+            self._wake_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # A wakeup is already pending, or we are shutting down
+
+    def run_callbacks(self):
+        """
+        Called by the select loop when wake_socket is readable.
+        Runs the callbacks of every finished job.
+        Returns: Nothing
+        """
+        try:
+            while self.wake_socket.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+        while True:
+            try:
+                callback, future = self.completed.get_nowait()
+            except queue.Empty:
+                return
+            self.jobs_in_flight -= 1
+            try:
+                callback(future)
+            except Exception as e:
+                print(f"Error in offloaded job callback: {e}")
+
+    def shutdown(self, wait=True):
+        """
+        Stops the pool. With wait=True, finished jobs' callbacks are run before returning.
+        """
+        self.executor.shutdown(wait=wait)
+        if wait:
+            self.run_callbacks()
+        self.wake_socket.close()
+        self._wake_writer.close()
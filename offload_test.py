@@ -0,0 +1,83 @@
+import select
+import threading
+import time
+
+import offload
+from checks import check
+
+
+def wait_for_wakeup(offloader, timeout=5):
+    readable, _, _ = select.select([offloader.wake_socket], [], [], timeout)
+    return offloader.wake_socket in readable
+
+
+def callback_checks():
+    offloader = offload.Offloader(max_workers=2)
+    results = []
+
+    def remember(future):
+        results.append((future.result(), threading.current_thread() is threading.main_thread()))
+
+    release = threading.Event()
+    offloader.submit(remember, lambda: release.wait(5) and threading.current_thread().name)
+    check("job in flight", offloader.jobs_in_flight, 1)
+    check("no wakeup while the job runs", wait_for_wakeup(offloader, 0.1), False)
+
+    release.set()
+    check("wake socket readable when the job is done", wait_for_wakeup(offloader), True)
+    check("callback waits for the loop", results, [])
+    offloader.run_callbacks()
+    check("callback ran on the loop thread with the job's result",
+          [(name.startswith("offload"), on_loop) for name, on_loop in results], [(True, True)])
+    check("nothing in flight", offloader.jobs_in_flight, 0)
+    check("wake socket drained", wait_for_wakeup(offloader, 0.1), False)
+    offloader.shutdown()
+
+
+def error_checks():
+    offloader = offload.Offloader(max_workers=1)
+    errors = []
+
+    def failing_job():
+        raise ValueError("broken")
+
+    offloader.submit(lambda future: errors.append(type(future.exception())), failing_job)
+    wait_for_wakeup(offloader)
+    offloader.run_callbacks()
+    check("job exception reaches the callback", errors, [ValueError])
+
+    # A failing callback does not stop the callbacks after it
+    offloader.submit(lambda future: 1 / 0, time.sleep, 0)
+    offloader.submit(lambda future: errors.append("after"), time.sleep, 0)
+    while offloader.jobs_in_flight:
+        wait_for_wakeup(offloader)
+        offloader.run_callbacks()
+    check("callbacks after a failing one run", errors, [ValueError, "after"])
+    offloader.shutdown()
+
+
+def shutdown_checks():
+    offloader = offload.Offloader(max_workers=2)
+    done = []
+    for i in range(4):
+        offloader.submit(lambda future: done.append(future.result()), lambda i=i: time.sleep(0.05) or i)
+    offloader.shutdown(wait=True)
+    check("shutdown runs the callbacks of every job", sorted(done), [0, 1, 2, 3])
+    check("wake sockets closed", offloader.wake_socket.fileno(), -1)
+    offloader.wake()  # Must not raise once closed
+
+
+def main():
+
+    # CALLBACKS
+    callback_checks()
+
+    # ERRORS
+    error_checks()
+
+    # SHUTDOWN
+    shutdown_checks()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+##############################################################################
+# questionindex.py
+##############################################################################
+
+import bisect
+import itertools
+import math
+import random
+
+
+DIFFICULTIES = ("easy", "medium", "hard")  # As returned by the Open Trivia DB
+MODES = ("random", "adaptive")  # adaptive: questions matching the player's rating, see questionstats
+FILTER_KEYS = ("category", "difficulty", "mode")
+SCAN_LIMIT = 4096  # Most questions a pick looks at before giving up, however many are excluded
+
+
+def parse_filters(fields):
+    """
+    Parses question filters, each field in the format key=value (see FILTER_KEYS).
+    Category names are matched without regard to case. The adaptive mode
+    chooses by rating, so it does not take a category or difficulty.
+    Parameters: fields (list of str)
+    Returns: {key: value}. Raises ValueError if a filter is invalid
+    """
+    filters = {}
+    for field in fields:
+        key, separator, value = field.partition("=")
+        if not separator or key not in FILTER_KEYS or not value:
+            raise ValueError(f"Invalid filter {field!r}, expected category=..., difficulty=... or mode=...")
+        if key == "difficulty" and value not in DIFFICULTIES:
+            raise ValueError(f"Difficulty must be one of {', '.join(DIFFICULTIES)}")
+        if key == "mode" and value not in MODES:
+            raise ValueError(f"Mode must be one of {', '.join(MODES)}")
+        filters[key] = value
+    if filters.get("mode") == "adaptive" and len(filters) > 1:
+        raise ValueError("The adaptive mode cannot be combined with a category or difficulty")
+    return filters
+
+
+def format_filters(category=None, difficulty=None, mode=None):
+    """
+    Returns: the filter fields for GET_QUESTION / GET_QUESTIONS (list of str)
+    """
+    filters = {"category": category, "difficulty": difficulty, "mode": mode}
+    return [f"{key}={value}" for key, value in filters.items() if value is not None]
+
+
+def random_positions(total, limit=SCAN_LIMIT):
+    """
+    Walks range(total) in a random order without repeats: start + i * step (mod total),
+    with a random step coprime to total. Unlike random picks this also gets through
+    runs of neighbouring positions, e.g. a batch of questions fetched together.
+    Returns: iterator of at most limit positions - all of them if total <= limit
+    """
+    start = random.randrange(total)
+    step = 1
+    if total > 2:
+        step = random.randrange(1, total)
+        while math.gcd(step, total) != 1:
+            step = random.randrange(1, total)
+    return ((start + i * step) % total for i in range(min(total, limit)))
+
+
+class IdBucket:
+    """
+    Set of question IDs with O(1) add, remove and random choice
+    (a list for the choice, and every ID's position in it for the removal).
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}  # {question_id: index in self.ids}
+
+    def add(self, question_id):
+        if question_id not in self.positions:
+            self.positions[question_id] = len(self.ids)
+            self.ids.append(question_id)
+
+    def remove(self, question_id):
+        index = self.positions.pop(question_id, None)
+        if index is None:
+            return
+        last = self.ids.pop()
+        if last != question_id:
+            # Move the last ID into the freed slot
+            self.ids[index] = last
+            self.positions[last] = index
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class QuestionIndex:
+    """
+    Inverted indexes of the question pool. The IDs are kept in one bucket per
+    (category, difficulty) pair; category -> buckets and difficulty -> buckets
+    find the buckets matching a filter. There are only a few dozen buckets, so
+    picking a random matching question does not depend on the pool size.
+    """
+
+    def __init__(self, questions=None):
+        self._clear()
+        if questions:
+            self.rebuild(questions)
+
+    def _clear(self):
+        self.buckets = {}  # {(category key, difficulty): IdBucket}
+        self.by_category = {}  # {category key: {difficulty: IdBucket}}
+        self.by_difficulty = {}  # {difficulty: {category key: IdBucket}}
+        self.category_names = {}  # {category key: category as received}
+        self.keys = {}  # {question_id: (category key, difficulty)}
+
+    def rebuild(self, questions):
+        self._clear()
+        for question_id, question in questions.items():
+            self.add(question_id, question)
+
+    def add(self, question_id, question):
+        self.remove(question_id)
+        category = question.get("category", "")
+        difficulty = question.get("difficulty", "")
+        category_key = category.casefold()
+        key = (category_key, difficulty)
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = IdBucket()
+            self.by_category.setdefault(category_key, {})[difficulty] = bucket
+            self.by_difficulty.setdefault(difficulty, {})[category_key] = bucket
+            self.category_names.setdefault(category_key, category)
+        bucket.add(question_id)
+        self.keys[question_id] = key
+
+    def remove(self, question_id):
+        key = self.keys.pop(question_id, None)
+        if key is not None:
+            self.buckets[key].remove(question_id)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def categories(self):
+        """
+        Returns: list of (category, number of questions), categories of unknown questions excluded
+        """
+        return sorted((self.category_names[key], sum(len(bucket) for bucket in buckets.values()))
+                      for key, buckets in self.by_category.items() if key)
+
+    def matching_buckets(self, category=None, difficulty=None):
+        """
+        Returns: the non-empty buckets of the questions matching the filters (None matches anything)
+        """
+        if category is not None:
+            candidates = self.by_category.get(category.casefold(), {})
+            if difficulty is not None:
+                candidates = {difficulty: candidates[difficulty]} if difficulty in candidates else {}
+        elif difficulty is not None:
+            candidates = self.by_difficulty.get(difficulty, {})
+        else:
+            candidates = self.buckets
+        return [bucket for bucket in candidates.values() if bucket]
+
+    def count(self, category=None, difficulty=None):
+        return sum(len(bucket) for bucket in self.matching_buckets(category, difficulty))
+
+    def random_question(self, exclude=(), category=None, difficulty=None):
+        """
+        Picks a random question matching the filters, skipping the excluded IDs.
+        The matching questions are visited in random order (see random_positions()),
+        at most SCAN_LIMIT of them, so a player who has seen nearly all of more than
+        SCAN_LIMIT matching questions may be told none are left while a few are.
+        Parameters: exclude (sequence of sets or dicts of question IDs), category (str), difficulty (str)
+        Returns: question ID, or None if every matching question visited is excluded
+        """
+        buckets = self.matching_buckets(category, difficulty)
+        # Positions where each bucket starts when they are laid end to end, and the total
+        starts = list(itertools.accumulate((len(bucket) for bucket in buckets), initial=0))
+        total = starts.pop()
+        if total == 0:
+            return None
+
+        for position in random_positions(total):
+            index = bisect.bisect_right(starts, position) - 1
+            question_id = buckets[index].ids[position - starts[index]]
+            for excluded in exclude:
+                if question_id in excluded:
+                    break
+            else:
+                return question_id
+        return None
@@ -0,0 +1,144 @@
+import random
+import time
+
+import questionindex
+import questionstats
+from checks import check, catch
+
+
+CATEGORIES = ["General Knowledge", "Science: Computers", "History", "Sports"]
+POOL_SIZE = 100000
+
+
+def make_questions(count):
+    return {question_id: {"category": CATEGORIES[question_id % len(CATEGORIES)],
+                          "difficulty": questionindex.DIFFICULTIES[question_id % len(questionindex.DIFFICULTIES)]}
+            for question_id in range(1, count + 1)}
+
+
+def filter_checks():
+    check("parse filters", questionindex.parse_filters(["category=History", "difficulty=easy"]),
+          {"category": "History", "difficulty": "easy"})
+    check("filters survive the protocol format",
+          questionindex.parse_filters(questionindex.format_filters("Science: Computers", "hard")),
+          {"category": "Science: Computers", "difficulty": "hard"})
+    check("unknown difficulty", catch(questionindex.parse_filters, ["difficulty=impossible"]), ValueError)
+    check("unknown filter", catch(questionindex.parse_filters, ["color=red"]), ValueError)
+    check("adaptive mode with a category", catch(questionindex.parse_filters, ["mode=adaptive", "category=History"]),
+          ValueError)
+
+
+def index_checks():
+    questions = make_questions(120)
+    index = questionindex.QuestionIndex(questions)
+    check("questions per category", index.categories(), [(category, 30) for category in sorted(CATEGORIES)])
+    check("category matched without case", index.count(category="science: COMPUTERS"), 30)
+    check("questions per difficulty", index.count(difficulty="medium"), 40)
+
+    picked = {index.random_question(category="History", difficulty="hard") for _ in range(200)}
+    check("picks match both filters",
+          all(questions[q_id]["category"] == "History" and questions[q_id]["difficulty"] == "hard" for q_id in picked),
+          True)
+
+    # Only one matching question left unseen - fewer than SCAN_LIMIT match, so it is always found
+    matching = [q_id for q_id in questions if questions[q_id]["category"] == "Sports"]
+    check("last unseen question", index.random_question((set(matching[1:]),), category="Sports"), matching[0])
+    check("nothing left", index.random_question((set(matching),), category="Sports"), None)
+
+    index.remove(matching[0])
+    index.add(1000, {"category": "Sports", "difficulty": "easy"})
+    check("remove and add", (index.count(category="Sports"), index.random_question((set(matching),), category="Sports")),
+          (30, 1000))
+
+
+def speed_checks():
+    index = questionindex.QuestionIndex(make_questions(POOL_SIZE))
+    asked = set(range(1, POOL_SIZE // 2))  # The player has seen half of the pool
+    start = time.perf_counter()
+    for _ in range(1000):
+        index.random_question((asked,), category="History", difficulty="easy")
+    elapsed = time.perf_counter() - start
+    check(f"1000 filtered picks from {POOL_SIZE} questions in {elapsed * 1000:.1f} ms, under 100 ms", elapsed < 0.1, True)
+
+    # The player has seen nearly all questions, the unseen ones are hard to hit with random picks
+    nearly_all = set(random.sample(range(1, POOL_SIZE + 1), POOL_SIZE * 98 // 100))
+    start = time.perf_counter()
+    picked = [index.random_question((nearly_all,)) for _ in range(100)]
+    elapsed = time.perf_counter() - start
+    check(f"100 picks with 98% seen in {elapsed * 1000:.1f} ms, under 100 ms", elapsed < 0.1, True)
+    check("only unseen questions picked", any(question_id is None or question_id in nearly_all for question_id in picked), False)
+
+    # Every question seen: the pick gives up after SCAN_LIMIT questions instead of scanning the pool
+    every = set(range(1, POOL_SIZE + 1))
+    start = time.perf_counter()
+    picked = [index.random_question((every,)) for _ in range(10)]
+    elapsed = time.perf_counter() - start
+    check(f"10 picks with every question seen in {elapsed * 1000:.1f} ms, under 200 ms", (picked, elapsed < 0.2),
+          ([None] * 10, True))
+
+    book = questionstats.StatsBook()
+    book.rebuild({question_id: {"question": f"Q{question_id}", "difficulty": question["difficulty"]}
+                  for question_id, question in make_questions(POOL_SIZE).items()})
+    start = time.perf_counter()
+    for _ in range(1000):
+        book.random_question(1750, (asked,))
+    elapsed = time.perf_counter() - start
+    check(f"1000 adaptive picks from {POOL_SIZE} questions in {elapsed * 1000:.1f} ms, under 100 ms", elapsed < 0.1, True)
+
+    start = time.perf_counter()
+    picked = [book.random_question(1750, (nearly_all,)) for _ in range(100)]
+    elapsed = time.perf_counter() - start
+    check(f"100 adaptive picks with 98% seen in {elapsed * 1000:.1f} ms, under 100 ms", elapsed < 0.1, True)
+    check("only unseen questions picked adaptively",
+          any(question_id is None or question_id in nearly_all for question_id in picked), False)
+
+
+def rating_checks():
+    questions = {question_id: {"question": f"Q{question_id}", "difficulty": difficulty}
+                 for question_id, difficulty in enumerate(questionindex.DIFFICULTIES * 100)}
+    book = questionstats.StatsBook()
+    book.rebuild(questions)
+
+    # A strong player gets hard questions, a weak one easy questions
+    strong = {questions[book.random_question(1900)]["difficulty"] for _ in range(50)}
+    weak = {questions[book.random_question(1100)]["difficulty"] for _ in range(50)}
+    check("questions near the player's rating", (strong, weak), ({"hard"}, {"easy"}))
+
+    # Once the nearest band is used up the next one is taken
+    hard = {question_id for question_id, question in questions.items() if question["difficulty"] == "hard"}
+    check("next band", questions[book.random_question(1900, (hard,))]["difficulty"], "medium")
+
+    # A correct answer moves the player up and the question down
+    question_id = book.random_question(1500, (hard,))
+    rating_before = book.stats[question_id].rating
+    player_rating = book.record_answer(question_id, 1500, True, 4.0)
+    stats = book.stats[question_id]
+    check("ratings after a correct answer", (player_rating > 1500, stats.rating < rating_before), (True, True))
+    check("answer stats", (stats.attempts, stats.correct_rate, stats.average_time), (1, 1.0, 4.0))
+
+    # Saved stats come back for the same question text, whatever its ID
+    loaded = questionstats.StatsBook()
+    loaded.unpack(book.pack())
+    loaded.rebuild({1000: questions[question_id]})
+    check("stats survive a save", (loaded.stats[1000].attempts, loaded.stats[1000].rating), (1, stats.rating))
+    check("question found by its text", (loaded.find(questions[question_id]["question"]), loaded.find("Q?")), (1000, None))
+    check("invalid stats file", catch(loaded.unpack, b"nonsense"), ValueError)
+
+
+def main():
+
+    # FILTERS
+    filter_checks()
+
+    # INDEX
+    index_checks()
+
+    # RATINGS
+    rating_checks()
+
+    # SPEED
+    speed_checks()
+
+
+if __name__ == '__main__':
+    main()
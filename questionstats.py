@@ -0,0 +1,229 @@
+##############################################################################
+# questionstats.py
+##############################################################################
+
+import bisect
+import hashlib
+import math
+import struct
+
+from questionindex import IdBucket, SCAN_LIMIT, random_positions
+
+
+DEFAULT_RATING = 1500.0  # Elo rating of new players
+DIFFICULTY_RATINGS = {"easy": 1300.0, "medium": 1500.0, "hard": 1700.0}  # Starting ratings of new questions
+PLAYER_K = 32  # Elo K-factor of players
+QUESTION_K = 16  # Elo K-factor of questions, lower - a question's rating is shared by every player
+TARGET_SUCCESS = 0.6  # Chance of a correct answer the adaptive mode aims for
+BAND_WIDTH = 50  # Rating points per bucket of the rating index
+
+FILE_MAGIC = b"QST1"
+HEADER = struct.Struct("<4sI")  # magic, number of records
+RECORD = struct.Struct("<8sIIdd")  # question key, attempts, correct answers, total answer seconds, rating
+
+
+def question_key(question_text):
+    """
+    Returns: the 8-byte key stats are saved under. Question IDs change whenever the
+    pool is downloaded again, the question text does not.
+    """
+    return hashlib.blake2b(question_text.encode(), digest_size=8).digest()
+
+
+def expected_score(player_rating, question_rating):
+    """
+    Returns: the chance (0-1) that the player answers the question correctly
+    """
+    return 1 / (1 + 10 ** ((question_rating - player_rating) / 400))
+
+
+def target_rating(player_rating, success=TARGET_SUCCESS):
+    """
+    Returns: the question rating the player answers correctly with the given chance
+    """
+    return player_rating - 400 * math.log10(success / (1 - success))
+
+
+class QuestionStats:
+    """
+    Answer statistics of one question, updated with every answer
+    """
+    __slots__ = ("key", "attempts", "correct", "answer_time", "rating")
+
+    def __init__(self, key, rating=DEFAULT_RATING, attempts=0, correct=0, answer_time=0.0):
+        self.key = key
+        self.attempts = attempts
+        self.correct = correct
+        self.answer_time = answer_time  # Total seconds, divided by attempts for the average
+        self.rating = rating
+
+    @property
+    def correct_rate(self):
+        return self.correct / self.attempts if self.attempts else None
+
+    @property
+    def average_time(self):
+        return self.answer_time / self.attempts if self.attempts else None
+
+
+class RatingIndex:
+    """
+    Question IDs bucketed by rating (BAND_WIDTH points per band). The band
+    numbers are kept sorted, so the band of a target rating is found with a
+    binary search and its neighbours are the next bands on either side.
+    """
+
+    def __init__(self):
+        self.bands = {}  # {band number: IdBucket}
+        self.band_numbers = []  # Sorted keys of self.bands
+        self.question_bands = {}  # {question_id: band number}
+
+    def set(self, question_id, rating):
+        band = math.floor(rating / BAND_WIDTH)
+        current = self.question_bands.get(question_id)
+        if current == band:
+            return
+        if current is not None:
+            self.bands[current].remove(question_id)
+        bucket = self.bands.get(band)
+        if bucket is None:
+            bucket = self.bands[band] = IdBucket()
+            bisect.insort(self.band_numbers, band)
+        bucket.add(question_id)
+        self.question_bands[question_id] = band
+
+    def remove(self, question_id):
+        band = self.question_bands.pop(question_id, None)
+        if band is not None:
+            self.bands[band].remove(question_id)
+
+    def nearest_bands(self, rating):
+        """
+        Yields: the bands, nearest to the rating first
+        """
+        target = rating / BAND_WIDTH - 0.5  # Band numbers are the lower ends of the bands
+        right = bisect.bisect_left(self.band_numbers, target)
+        left = right - 1
+        while left >= 0 or right < len(self.band_numbers):
+            if right >= len(self.band_numbers) or (left >= 0 and target - self.band_numbers[left] <= self.band_numbers[right] - target):
+                yield self.bands[self.band_numbers[left]]
+                left -= 1
+            else:
+                yield self.bands[self.band_numbers[right]]
+                right += 1
+
+    def random_question(self, rating, exclude=()):
+        """
+        Picks a random question of the band nearest to the rating that still has
+        questions not excluded. Each band's questions are visited in random order
+        (see questionindex.random_positions()). At most SCAN_LIMIT questions are
+        looked at in all, empty bands included, then the pick gives up.
+        Parameters: rating (float), exclude (sequence of sets or dicts of question IDs)
+        Returns: question ID, or None if every question visited is excluded
+        """
+        budget = SCAN_LIMIT
+        for bucket in self.nearest_bands(rating):
+            if budget <= 0:
+                break
+            if not bucket:
+                budget -= 1
+                continue
+            for position in random_positions(len(bucket), budget):
+                question_id = bucket.ids[position]
+                for excluded in exclude:
+                    if question_id in excluded:
+                        break
+                else:
+                    return question_id
+            budget -= min(len(bucket), budget)
+        return None
+
+
+class StatsBook:
+    """
+    Statistics and Elo ratings of the questions in the pool, and the rating
+    index the adaptive mode picks from. Stats of questions that left the pool
+    are kept (and saved), so they are back if the question is downloaded again.
+    """
+
+    def __init__(self):
+        self.stats = {}  # {question_id: QuestionStats}
+        self.saved = {}  # {question key: QuestionStats} - loaded stats not attached to a question
+        self.question_ids = {}  # {question key: question_id} of the attached questions
+        self.index = RatingIndex()
+
+    def attach(self, question_id, question):
+        """
+        Starts tracking a question of the pool, with its saved stats if there are any
+        """
+        self.detach(question_id)
+        key = question_key(question["question"])
+        stats = self.saved.pop(key, None)
+        if stats is None:
+            stats = QuestionStats(key, DIFFICULTY_RATINGS.get(question.get("difficulty"), DEFAULT_RATING))
+        self.stats[question_id] = stats
+        self.question_ids[key] = question_id
+        self.index.set(question_id, stats.rating)
+
+    def detach(self, question_id):
+        stats = self.stats.pop(question_id, None)
+        if stats is not None:
+            self.saved[stats.key] = stats
+            if self.question_ids.get(stats.key) == question_id:
+                del self.question_ids[stats.key]
+            self.index.remove(question_id)
+
+    def find(self, question_text):
+        """
+        Returns: the ID of the attached question with this text, or None
+        """
+        return self.question_ids.get(question_key(question_text))
+
+    def rebuild(self, questions):
+        for question_id in list(self.stats):
+            self.detach(question_id)
+        for question_id, question in questions.items():
+            self.attach(question_id, question)
+
+    def record_answer(self, question_id, player_rating, correct, seconds):
+        """
+        Adds an answer to the question's stats and moves both ratings.
+        Returns: the player's new rating
+        """
+        stats = self.stats[question_id]
+        stats.attempts += 1
+        stats.correct += correct
+        stats.answer_time += seconds
+
+        change = (int(correct) - expected_score(player_rating, stats.rating))
+        stats.rating -= QUESTION_K * change
+        self.index.set(question_id, stats.rating)
+        return player_rating + PLAYER_K * change
+
+    def random_question(self, player_rating, exclude=()):
+        """
+        Returns: the ID of a question the player answers correctly with about TARGET_SUCCESS
+        chance, skipping the excluded IDs, or None if every question is excluded
+        """
+        return self.index.random_question(target_rating(player_rating), exclude)
+
+    def pack(self):
+        """
+        Returns: the stats of all questions ever answered, in the stats file format (bytes)
+        """
+        answered = [stats for stats in list(self.stats.values()) + list(self.saved.values()) if stats.attempts]
+        records = [RECORD.pack(s.key, s.attempts, s.correct, s.answer_time, s.rating) for s in answered]
+        return HEADER.pack(FILE_MAGIC, len(records)) + b"".join(records)
+
+    def unpack(self, data):
+        """
+        Loads stats in the stats file format. Call before attaching the questions.
+        Raises ValueError if the data is invalid
+        """
+        if len(data) < HEADER.size:
+            raise ValueError("Stats file too short")
+        magic, count = HEADER.unpack_from(data)
+        if magic != FILE_MAGIC or len(data) != HEADER.size + count * RECORD.size:
+            raise ValueError("Not a question stats file")
+        for key, attempts, correct, answer_time, rating in RECORD.iter_unpack(data[HEADER.size:]):
+            self.saved[key] = QuestionStats(key, rating, attempts, correct, answer_time)
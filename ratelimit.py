@@ -0,0 +1,67 @@
+##############################################################################
+# ratelimit.py
+##############################################################################
+
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: refills at 'rate' tokens per second up to 'capacity'.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+
+    def consume(self, tokens=1, now=None):
+        """
+        Takes tokens from the bucket if there are enough of them.
+        Returns: True if the tokens were taken, False if the caller is over its limit
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+class SessionRateLimiter:
+    """
+    Rate limits of a single connection: one bucket shared by every command,
+    plus an extra bucket for each command listed in command_limits.
+    """
+
+    def __init__(self, session_limit, command_limits):
+        """
+        :param session_limit: (rate, capacity) for the whole session
+        :param command_limits: {command name: (rate, capacity)}
+        """
+        self.command_limits = command_limits
+        self.session_bucket = TokenBucket(*session_limit)
+        self.command_buckets = {}  # Created lazily, most sessions never use every command
+
+    def allow(self, cmd, now=None):
+        """
+        Checks a command against the session bucket and its own bucket (if it has one).
+        Returns: True if the command may run, False if it should be rejected
+        """
+        now = time.monotonic() if now is None else now
+        if not self.session_bucket.consume(now=now):
+            return False
+
+        limit = self.command_limits.get(cmd)
+        if limit is None:
+            return True
+
+        bucket = self.command_buckets.get(cmd)
+        if bucket is None:
+            bucket = self.command_buckets[cmd] = TokenBucket(*limit)
+        return bucket.consume(now=now)
@@ -0,0 +1,83 @@
+import socket
+
+import chatlib
+import ratelimit
+import server
+from checks import check
+
+
+def bucket_checks():
+    bucket = ratelimit.TokenBucket(rate=2, capacity=4)
+    now = bucket.last_refill
+    check("burst up to the capacity", [bucket.consume(now=now) for _ in range(5)], [True] * 4 + [False])
+    check("refill at the rate", [bucket.consume(now=now + 0.5), bucket.consume(now=now + 0.5)], [True, False])
+    check("refill capped at the capacity", [bucket.consume(now=now + 100) for _ in range(5)], [True] * 4 + [False])
+    check("several tokens at once", (bucket.consume(3, now=now + 101), bucket.consume(2, now=now + 101)), (False, True))
+
+
+def limiter_checks():
+    limiter = ratelimit.SessionRateLimiter((10, 5), {"LOGIN": (1, 2)})
+    now = limiter.session_bucket.last_refill
+    check("per-command burst", [limiter.allow("LOGIN", now) for _ in range(3)], [True, True, False])
+    check("other commands share the session bucket", [limiter.allow("MY_SCORE", now) for _ in range(3)],
+          [True, True, False])
+    check("session bucket refills", limiter.allow("MY_SCORE", now + 1), True)
+    check("command bucket refills slower", (limiter.allow("LOGIN", now + 1.5), limiter.allow("LOGIN", now + 1.5)),
+          (True, False))
+
+
+def flow_control_checks():
+    conn, peer = socket.socketpair()
+    conn.setblocking(False)
+    peer.setblocking(False)
+    server.server_control["ready"] = True
+    server.connections[conn] = server.new_connection_state(conn, ("test", 1))
+    try:
+        # Replies the client does not read pile up until its requests are no longer read
+        reply = "x" * (chatlib.MAX_DATA_LENGTH // 2)
+        while not server.is_paused(conn):
+            server.build_and_send_message(conn, "ERROR", reply)
+        check("paused above MAX_OUTPUT_BYTES", server.connections[conn]["outbox_bytes"] > server.MAX_OUTPUT_BYTES, True)
+
+        request = chatlib.build_message(chatlib.PROTOCOL_CLIENT["my_score_msg"], "")
+        server.connections[conn]["inbox"] = request
+        server.process_inbox(conn)
+        check("requests wait while paused", server.connections[conn]["inbox"], request)
+
+        # Once the client reads, the queue drains and the waiting request is handled
+        while server.connections[conn]["outbox"]:
+            server.send_pending(conn)
+            try:
+                while peer.recv(65536):
+                    pass
+            except BlockingIOError:
+                pass
+        check("resumed once drained", server.is_paused(conn), False)
+        server.process_inbox(conn)
+        check("waiting request handled", server.connections[conn]["inbox"], "")
+
+        # A client that keeps not reading is dropped at the hard limit
+        while server.connections[conn]["outbox_bytes"] <= server.OUTPUT_HARD_LIMIT:
+            server.build_and_send_message(conn, "ERROR", reply)
+        check("dropped above OUTPUT_HARD_LIMIT", conn in server.sockets_to_close, True)
+    finally:
+        server.connections.pop(conn, None)
+        server.sockets_to_close.discard(conn)
+        conn.close()
+        peer.close()
+
+
+def main():
+
+    # TOKEN BUCKET
+    bucket_checks()
+
+    # SESSION LIMITER
+    limiter_checks()
+
+    # OUTPUT FLOW CONTROL
+    flow_control_checks()
+
+
+if __name__ == '__main__':
+    main()
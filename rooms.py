@@ -0,0 +1,165 @@
+##############################################################################
+# rooms.py
+##############################################################################
+
+import heapq
+import itertools
+import time
+
+
+ROOM_ROUNDS = 5  # Questions per match
+ANSWER_TIME = 15.0  # Seconds players have to answer each question
+RESULT_PAUSE = 3.0  # Seconds between a round's results and the next question
+MAX_ROUND_POINTS = 10  # Points for an instant correct answer, decays linearly to 1 at the deadline
+
+# Room states
+WAITING = "waiting"  # Members can join, the owner can start a match
+QUESTION = "question"  # A question is open for answers
+RESULTS = "results"  # Between two rounds
+
+
+def round_points(elapsed, answer_time=ANSWER_TIME):
+    """
+    Time-weighted score of a correct answer.
+    Returns: int between 1 and MAX_ROUND_POINTS
+    """
+    remaining = max(0.0, 1.0 - elapsed / answer_time)
+    return max(1, round(MAX_ROUND_POINTS * remaining))
+
+
+class Room:
+    """
+    A live match. Every member gets the same question at the same time and
+    earns more points the faster it answers correctly.
+    Sockets are stored as opaque values, the server does all of the I/O.
+    """
+
+    def __init__(self, name, owner, owner_conn, rounds=ROOM_ROUNDS, answer_time=ANSWER_TIME):
+        self.name = name
+        self.owner = owner
+        self.members = {owner: owner_conn}  # {username: socket}
+        self.rounds = rounds
+        self.answer_time = answer_time
+        self.state = WAITING
+        self.round_no = 0
+        self.scores = {}  # {username: points in the current match}
+        self.used_questions = set()
+        self.question_id = None
+        self.correct = None
+        self.asked_at = None
+        self.deadline = None  # When the current question closes or the next round starts
+        self.answers = {}  # {username: (answer, seconds after the question was sent)}
+
+    def add_member(self, username, conn):
+        self.members[username] = conn
+
+    def remove_member(self, username):
+        """
+        Removes a member, handing the room to another member if the owner leaves.
+        Returns: True if the room is now empty
+        """
+        self.members.pop(username, None)
+        self.answers.pop(username, None)
+        if username == self.owner and self.members:
+            self.owner = next(iter(self.members))
+        return not self.members
+
+    def start_match(self):
+        self.round_no = 0
+        self.scores = {username: 0 for username in self.members}
+        self.used_questions = set()
+
+    def open_question(self, question_id, correct, now):
+        self.state = QUESTION
+        self.round_no += 1
+        self.question_id = question_id
+        self.correct = correct
+        self.used_questions.add(question_id)
+        self.answers = {}
+        self.asked_at = now
+        self.deadline = now + self.answer_time
+
+    def submit_answer(self, username, question_id, answer, now):
+        """
+        Records a member's answer to the open question.
+        Returns: None if accepted, otherwise an error description (str)
+        """
+        if self.state != QUESTION or question_id != self.question_id:
+            return "This question is not open"
+        if username in self.answers:
+            return "You already answered this question"
+        if now > self.deadline:
+            return "Too late"
+        self.answers[username] = (answer, now - self.asked_at)
+        return None
+
+    def everyone_answered(self):
+        return all(username in self.answers for username in self.members)
+
+    def close_question(self, now):
+        """
+        Scores the open question and moves to the results pause.
+        Returns: {username: points earned this round} for every current member
+        """
+        earned = {}
+        for username in self.members:
+            answer, elapsed = self.answers.get(username, (None, None))
+            points = round_points(elapsed, self.answer_time) if answer == self.correct else 0
+            earned[username] = points
+            self.scores[username] = self.scores.get(username, 0) + points
+
+        self.state = RESULTS
+        self.deadline = now + RESULT_PAUSE
+        return earned
+
+    def is_last_round(self):
+        return self.round_no >= self.rounds
+
+    def finish_match(self):
+        self.state = WAITING
+        self.deadline = None
+        self.question_id = None
+        self.answers = {}
+
+    def standings(self):
+        """
+        Returns: list of (username, points) of the current match, best first
+        """
+        return sorted(self.scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class RoomScheduler:
+    """
+    Min-heap of room deadlines. Entries are not removed when a deadline
+    changes, stale ones are skipped when they come up.
+    """
+
+    def __init__(self):
+        self.timers = []  # [(deadline, sequence, room)]
+        self.sequence = itertools.count()
+
+    def schedule(self, room):
+        heapq.heappush(self.timers, (room.deadline, next(self.sequence), room))
+
+    def timeout(self, now=None):
+        """
+        Returns: seconds until the next deadline (for select), or None if there is none
+        """
+        now = time.monotonic() if now is None else now
+        while self.timers and self.timers[0][2].deadline != self.timers[0][0]:
+            heapq.heappop(self.timers)  # Stale entry
+        if not self.timers:
+            return None
+        return max(0.0, self.timers[0][0] - now)
+
+    def due_rooms(self, now=None):
+        """
+        Pops and returns the rooms whose deadline has passed
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        while self.timers and self.timers[0][0] <= now:
+            deadline, _, room = heapq.heappop(self.timers)
+            if room.deadline == deadline:
+                due.append(room)
+        return due
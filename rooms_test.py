@@ -0,0 +1,77 @@
+import rooms
+from checks import check
+
+
+def points_checks():
+    check("instant answer", rooms.round_points(0, 10), rooms.MAX_ROUND_POINTS)
+    check("half the time", rooms.round_points(5, 10), rooms.MAX_ROUND_POINTS // 2)
+    check("at the deadline", rooms.round_points(10, 10), 1)
+    check("after the deadline", rooms.round_points(12, 10), 1)
+
+
+def room_checks():
+    room = rooms.Room("r", "alice", "conn-a", rounds=2, answer_time=10)
+    room.add_member("bob", "conn-b")
+    room.add_member("carol", "conn-c")
+    room.start_match()
+    check("answer before a question", room.submit_answer("alice", 1, "2", 0) is None, False)
+
+    room.open_question(1, "2", 100)
+    check("wrong question", room.submit_answer("alice", 7, "2", 100) is None, False)
+    check("answer accepted", room.submit_answer("alice", 1, "2", 100), None)
+    check("second answer", room.submit_answer("alice", 1, "3", 101) is None, False)
+    check("wrong answer accepted", room.submit_answer("bob", 1, "3", 101), None)
+    check("not everyone answered", room.everyone_answered(), False)
+    check("too late", room.submit_answer("carol", 1, "2", 110.5) is None, False)
+
+    earned = room.close_question(111)
+    check("round points", earned, {"alice": rooms.MAX_ROUND_POINTS, "bob": 0, "carol": 0})
+    check("results pause", (room.state, room.deadline), (rooms.RESULTS, 111 + rooms.RESULT_PAUSE))
+    check("answer after close", room.submit_answer("carol", 1, "2", 111) is None, False)
+
+    room.open_question(2, "1", 120)
+    room.submit_answer("bob", 2, "1", 125)
+    room.close_question(130)
+    check("standings", room.standings(), [("alice", 10), ("bob", 5), ("carol", 0)])
+    check("last round", room.is_last_round(), True)
+
+    check("owner leaves", (room.remove_member("alice"), room.owner), (False, "bob"))
+    room.remove_member("bob")
+    check("last member leaves", room.remove_member("carol"), True)
+
+
+def scheduler_checks():
+    scheduler = rooms.RoomScheduler()
+    first = rooms.Room("first", "alice", "conn-a")
+    second = rooms.Room("second", "bob", "conn-b")
+    first.deadline = 10
+    scheduler.schedule(first)
+    second.deadline = 20
+    scheduler.schedule(second)
+    check("timeout until the first deadline", scheduler.timeout(4), 6)
+
+    # Moving a deadline leaves the old entry behind as stale
+    first.deadline = 30
+    scheduler.schedule(first)
+    check("stale entry skipped by timeout", scheduler.timeout(4), 16)
+    check("nothing due yet", scheduler.due_rooms(15), [])
+    check("due room", scheduler.due_rooms(25), [second])
+    first.deadline = None
+    check("stale entry skipped by due_rooms", scheduler.due_rooms(35), [])
+    check("no deadlines left", scheduler.timeout(35), None)
+
+
+def main():
+
+    # POINTS
+    points_checks()
+
+    # ROOM
+    room_checks()
+
+    # SCHEDULER
+    scheduler_checks()
+
+
+if __name__ == '__main__':
+    main()
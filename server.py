@@ -4,95 +4,447 @@
 
 import socket
 import select
+import argparse
 import random
+import os
+import sys
+import time
+import signal
+import importlib
+import codecs
+import heapq
+import itertools
+from collections import deque
 import chatlib
-import requests as r
-import html
+import auth
+import offload
+import ratelimit
+import rooms
+import events
+import sharding
+import questionindex
+import questionstats
+import eventlog
+import interning
+import admin
 
 
 # GLOBALS
-users = {}  # {user_name: {"password": , "score": , "questions_asked": []}}
-questions = {}  # {qustion_key: ["question", "answer1", "answer2", "answer2", "answer4", "num_correct_answer"]}
+users = {}  # {user_name: {"password": , "score": , "questions_asked": set of question IDs, "rating": Elo rating}}
+questions = {}  # {question_id: {"question": , "answers": [4 answers], "correct": 1-4, "category": , "difficulty": }}
+question_strings = interning.InternTable()  # Canonical question texts, answers, categories and question IDs
+question_index = questionindex.QuestionIndex()  # Category and difficulty indexes of questions, kept in step with it
+question_stats = questionstats.StatsBook()  # Answer statistics and ratings of questions, kept in step with it
 logged_users = {}  # a dictionary of client hostnames to usernames - will be used later
-messages_to_send  = []
+connections = {}  # {socket: per-connection state, see new_connection_state()}
+sockets_to_close = set()  # Sockets to disconnect at the end of the current loop iteration
+deferred_replies = {}  # {socket: what it waits for} - replies being computed by offloader jobs
+login_throttle = auth.LoginThrottle()
+offloader = offload.Offloader()
+user_save_state = {"in_flight": False, "dirty": False}
+stats_save_state = {"in_flight": False, "last_started": None}
+snapshot_waiters = []  # Admin sockets waiting for a snapshot, which waits for the running saves
+question_fetch = {"in_flight": False, "waiters": [], "last_finished": None}  # waiters: [(socket, username, filter data)]
+game_rooms = {}  # {room name: rooms.Room}
+user_rooms = {}  # {username: room name}
+room_scheduler = rooms.RoomScheduler()
+subscribers = set()  # Sockets that receive EVENTS pushes
+pending_events = events.EventCoalescer()
+tls_context = None  # ssl.SSLContext when the server was started with a certificate
+tls_retry_errors = ()  # ssl.SSLWantReadError and ssl.SSLWantWriteError with TLS, see setup_tls()
+users_file = "users.txt"  # Each shard keeps its own users file
+stats_file = "question_stats.bin"  # And its own question statistics
+questions_file = "questions.txt"  # And its own questions file
+event_log = None  # eventlog.EventLog when the server was started with --event-log
+admin_connections = {}  # {socket: {"inbox": bytes received, "outbox": bytes to send}} of the admin channel
+question_import = {"file": None, "conn": None, "lines": 0, "added": 0}  # Running admin bulk question import
+shard_ring = None  # sharding.HashRing of every node when this server is one shard of several
+shard_name = None  # "host:port" of this node on shard_ring
+shard_secret = None  # Shared by all the shards, SHARD_TOP is only answered when it comes with it
+peer_tls_context = None  # Used to reach the other shards when they serve TLS
+global_highscore = {
+    "in_flight": False,
+    "waiters": [],  # Sockets waiting for the merged table
+    "peers_left": 0,  # Shards that did not answer yet
+    "lists": [],  # Top lists received from the other shards
+    "scores": None,  # Last merged table, list of (username, score)
+    "fetched_at": None,
+}
+server_control = {
+    "mode": None,  # None while serving, "shutdown" or "upgrade" while draining
+    "drain_deadline": None,
+    "persisted": False,  # Data was saved (and the successor started) during the drain
+    "reload": False,  # A SIGHUP asked for a hot reload
+    "ready": False,  # Users and questions are loaded (see start_loading()), client requests are read
+    "started_at": None,  # time.monotonic() when main() started
+}
 
 ERROR_MSG = "Error!"
 SERVER_PORT = 5678
 SERVER_IP = "127.0.0.1"
+MAX_DEFERRED_REPLIES = 64  # Offloaded requests allowed in flight before LOGIN is refused
+WEB_TIMEOUT = 10  # Seconds
+DRAIN_TIMEOUT = 15  # Seconds a shutdown waits for pending work and unsent replies
+LISTEN_FD_ENV = "TRIVIA_LISTEN_FD"  # Passes the listening socket to the successor process
+SHARD_SECRET_ENV = "TRIVIA_SHARD_SECRET"  # Default of --shard-secret, keeps it off the command line
+RELOADABLE_MODULES = (chatlib, auth, ratelimit, rooms, events)  # Reloaded on SIGHUP
+MAX_PREFETCH = 5  # Most questions a single GET_QUESTIONS may return
+QUESTION_FETCH_COOLDOWN = 60  # Seconds between two web fetches triggered by players running out of questions
+HIGHSCORE_TOP_K = 100  # Entries of the merged high-score table when sharded
+HIGHSCORE_CACHE_TTL = 2  # Seconds a merged high-score table is reused before the shards are asked again
+STATS_SAVE_INTERVAL = 30  # Seconds between two saves of the question statistics (they are saved at shutdown too)
+RECV_BUFFER_SIZE = 4096
+QUESTION_IMPORT_CHUNK = 1000  # Lines of a bulk question import parsed and added per loop iteration
+
+# Flow control: when a client does not read its replies, stop reading its requests
+# ("pause") or drop it ("disconnect"). Above OUTPUT_HARD_LIMIT it is always dropped.
+MAX_OUTPUT_BYTES = 64 * 1024
+OUTPUT_HARD_LIMIT = 256 * 1024
+OUTPUT_LIMIT_POLICY = "pause"
+
+# Rate limits as (tokens per second, burst size)
+SESSION_RATE_LIMIT = (20, 40)
+COMMAND_RATE_LIMITS = {
+    chatlib.PROTOCOL_CLIENT["login_msg"]: (1, 5),
+    chatlib.PROTOCOL_CLIENT["get_question_msg"]: (2, 5),
+    chatlib.PROTOCOL_CLIENT["get_questions_msg"]: (2, 5),
+    chatlib.PROTOCOL_CLIENT["highscore_msg"]: (1, 3),
+    chatlib.PROTOCOL_CLIENT["logged_msg"]: (1, 3),
+    chatlib.PROTOCOL_CLIENT["shard_top_msg"]: (5, 10),
+}
 
 
 # HELPER SOCKET METHODS
 
 def print_client_sockets(client_sockets):
     for c in client_sockets:
-        print("\t", c.getpeername())
+        print("\t", get_address(c))
+
+
+def new_connection_state(conn, address):
+    """
+    Creates the state kept for every connected client
+    Parameters: conn (socket object), address (tuple)
+    Returns: dict
+    """
+    return {
+        "address": address,
+        "inbox": "",  # Received text not parsed yet
+        "decoder": codecs.getincrementaldecoder("utf-8")(),
+        "outbox": deque(),  # Encoded frames waiting to be sent
+        "outbox_bytes": 0,
+        "limiter": ratelimit.SessionRateLimiter(SESSION_RATE_LIMIT, COMMAND_RATE_LIMITS),
+        "compress": False,  # Set by the COMPRESSION command
+        "handshake_deadline": None,  # Set while a TLS handshake is running
+        "handshake_wants_write": False,
+        "served_questions": {},  # {question_id: time sent} - sent to the client but not answered yet
+    }
+
+
+def get_address(conn):
+    """
+    Returns the peer address of a client socket, also after it was closed
+    """
+    state = connections.get(conn)
+    if state is not None:
+        return state["address"]
+    try:
+        return conn.getpeername()
+    except OSError:
+        return None
+
+
+def wants_compression(conn):
+    state = connections.get(conn)
+    return state is not None and state["compress"]
 
 
 def build_and_send_message(conn, code, msg):
     """
-    Builds a new message using chatlib, wanted code and message. 
-    Prints debug info, then sends it to the given socket.
+    Builds a new message using chatlib, wanted code and message
+    (compressed if the client negotiated it and the data is large).
+    Prints debug info, then queues it for sending to the given socket.
     Parameters: conn (socket object), code (str), data (str)
-    Returns: Nothing
+    Returns: True if the message was queued, False if it could not be built
     """
-    global messages_to_send
-    
     # Build the message using chatlib
-    full_msg = chatlib.build_message(code, msg)
+    full_msg = chatlib.build_message(code, msg, wants_compression(conn))
 
     # Check if the message was successfully built
     if full_msg is chatlib.ERROR_RETURN:
         print("Failed to build message. Exiting function.")
-        return
+        return False
 
     # Debug print
     print("[SERVER] ", full_msg) 
     
-    messages_to_send.append((conn, full_msg))    
+    queue_frame(conn, full_msg.encode())
+    return True
+
+
+def build_and_send_lines(conn, code, lines, separator="\n"):
+    """
+    Sends a list (e.g. the high-score table) as one message. If it is too long even
+    compressed, only as many leading lines as fit are sent.
+    Parameters: conn (socket object), code (str), lines (list of str), separator (str)
+    Returns: Nothing
+    """
+    while not build_and_send_message(conn, code, separator.join(lines)) and lines:
+        lines = lines[:len(lines) // 2]
+
+
+def broadcast_message(conns, code, msg):
+    """
+    Builds a message once and queues the same encoded frame to every given socket.
+    Clients that negotiated compression share a second, compressed frame.
+    Parameters: conns (iterable of sockets), code (str), data (str)
+    Returns: Nothing
+    """
+    frames = {}  # {compress: encoded frame}
+    for conn in conns:
+        compress = wants_compression(conn)
+        if compress not in frames:
+            full_msg = chatlib.build_message(code, msg, compress)
+            if full_msg is chatlib.ERROR_RETURN:
+                print("Failed to build message. Exiting function.")
+                return
+            # Debug print
+            print("[BROADCAST] ", full_msg)
+            frames[compress] = full_msg.encode()
+        queue_frame(conn, frames[compress])
+
+
+def queue_frame(conn, frame):
+    """
+    Appends an encoded frame to the connection's output queue, enforcing the output limits.
+    Parameters: conn (socket object), frame (bytes)
+    Returns: Nothing
+    """
+    state = connections.get(conn)
+    if state is None or conn in sockets_to_close:
+        return
+
+    state["outbox"].append(frame)
+    state["outbox_bytes"] += len(frame)
+
+    if state["outbox_bytes"] > OUTPUT_HARD_LIMIT or \
+            (OUTPUT_LIMIT_POLICY == "disconnect" and state["outbox_bytes"] > MAX_OUTPUT_BYTES):
+        print(f"Client {state['address']} is not reading its replies, disconnecting")
+        sockets_to_close.add(conn)
+
+
+def is_paused(conn):
+    """
+    Returns True while the client has too many unsent bytes for us to read more requests
+    """
+    return connections[conn]["outbox_bytes"] > MAX_OUTPUT_BYTES
 
 
-def recv_message_and_parse(conn):
+def send_pending(conn):
+    """
+    Sends as much of the connection's output queue as the socket accepts without blocking.
+    Parameters: conn (socket object)
+    Returns: Nothing. Raises OSError if the connection is broken
+    """
+    state = connections[conn]
+    outbox = state["outbox"]
+    while outbox:
+        frame = outbox[0]
+        try:
+            sent = conn.send(frame)
+        except BlockingIOError:
+            return
+        except tls_retry_errors:
+            return  # A TLS write must be retried with the same frame, which stays first in the queue
+        state["outbox_bytes"] -= sent
+        if sent < len(frame):
+            # Keep the unsent tail without copying it
+            outbox[0] = memoryview(frame)[sent:]
+            return
+        outbox.popleft()
+
+
+def recv_into_inbox(conn):
     """
-    Receives a new message from the given socket,
-    then parses the message using chatlib.
+    Receives available data from the given socket and appends it to the connection's inbox.
     Parameters: conn (socket object)
-    Returns: cmd (str) and data (str) of the received message.
-    If an error occurs, returns chatlib.ERROR_RETURN, chatlib.ERROR_RETURN.
+    Returns: True if data was received, False if the connection was closed
     """
     try:
-        # Receive data from the socket
-        full_msg = conn.recv(10021).decode()
-        
-        # If the connection is closed or empty message received
-        if not full_msg:
-            print("Connection closed or empty message received")
-            return chatlib.ERROR_RETURN, chatlib.ERROR_RETURN
+        data = conn.recv(RECV_BUFFER_SIZE)
+        if tls_context is not None:
+            # select does not see data already decrypted by ssl, read the whole record
+            while data and conn.pending():
+                data += conn.recv(conn.pending())
+    except tls_retry_errors:
+        return True  # Only part of a TLS record (or a TLS control message) arrived
+    if not data:
+        print("Connection closed or empty message received")
+        return False
+
+    state = connections[conn]
+    try:
+        state["inbox"] += state["decoder"].decode(data)
+    except UnicodeDecodeError:
+        # Not our protocol (e.g. a TLS client talking to a plain server)
+        print(f"Invalid UTF-8 data from {state['address']}")
+        return False
+    return True
+
+
+def accept_client(server_socket):
+    """
+    Accepts a new client. With TLS the handshake is only started here,
+    advance_handshake() continues it whenever the socket is ready.
+    Returns: the client socket (ssl.SSLSocket with TLS)
+    """
+    client_socket, client_address = server_socket.accept()
+    client_socket.setblocking(False)
+    if tls_context is not None:
+        client_socket = tls_context.wrap_socket(client_socket, server_side=True, do_handshake_on_connect=False)
+    connections[client_socket] = new_connection_state(client_socket, client_address)
+    if tls_context is not None:
+        import tls  # Already imported by setup_tls()
+        connections[client_socket]["handshake_deadline"] = time.monotonic() + tls.HANDSHAKE_TIMEOUT
+    return client_socket
+
+
+def is_handshaking(conn):
+    return connections[conn]["handshake_deadline"] is not None
+
+
+def advance_handshake(conn):
+    """
+    Continues a client's TLS handshake without blocking. When it is done, data the
+    client sent right after its last handshake message is read at once, select
+    would not report it because ssl already took it off the socket.
+    Parameters: conn (ssl.SSLSocket)
+    Returns: Nothing
+    """
+    import ssl  # Already imported by setup_tls()
+
+    state = connections[conn]
+    try:
+        conn.do_handshake()
+    except ssl.SSLWantReadError:
+        state["handshake_wants_write"] = False
+        return
+    except ssl.SSLWantWriteError:
+        state["handshake_wants_write"] = True
+        return
+    except OSError as e:  # ssl.SSLError included
+        print(f"TLS handshake with {state['address']} failed: {e}")
+        sockets_to_close.add(conn)
+        return
+
+    state["handshake_deadline"] = None
+    state["handshake_wants_write"] = False
+    print(f"TLS handshake with {state['address']} done: {conn.version()}, "
+          f"{'resumed session' if conn.session_reused else 'full handshake'}")
+    try:
+        if not recv_into_inbox(conn):
+            sockets_to_close.add(conn)
+    except OSError as e:
+        print(f"Client {state['address']} disconnected abruptly: {e}")
+        sockets_to_close.add(conn)
+
 
-        # Parse the message using chatlib
-        cmd, data = chatlib.parse_message(full_msg)
+def expire_handshakes(client_sockets):
+    """
+    Marks clients that did not finish their TLS handshake in time for closing
+    Returns: seconds until the next handshake deadline (for select), or None if there is none
+    """
+    now = time.monotonic()
+    deadlines = []
+    for conn in client_sockets:
+        deadline = connections[conn]["handshake_deadline"]
+        if deadline is None or conn in sockets_to_close:
+            continue
+        if deadline <= now:
+            print(f"TLS handshake with {get_address(conn)} timed out")
+            sockets_to_close.add(conn)
+        deadlines.append(max(0.0, deadline - now))  # 0 lets select return, so the socket is closed right away
+    return min(deadlines) if deadlines else None
+
+
+def process_inbox(conn):
+    """
+    Parses and handles the complete messages waiting in the connection's inbox.
+    Stops early while a reply is deferred or the client's output queue is full,
+    the rest of the inbox is handled on a later loop iteration.
+    Nothing is handled before the startup load is done: a finished TLS handshake
+    may already have read the client's first request into the inbox.
+    Parameters: conn (socket object)
+    Returns: Nothing
+    """
+    if not server_control["ready"]:
+        return
+    state = connections.get(conn)
+    while state is not None and state["inbox"] and conn not in sockets_to_close:
+        if conn in deferred_replies or is_paused(conn):
+            return
+
+        full_msg, state["inbox"] = chatlib.split_message(state["inbox"])
+        if state["inbox"] is chatlib.ERROR_RETURN:
+            print(f"Invalid message header from {state['address']}")
+            state["inbox"] = ""
+            sockets_to_close.add(conn)
+            return
+        if full_msg is chatlib.ERROR_RETURN:
+            return  # Only part of a message arrived so far
 
         # Debug print
-        print("[CLIENT] ", full_msg)  
+        print("[CLIENT] ", full_msg)
 
-        # Check if parsing failed
-        if cmd is chatlib.ERROR_RETURN and data is chatlib.ERROR_RETURN:
-            print("Failed to parse message")
-            return chatlib.ERROR_RETURN, chatlib.ERROR_RETURN
-        
-        return cmd, data
+        cmd, data = chatlib.parse_message(full_msg, allow_compressed=state["compress"])
+        if cmd is chatlib.ERROR_RETURN:
+            send_error(conn, "Failed to parse message")
+            continue
 
-    except Exception as e:
-        print(f"Error receiving or parsing message: {e}")
-        return chatlib.ERROR_RETURN, chatlib.ERROR_RETURN	
+        # If the client logs out
+        if cmd == chatlib.PROTOCOL_CLIENT["logout_msg"]:
+            sockets_to_close.add(conn)
+            return
+
+        if not state["limiter"].allow(cmd):
+            send_error(conn, "Rate limit exceeded, slow down")
+            continue
+
+        # Route the message to the appropriate handler
+        handle_client_message(conn, cmd, data)
+
+
+def disconnect_client(conn, client_sockets):
+    """
+    Logs the client out, closes its socket and drops all of its state.
+    Parameters: conn (socket object), client_sockets (list)
+    Returns: Nothing
+    """
+    handle_logout_message(conn)
+    connections.pop(conn, None)
+    sockets_to_close.discard(conn)
+    if conn in client_sockets:
+        client_sockets.remove(conn)
+    print(f"Total clients: {len(client_sockets)}")
+    print_client_sockets(client_sockets)
 
 
 # Data Loaders #
 
 def load_questions_from_web():
+    """
+    Downloads questions from the Open Trivia DB. Texts, answers and IDs are interned in question_strings.
+    Returns: dictionary of questions
+    """
+    # Imported here, not at startup: only the background loaders need them (see start_loading())
+    import html
+    import requests as r
+
+    strings = question_strings
     questions = {}
     
     try:
-        response = r.get("https://opentdb.com/api.php?amount=50&type=multiple")
+        response = r.get("https://opentdb.com/api.php?amount=50&type=multiple", timeout=WEB_TIMEOUT)
         response.raise_for_status()  # Will raise an HTTPError for bad responses
 
         data = response.json()  # This already returns a dictionary (or list)
@@ -104,9 +456,9 @@ def load_questions_from_web():
 
         for question_no, question in enumerate(data["results"], start=1):
             # Decode HTML entities in questions and answers
-            question_text = html.unescape(question["question"])
-            correct_answer = html.unescape(question["correct_answer"])
-            incorrect_answers = [html.unescape(ans) for ans in question["incorrect_answers"]]
+            question_text = strings.intern(html.unescape(question["question"]))
+            correct_answer = strings.intern(html.unescape(question["correct_answer"]))
+            incorrect_answers = strings.intern_all(html.unescape(ans) for ans in question["incorrect_answers"])
 
             # Combine correct and incorrect answers, and shuffle them
             all_answers = incorrect_answers + [correct_answer]
@@ -116,10 +468,12 @@ def load_questions_from_web():
             correct_answer_index = all_answers.index(correct_answer) + 1  # Adding 1 to make it 1-based indexing
 
             # Store the question and answers in the desired format
-            questions[question_no] = {
+            questions[strings.intern(question_no)] = {
                 "question": question_text,
                 "answers": all_answers,
-                "correct": correct_answer_index  # 1-based index of the correct answer
+                "correct": correct_answer_index,  # 1-based index of the correct answer
+                "category": strings.intern(html.unescape(question.get("category", ""))),
+                "difficulty": strings.intern(question.get("difficulty", ""))
             }
         print("Question DB download was completed")
         
@@ -131,32 +485,71 @@ def load_questions_from_web():
     return questions
 
 
+def parse_question_line(line, line_no):
+    """
+    Parses one line of a questions file (see load_questions()).
+    Texts, answers and IDs are interned in question_strings.
+    Returns: (question_id, question), or None if the line is invalid
+    """
+    strings = question_strings
+
+    # Remove whitespace and split the line by '|'
+    parts = line.strip().split('|')
+    category = difficulty = ""
+    if len(parts) == 9 and parts[0].isdigit():
+        difficulty = parts.pop()
+        category = parts.pop()
+    if len(parts) == 7 and parts[0].isdigit():
+        question_id = int(parts.pop(0))
+    elif len(parts) == 6:
+        question_id = line_no
+    else:
+        return None
+
+    question, answer1, answer2, answer3, answer4, correct_answer = parts
+    if correct_answer not in ("1", "2", "3", "4"):
+        return None
+
+    # Every text as its canonical copy
+    return strings.intern(question_id), {
+        "question": strings.intern(question),
+        "answers": strings.intern_all([answer1, answer2, answer3, answer4]),
+        "correct": int(correct_answer),  # Convert the correct answer number to an integer
+        "category": strings.intern(category),
+        "difficulty": strings.intern(difficulty)
+    }
+
+
+def read_questions_file(file_path):
+    """
+    Reads a questions file (format: see load_questions()). Raises OSError if it cannot be read.
+    Returns: dictionary of questions
+    """
+    questions = {}
+    with open(file_path, 'r') as f:
+        for i, line in enumerate(f, start=1):
+            parsed = parse_question_line(line, i)
+            if parsed is None:
+                continue  # Skip invalid lines
+            question_id, question = parsed
+            questions[question_id] = question
+    return questions
+
+
 def load_questions(file_path='questions.txt'):
     """
     Loads game questions from a text file into the questions dictionary.
-    Format of each line in the text file:
-    question|answer1|answer2|answer3|answer4|correct_answer_number
+    Format of each line in the text file (as written by save_questions()):
+    question_id|question|answer1|answer2|answer3|answer4|correct_answer_number|category|difficulty
+    Lines without the category and difficulty fields are loaded without them,
+    lines without the question_id field as well get their line number as ID.
     
     :param file_path: path to the questions file
     :return: dictionary of questions
     """
     questions = {}
     try:
-        with open(file_path, 'r') as f:
-            for i, line in enumerate(f, start=1):
-                # Remove whitespace and split the line by '|'
-                parts = line.strip().split('|')
-                if len(parts) != 6:
-                    continue  # Skip invalid lines
-
-                question, answer1, answer2, answer3, answer4, correct_answer = parts
-                
-                # Store data in the questions dictionary
-                questions[i] = {
-                    "question": question,
-                    "answers": [answer1, answer2, answer3, answer4],
-                    "correct": int(correct_answer)  # Convert the correct answer number to an integer
-                }
+        questions = read_questions_file(file_path)
         
     except FileNotFoundError:
         print(f"File '{file_path}' not found. Creating new file with default questions...")
@@ -192,6 +585,23 @@ def load_questions(file_path='questions.txt'):
         
     return questions
 
+def format_questions(questions):
+    """
+    Converts the questions dictionary to the questions.txt text format (see load_questions()).
+    
+    Args:
+    questions (dict): Dictionary containing question data
+    Returns: str
+    """
+    lines = []
+    for q_id, data in questions.items():
+        # Join answers with '|' and write the line in the correct format
+        answers = "|".join(data["answers"])
+        lines.append(f"{q_id}|{data['question']}|{answers}|{data['correct']}|"
+                     f"{data.get('category', '')}|{data.get('difficulty', '')}\n")
+    return "".join(lines)
+
+
 def save_questions(questions, file_path='questions.txt'):
     """
     Saves the questions dictionary to a text file.
@@ -201,11 +611,7 @@ def save_questions(questions, file_path='questions.txt'):
     file_path (str): Path to the file where the data should be saved
     """
     try:
-        with open(file_path, "w") as file:
-            for q_id, data in questions.items():
-                # Join answers with '|' and write the line in the correct format
-                answers = "|".join(data["answers"])
-                file.write(f"{q_id}|{data['question']}|{answers}|{data['correct']}\n")
+        write_text_file(format_questions(questions), file_path)
     except Exception as e:
         print(f"Error saving questions file: {e}")
 
@@ -215,7 +621,10 @@ def load_user_database(file_path='users.txt'):
     """
     Loads user information from a text file into the users dictionary.
     Format of each line in the text file:
-    username|password|score|question_id1,question_id2,...
+    username|password|score|question_id1,question_id2,...|rating
+    The password field holds an auth.hash_password() hash. Legacy plaintext
+    entries are still accepted and get re-hashed on the user's next login.
+    Lines without the rating field get questionstats.DEFAULT_RATING.
     
     :param file_path: path to the users file
     :return: dictionary of users
@@ -226,73 +635,232 @@ def load_user_database(file_path='users.txt'):
             for line in f:
                 # Remove whitespace and split the line by '|'
                 parts = line.strip().split('|')
-                if len(parts) != 4:
+                if len(parts) == 4:
+                    parts.append(str(questionstats.DEFAULT_RATING))
+                if len(parts) != 5:
                     continue  # Skip invalid lines
 
-                username, password, score, questions_asked = parts
+                username, password, score, questions_asked, rating = parts
                 
-                # Parse questions_asked as a list
-                questions_asked_list = questions_asked.split(',') if questions_asked else []
+                # Parse questions_asked as a set
+                questions_asked_set = {question_strings.intern(int(q_id)) for q_id in questions_asked.split(',')
+                                       if q_id.isdigit()}
                 
                 # Store data in the users dictionary
                 users[username] = {
                     "password": password,
                     "score": int(score),  # Convert score to an integer
-                    "questions_asked": questions_asked_list  # Store the list of asked question IDs
+                    "questions_asked": questions_asked_set,  # Store the set of asked question IDs
+                    "rating": float(rating)
                 }
         
     except FileNotFoundError:
         print(f"File '{file_path}' not found. Creating new file with default users...")
         users = {
-            "test": {"password": "test", "score": 0, "questions_asked": []},
-            "yossi": {"password": "123", "score": 50, "questions_asked": []},
-            "master": {"password": "master", "score": 200, "questions_asked": []}
+            "test": {"password": auth.hash_password("test"), "score": 0, "questions_asked": set(),
+                     "rating": questionstats.DEFAULT_RATING},
+            "yossi": {"password": auth.hash_password("123"), "score": 50, "questions_asked": set(),
+                      "rating": questionstats.DEFAULT_RATING},
+            "master": {"password": auth.hash_password("master"), "score": 200, "questions_asked": set(),
+                       "rating": questionstats.DEFAULT_RATING}
             }
         # Save default users to file
-        save_user_database(users)
+        save_user_database(users, users_file)
     except Exception as e:
         print(f"Error loading users file: {e}")
                 
     return users
 
 
+def format_user_database(users):
+    """
+    Converts the users dictionary to the users.txt text format.
+    Cheap enough for the select loop, so a snapshot can be taken before writing it elsewhere.
+    
+    Args:
+    users (dict): Dictionary containing user data
+    Returns: str
+    """
+    lines = []
+    for username, data in users.items():
+        # Convert the questions_asked set to a comma-separated string
+        questions_asked_str = ','.join(str(q_id) for q_id in sorted(data['questions_asked']))
+        # Write the data in the format 'username|password|score|questions_asked|rating'
+        lines.append(f"{username}|{data['password']}|{data['score']}|{questions_asked_str}|{data['rating']:.1f}\n")
+    return "".join(lines)
+
+
+def write_file(data, file_path, mode):
+    """
+    Writes to a file atomically (through a temporary file), so a crash in the middle
+    of a save never leaves a truncated file behind. Every write gets a temporary file
+    of its own, so saves running at the same time cannot mix up their data.
+    Parameters: data (str or bytes), file_path (str), mode ("w" or "wb")
+    """
+    import tempfile  # Only needed for saves, not imported at startup
+
+    directory, name = os.path.split(file_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory or ".")
+    try:
+        with open(fd, mode) as file:
+            file.write(data)
+        try:
+            os.chmod(tmp_path, os.stat(file_path).st_mode & 0o777)  # mkstemp() creates it owner-only
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_text_file(text, file_path):
+    """
+    Writes text to a file atomically, see write_file()
+    """
+    write_file(text, file_path, "w")
+
+
 def save_user_database(users, file_path='users.txt'):
     """
-    Saves the users dictionary to a text file.
+    Saves the users dictionary to a text file. Blocks - in the select loop use schedule_user_save().
     
     Args:
     users (dict): Dictionary containing user data
     file_path (str): Path to the file where the data should be saved
     """
     try:
-        with open(file_path, "w") as file:
-            for username, data in users.items():
-                # Convert the questions_asked list to a comma-separated string
-                questions_asked_str = ','.join(data['questions_asked']) if data['questions_asked'] else ''
-                # Write the data in the format 'username|password|score|questions_asked'
-                file.write(f"{username}|{data['password']}|{data['score']}|{questions_asked_str}\n")
+        write_text_file(format_user_database(users), file_path)
     except Exception as e:
         print(f"Error saving users file: {e}")
 
 
+def schedule_user_save():
+    """
+    Saves the users dictionary in the background. The snapshot is taken on the loop thread,
+    only the file write is offloaded. Saves requested while one is running are merged into
+    a single follow-up save.
+    """
+    if user_save_state["in_flight"]:
+        user_save_state["dirty"] = True
+        return
+
+    user_save_state["in_flight"] = True
+    user_save_state["dirty"] = False
+    offloader.submit(finish_user_save, write_text_file, format_user_database(users), users_file)
+
+
+def finish_user_save(future):
+    user_save_state["in_flight"] = False
+    if future.exception() is not None:
+        print(f"Error saving users file: {future.exception()}")
+    start_snapshot()
+    if user_save_state["dirty"]:
+        schedule_user_save()
+
+
+def read_question_stats(file_path):
+    """
+    Reads the question statistics saved by save_question_stats(). Blocking, runs in the offloader.
+    Returns: bytes, or None if there are none (yet)
+    """
+    try:
+        with open(file_path, "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"Error loading question stats file: {e}")
+        return None
+
+
+def write_binary_file(data, file_path):
+    """
+    Writes bytes to a file atomically, see write_file()
+    """
+    write_file(data, file_path, "wb")
+
+
+def save_question_stats(file_path):
+    """
+    Saves the question statistics. Blocks - in the select loop use schedule_stats_save().
+    """
+    try:
+        write_binary_file(question_stats.pack(), file_path)
+    except Exception as e:
+        print(f"Error saving question stats file: {e}")
+
+
+def schedule_stats_save():
+    """
+    Saves the question statistics in the background, at most every STATS_SAVE_INTERVAL seconds.
+    Statistics are aggregates, a few answers lost in a crash do not matter, so a save
+    requested too early is simply skipped.
+    """
+    last_started = stats_save_state["last_started"]
+    if stats_save_state["in_flight"] or (last_started is not None
+                                         and time.monotonic() - last_started < STATS_SAVE_INTERVAL):
+        return
+    stats_save_state["in_flight"] = True
+    stats_save_state["last_started"] = time.monotonic()
+    offloader.submit(finish_stats_save, write_binary_file, question_stats.pack(), stats_file)
+
+
+def finish_stats_save(future):
+    stats_save_state["in_flight"] = False
+    if future.exception() is not None:
+        print(f"Error saving question stats file: {future.exception()}")
+    start_snapshot()
+
+
+def log_event(kind, username, question_id=0, correct=False, points=0, seconds=0.0):
+    """
+    Appends an event to the event log, if the server keeps one (--event-log).
+    Only queues the record, the writing is done by the log's own thread.
+    """
+    if event_log is None:
+        return
+    stats = question_stats.stats.get(question_id)
+    question_key = stats.key if stats is not None else bytes(8)
+    event_log.log(kind, username, question_key, question_id, correct, points, seconds)
+
+
 def save_all_data():
     """
-    Saves both users and questions data to their respective files
+    Saves users, questions and question statistics to their respective files.
+    Until the startup load is done there is nothing to save - saving would overwrite the files with empty data.
     """
-    save_user_database(users)
-    save_questions(questions)
+    if not server_control["ready"]:
+        print("Data was not loaded yet, nothing to save")
+        return
+    save_user_database(users, users_file)
+    save_questions(questions, questions_file)
+    save_question_stats(stats_file)
 
 
 # SOCKET CREATOR
 
-def setup_socket():
+def setup_socket(host=SERVER_IP, port=SERVER_PORT):
     """
-    Creates new listening socket and returns it
-    Recieves: -
+    Creates new listening socket and returns it.
+    If the previous server process handed us its listening socket (see
+    start_successor()), that socket is used instead, so no connection is refused
+    while the server restarts.
+    Recieves: host (str), port (int)
     Returns: the socket object
     """
+    inherited_fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if inherited_fd is not None:
+        sock = socket.socket(fileno=int(inherited_fd))
+        print("Listening for clients on the socket of the previous server process...")
+        return sock
+
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.bind((SERVER_IP, SERVER_PORT))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
     sock.listen()
     print("Listening for clients...")
     
@@ -319,17 +887,42 @@ def handle_getscore_message(conn, username):
         build_and_send_message(conn, chatlib.PROTOCOL_SERVER["your_score_msg"], str(user_score))
 
 def handle_highscore_message(conn):
+    if shard_ring is not None:
+        request_global_highscore(conn)  # Merged from the top lists of every shard
+        return
+    send_highscore(conn, top_scores())
+
+
+def top_scores(k=None):
+    """
+    Returns: list of (username, score) of the users this server owns, best first
+    (only the k best if k is given)
+    """
     global users
-    users_score = {user: info.get("score", 0) for user, info in users.items()}  # Use get() to handle missing scores
-    sorted_dict = {key: value for key, value in sorted(users_score.items(), key=lambda item: item[1], reverse=True)}
-    full_msg = []
-    full_msg = "\n".join([f"{user}: {score}" for user, score in sorted_dict.items()])
-    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["all_score_msg"], full_msg)
+    users_score = ((user, info.get("score", 0)) for user, info in users.items() if owns_user(user))  # Use get() to handle missing scores
+    if k is None:
+        return sorted(users_score, key=lambda item: item[1], reverse=True)
+    return heapq.nlargest(k, users_score, key=lambda item: item[1])
+
+
+def send_highscore(conn, scores):
+    lines = [f"{user}: {score}" for user, score in scores]
+    build_and_send_lines(conn, chatlib.PROTOCOL_SERVER["all_score_msg"], lines)
 
 def handle_logged_message(conn):
     global logged_users
-    logged_users_list = ",".join(logged_users.values())
-    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["logged_answer_msg"], logged_users_list)
+    build_and_send_lines(conn, chatlib.PROTOCOL_SERVER["logged_answer_msg"], list(logged_users.values()), ",")
+
+
+def handle_compression_message(conn, method):
+    """
+    Turns on compression of large replies if the client asks for a method we support
+    """
+    if method != chatlib.COMPRESSION_METHOD:
+        send_error(conn, f"Unsupported compression method {method}")
+        return
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["compression_ok_msg"], method)
+    connections[conn]["compress"] = True
 
 
 def handle_logout_message(conn):
@@ -339,11 +932,18 @@ def handle_logout_message(conn):
     Returns: chatlib.ERROR_RETURN
     """
     global logged_users
+
+    # Forget any reply still being computed for this connection
+    deferred_replies.pop(conn, None)
     
     # Check if the client is in logged_users to avoid KeyError
-    client_address = conn.getpeername()
+    client_address = get_address(conn)
+    subscribers.discard(conn)
     if client_address in logged_users:
         print(f"User {logged_users[client_address]} has left the game!")
+        leave_room(logged_users[client_address])
+        pending_events.add_presence(logged_users[client_address], online=False)
+        log_event(eventlog.LOGOUT, logged_users[client_address])
         logged_users.pop(client_address, None)  # Safely remove client
     else:
         print(f"Unknown user from {client_address} disconnected.")
@@ -353,8 +953,9 @@ def handle_logout_message(conn):
 
 def handle_login_message(conn, data):
     """
-    Gets socket and message data of login message. Checks if user and password exist and match.
-    If not - sends error and finishes. If all ok, sends OK message and adds user to logged_users.
+    Gets socket and message data of login message. Checks if user exists and hands the
+    password check to the login pool. If not - sends error and finishes. The OK message
+    is sent by finish_login() once the password check is done.
     Receives: conn (socket object), data (str) of the received message.
     Returns: chatlib.ERROR_RETURN (sends response to client).
     """
@@ -362,57 +963,112 @@ def handle_login_message(conn, data):
     global logged_users  # Dictionary to track logged-in users    
 
     # Split the message into username and password
-    user_name, password = chatlib.split_data(data, 2)
+    split_result = chatlib.split_data(data, 2)
 
     # Validate the split data
-    if user_name is chatlib.ERROR_RETURN or password is chatlib.ERROR_RETURN:  # Check for split errors
+    if split_result == [chatlib.ERROR_RETURN]:  # Check for split errors
         send_error(conn, "Invalid login data format")
         return
 
+    user_name, password = split_result
+
+    # Every user lives on one shard, send the client there
+    if not owns_user(user_name):
+        host, port = sharding.parse_address(shard_ring.node_for(user_name))
+        build_and_send_message(conn, chatlib.PROTOCOL_SERVER["redirect_msg"], chatlib.join_data([host, str(port)]))
+        return
+
+    client_address = get_address(conn)
+
+    # Refuse addresses that failed too often, and shed load during a login storm
+    if login_throttle.is_blocked(client_address[0]):
+        send_error(conn, "Too many failed login attempts, try again later")
+        return
+    if len(deferred_replies) >= MAX_DEFERRED_REPLIES:
+        send_error(conn, "Server is busy, try again later")
+        return
+
     # Check if the username exists in the system
     if not users.get(user_name):  # Use get() to check if the user exists
+        login_throttle.record_failure(client_address[0])
         send_error(conn, "Username does not exist")
-    elif users.get(user_name, {}).get("password") != password:  # Use get() to safely retrieve the password
+        return
+
+    # The password KDF is slow, so it runs in the offloader.
+    # finish_login() sends the reply once the check is done.
+    stored_password = users[user_name]["password"]
+    deferred_replies[conn] = "login"
+    offloader.submit(lambda future: finish_login(conn, user_name, future),
+                     auth.verify_password, password, stored_password)
+
+
+def finish_login(conn, user_name, future):
+    """
+    Finishes a LOGIN reply once its password check has completed.
+    Runs on the loop thread, so all users / logged_users changes stay on it.
+    Receives: conn (socket object), user_name (str), future of auth.verify_password
+    Returns: None
+    """
+    global users
+    global logged_users
+
+    # The client may have left while its password was being checked
+    if deferred_replies.pop(conn, None) is None:
+        return
+
+    try:
+        ok, new_stored = future.result()
+    except Exception as e:
+        print(f"Error verifying password for {user_name}: {e}")
+        send_error(conn, "Login failed")
+        return
+
+    client_address = get_address(conn)
+    if not ok:
+        login_throttle.record_failure(client_address[0])
         send_error(conn, "Password does not match")
-    else:
-        # Login successful, add the user to logged_users and send LOGIN_OK
-        # Get the client's address using getpeername()
-        client_address = conn.getpeername()
+        return
+
+    # Migrate plaintext (or outdated) entries to a fresh hash
+    if new_stored is not None and user_name in users:
+        users[user_name]["password"] = new_stored
+        schedule_user_save()
 
-        # Add the client's address and username to the logged_users dictionary
-        logged_users[client_address] = user_name
+    # Login successful, add the client's address and username to logged_users
+    logged_users[client_address] = user_name
+    pending_events.add_presence(user_name, online=True)
+    log_event(eventlog.LOGIN, user_name)
 
-        build_and_send_message(conn, chatlib.PROTOCOL_SERVER["login_ok_msg"], "")
-        print(f"User {user_name} logged in successfully")
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["login_ok_msg"], "")
+    print(f"User {user_name} logged in successfully")
 
 
-def create_random_question(username):
+def create_random_question(username, exclude=(), filters=None):
     """
     Returns a random question that the user has not been asked before.
     If all questions have been asked, returns None.
     
     :param username: the user requesting the question
+    :param exclude: more question IDs not to choose (e.g. prefetched but not answered yet)
+    :param filters: {"category": , "difficulty": , "mode": } the question must match (see questionindex.parse_filters())
     :return: a tuple (question_data, question_id) or None if no new questions available
     """
     global users
     global questions
     
-    # Get the set of question IDs the user has been asked
-    asked_questions = set(users[username]["questions_asked"])
-    
-    # Get the set of all question IDs
-    all_question_ids = set(questions.keys())
-    
-    # Get the set of remaining questions by subtracting asked questions from all questions
-    remaining_questions = all_question_ids - asked_questions
+    filters = dict(filters or {})
+    excluded = (users[username]["questions_asked"], exclude)
+    if filters.pop("mode", None) == "adaptive":
+        # Choose a question the user has not seen, rated close to the user's skill
+        random_question_id = question_stats.random_question(users[username]["rating"], excluded)
+    else:
+        # Choose a random question the user has not seen, from the questions matching the filters
+        random_question_id = question_index.random_question(excluded, **filters)
     
     # If no remaining questions, return None
-    if not remaining_questions:
+    if random_question_id is None:
         return None
     
-    # Choose a random question from the remaining ones
-    random_question_id = random.choice(list(remaining_questions))
-    
     # Get question text and answers
     question_text = questions[random_question_id]["question"]
     question_answers = questions[random_question_id]["answers"]
@@ -423,33 +1079,157 @@ def create_random_question(username):
     return question_data, random_question_id    
 
 
-def handle_question_message(conn, username):
+def parse_question_filters(conn, fields):
+    """
+    Parses the filters of GET_QUESTION / GET_QUESTIONS, sending an error if they are invalid
+    Returns: {key: value}, or None after an error
+    """
+    try:
+        return questionindex.parse_filters(fields)
+    except ValueError as e:
+        send_error(conn, str(e))
+        return None
+
+
+def handle_question_message(conn, username, filter_data="", allow_fetch=True):
     """
     Sends a random question to the user, ensuring the user has not been asked the question before.
-    If no new questions are available, sends a message indicating all questions have been asked.
+    If no new questions are available, fetches more from the web in the background and
+    answers once the fetch is done. If that does not help either, sends a message
+    indicating all questions have been asked.
     
     :param conn: socket connection
     :param username: the user requesting the question
+    :param filter_data: optional filters, e.g. "category=Science: Computers#difficulty=easy"
+    :param allow_fetch: False to answer NO_QUESTIONS right away instead of fetching more
     """
     global users
     
+    filters = parse_question_filters(conn, filter_data.split(chatlib.DATA_DELIMITER) if filter_data else [])
+    if filters is None:
+        return
+    served = connections[conn]["served_questions"]
+
     # Get a new random question for the user
-    result = create_random_question(username)
+    result = create_random_question(username, served, filters)
     
     if result is None:
+        if allow_fetch and request_more_questions(conn, username, filter_data):
+            return  # finish_question_fetch() will answer
         # No new questions available, send appropriate message
         build_and_send_message(conn, chatlib.PROTOCOL_SERVER["no_questions_msg"], "")
     else:
         # Extract question data and question ID
         question_data, question_id = result
         
-        # Add the question ID to the list of questions the user has been asked
-        users[username]["questions_asked"].append(question_id)
+        # Add the question ID to the questions the user has been asked,
+        # and remember it was sent so it can be answered
+        users[username]["questions_asked"].add(question_id)
+        served[question_id] = time.monotonic()
+        log_event(eventlog.QUESTION, username, question_id)
         
         # Send the question to the user
         build_and_send_message(conn, chatlib.PROTOCOL_SERVER["your_question_msg"], question_data)    
 
 
+def handle_questions_message(conn, username, request_data):
+    """
+    Prefetch: sends up to count_data questions at once, while the player is still busy
+    with the current one. Prefetched questions are only added to questions_asked when
+    answered, so questions the player never got to (e.g. it quit) are not counted as asked.
+    Until then they are not sent again.
+    
+    :param conn: socket connection
+    :param username: the user requesting the questions
+    :param request_data: number of questions wanted, optionally followed by filters (e.g. "3#difficulty=hard")
+    """
+    count_data, *filter_fields = request_data.split(chatlib.DATA_DELIMITER)
+    if not (count_data.isascii() and count_data.isdigit()) or not 1 <= int(count_data) <= MAX_PREFETCH:
+        send_error(conn, f"Question count must be between 1 and {MAX_PREFETCH}")
+        return
+    filters = parse_question_filters(conn, filter_fields)
+    if filters is None:
+        return
+
+    served = connections[conn]["served_questions"]
+    batch = []
+    batch_length = 0
+    for _ in range(int(count_data)):
+        result = create_random_question(username, served, filters)
+        if result is None:
+            break
+        question_data, question_id = result
+        batch_length += len(question_data) + 1
+        if batch_length > chatlib.MAX_DATA_LENGTH:
+            break  # Does not fit in one message
+        served[question_id] = time.monotonic()
+        log_event(eventlog.QUESTION, username, question_id)
+        batch.append(question_data)
+
+    if not batch:
+        build_and_send_message(conn, chatlib.PROTOCOL_SERVER["no_questions_msg"], "")
+    else:
+        # One question per line, each in the YOUR_QUESTION format
+        build_and_send_message(conn, chatlib.PROTOCOL_SERVER["your_questions_msg"], "\n".join(batch))
+
+
+def request_more_questions(conn, username, filter_data=""):
+    """
+    Defers a GET_QUESTION reply until a background web fetch adds more questions.
+    Players running out at the same time share one fetch.
+    Returns: True if the reply was deferred, False if no fetch may run now
+    """
+    last_finished = question_fetch["last_finished"]
+    if not question_fetch["in_flight"]:
+        if last_finished is not None and time.monotonic() - last_finished < QUESTION_FETCH_COOLDOWN:
+            return False
+        question_fetch["in_flight"] = True
+        offloader.submit(finish_question_fetch, load_questions_from_web)
+
+    deferred_replies[conn] = "questions"
+    question_fetch["waiters"].append((conn, username, filter_data))
+    return True
+
+
+def add_questions(new_questions):
+    """
+    Adds questions to the pool under fresh IDs, so they never collide with existing ones.
+    Questions whose text is already in the pool are skipped.
+    Returns: number of questions added
+    """
+    next_id = max(questions.keys(), default=0) + 1
+    added = 0
+    for question in new_questions.values():
+        if question_stats.find(question["question"]) is not None:
+            continue
+        question_id = question_strings.intern(next_id + added)
+        questions[question_id] = question
+        question_index.add(question_id, question)
+        question_stats.attach(question_id, question)
+        added += 1
+    return added
+
+
+def finish_question_fetch(future):
+    """
+    Merges the fetched questions into the pool and answers the players waiting for them.
+    """
+    question_fetch["in_flight"] = False
+    question_fetch["last_finished"] = time.monotonic()
+    waiters, question_fetch["waiters"] = question_fetch["waiters"], []
+
+    try:
+        added = add_questions(future.result())
+        print(f"Added {added} questions from the web")
+    except Exception as e:
+        print(f"Error fetching questions: {e}")
+
+    for conn, username, filter_data in waiters:
+        if deferred_replies.pop(conn, None) is None:
+            continue  # The client left in the meantime
+        handle_question_message(conn, username, filter_data, allow_fetch=False)
+
+
 def handle_answer_message(conn, username, answer_data):
     global questions
     global users
@@ -477,10 +1257,34 @@ def handle_answer_message(conn, username, answer_data):
         send_error(conn, "Question ID not found.")
         return
 
+    # Only questions sent to this client can be answered, and only once
+    served = connections[conn]["served_questions"]
+    if question_id not in served:
+        send_error(conn, "This question was not sent to you or was already answered")
+        return
+
+    try:
+        user_answer = int(user_answer)
+    except ValueError:
+        send_error(conn, "Invalid answer format")
+        return
+
+    # A prefetched question counts as asked once it is answered
+    sent_at = served.pop(question_id)
+    users[username]["questions_asked"].add(question_strings.intern(question_id))
+
+    # Update the question's statistics and the ratings of the user and the question
+    correct = user_answer == questions[question_id]["correct"]
+    seconds = time.monotonic() - sent_at
+    users[username]["rating"] = question_stats.record_answer(question_id, users[username]["rating"], correct, seconds)
+    schedule_stats_save()
+    schedule_user_save()
+    log_event(eventlog.ANSWER, username, question_id, correct, 5 if correct else 0, seconds)
+
     # Check if the user's answer matches the correct one
-    if int(user_answer) == questions[question_id]["correct"]:
+    if correct:
         users[username]["score"] += 5  # Update score if correct
-        save_user_database(users)
+        pending_events.add_score(username, users[username]["score"])
         build_and_send_message(conn, chatlib.PROTOCOL_SERVER["correct_answer_msg"], "")
     else:
         # Send back the correct answer if the user is wrong
@@ -488,6 +1292,771 @@ def handle_answer_message(conn, username, answer_data):
         build_and_send_message(conn, chatlib.PROTOCOL_SERVER["wrong_answer_msg"], correct_answer)
 
 
+##### ADMIN CHANNEL
+
+def setup_admin_socket(path):
+    """
+    Creates the admin channel's listening UNIX socket, readable by this user only.
+    A socket file left behind by an earlier server (or by the process we take over from) is replaced.
+    Returns: the socket object
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock.bind(path)
+    os.chmod(path, 0o600)
+    sock.listen()
+    sock.setblocking(False)
+    print(f"Admin channel listening on {path}")
+    return sock
+
+
+def accept_admin(admin_socket):
+    conn, _ = admin_socket.accept()
+    conn.setblocking(False)
+    admin_connections[conn] = {"inbox": b"", "outbox": b""}
+
+
+def close_admin(conn):
+    admin_connections.pop(conn, None)
+    if question_import["conn"] is conn:
+        question_import["conn"] = None  # The import goes on, its reply is dropped
+    conn.close()
+
+
+def admin_reply(conn, ok=True, **fields):
+    """
+    Queues a reply to an admin connection, if it is still open
+    """
+    if conn in admin_connections:
+        admin_connections[conn]["outbox"] += admin.encode(dict(ok=ok, **fields))
+
+
+def admin_error(conn, error):
+    admin_reply(conn, False, error=error)
+
+
+def read_admin(conn):
+    """
+    Receives from an admin connection and runs every complete request line
+    """
+    try:
+        data = conn.recv(RECV_BUFFER_SIZE)
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError:
+        data = b""
+    if not data:
+        close_admin(conn)
+        return
+
+    state = admin_connections[conn]
+    state["inbox"] += data
+    while b"\n" in state["inbox"]:
+        line, state["inbox"] = state["inbox"].split(b"\n", 1)
+        try:
+            request = admin.decode(line)
+            command, args = request["command"], [str(arg) for arg in request.get("args", [])]
+        except (ValueError, KeyError, TypeError):
+            admin_error(conn, "Invalid request, expected {\"command\": ..., \"args\": [...]}")
+            continue
+        handle_admin_command(conn, command, args)
+    if len(state["inbox"]) > admin.MAX_LINE_LENGTH:
+        admin_error(conn, "Request too long")
+        state["inbox"] = b""
+
+
+def send_admin(conn):
+    state = admin_connections[conn]
+    try:
+        sent = conn.send(state["outbox"])
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError:
+        close_admin(conn)
+        return
+    state["outbox"] = state["outbox"][sent:]
+
+
+def handle_admin_command(conn, command, args):
+    if command == "stats":
+        handle_admin_stats(conn)
+    elif command == "sessions":
+        handle_admin_sessions(conn)
+    elif not server_control["ready"]:
+        admin_error(conn, "The server is still loading its data")
+    elif command == "kick":
+        handle_admin_kick(conn, args)
+    elif command == "reset-score":
+        handle_admin_reset_score(conn, args)
+    elif command == "snapshot":
+        handle_admin_snapshot(conn)
+    elif command == "load-questions":
+        handle_admin_load_questions(conn, args)
+    else:
+        admin_error(conn, f"Unknown command {command!r}, expected one of {', '.join(admin.COMMANDS)}")
+
+
+def handle_admin_stats(conn):
+    admin_reply(conn,
+                uptime=round(time.monotonic() - server_control["started_at"], 1),
+                ready=server_control["ready"],
+                draining=server_control["drain_deadline"] is not None,
+                clients=len(connections),
+                logged_in=len(logged_users),
+                users=len(users),
+                questions=len(questions),
+                rooms=len(game_rooms),
+                subscribers=len(subscribers),
+                deferred_replies=len(deferred_replies),
+                background_jobs=offloader.jobs_in_flight,
+                unsent_bytes=sum(state["outbox_bytes"] for state in connections.values()),
+                interned_values=len(question_strings),
+                importing_questions=question_import["file"] is not None)
+
+
+def handle_admin_sessions(conn):
+    sessions = []
+    for client, state in connections.items():
+        address = state["address"]
+        username = logged_users.get(address)
+        sessions.append({
+            "address": f"{address[0]}:{address[1]}",
+            "username": username,
+            "room": user_rooms.get(username),
+            "tls": tls_context is not None,
+            "handshaking": state["handshake_deadline"] is not None,
+            "compress": state["compress"],
+            "served_questions": len(state["served_questions"]),
+            "unsent_bytes": state["outbox_bytes"],
+        })
+    admin_reply(conn, sessions=sessions)
+
+
+def handle_admin_kick(conn, args):
+    """
+    Disconnects every session of a user. Args: username
+    """
+    if len(args) != 1:
+        admin_error(conn, "Usage: kick USERNAME")
+        return
+    kicked = [client for client, state in connections.items() if logged_users.get(state["address"]) == args[0]]
+    for client in kicked:
+        build_and_send_message(client, chatlib.PROTOCOL_SERVER["kicked_msg"],
+                               "You were disconnected by the administrator")
+        try:
+            send_pending(client)  # Best effort, the socket is closed at the end of this loop iteration
+        except OSError:
+            pass
+        sockets_to_close.add(client)
+    admin_reply(conn, kicked=len(kicked))
+
+
+def handle_admin_reset_score(conn, args):
+    """
+    Sets the score of a user (or of every user) to 0. Args: username or --all
+    """
+    if len(args) != 1:
+        admin_error(conn, "Usage: reset-score USERNAME|--all")
+        return
+    if args[0] == "--all":
+        targets = list(users)
+    elif args[0] in users:
+        targets = [args[0]]
+    else:
+        admin_error(conn, f"User {args[0]} is not found")
+        return
+    for username in targets:
+        if users[username]["score"]:
+            users[username]["score"] = 0
+            pending_events.add_score(username, 0)
+    global_highscore["scores"] = None  # Do not serve the cached table any more
+    schedule_user_save()
+    admin_reply(conn, reset=len(targets))
+
+
+def write_snapshot(users_text, questions_snapshot, stats_data):
+    """
+    Writes users, questions and question statistics. Blocking, runs in the offloader.
+    Errors are raised, not printed, so finish_snapshot() can report them.
+    """
+    write_text_file(users_text, users_file)
+    write_text_file(format_questions(questions_snapshot), questions_file)
+    write_binary_file(stats_data, stats_file)
+
+
+def handle_admin_snapshot(conn):
+    """
+    Saves all data now, or as soon as the running user and stats saves are done
+    """
+    snapshot_waiters.append(conn)
+    start_snapshot()
+
+
+def start_snapshot():
+    """
+    Starts the snapshot the admin connections wait for, unless a user or stats save is running.
+    The snapshot counts as both, so saves requested meanwhile are written after it and an older
+    snapshot never overwrites a newer save. It is taken on the loop thread (a shallow copy of the
+    questions, which are never changed in place), the files are written in the background.
+    """
+    if not snapshot_waiters or user_save_state["in_flight"] or stats_save_state["in_flight"]:
+        return
+    waiters = snapshot_waiters[:]
+    snapshot_waiters.clear()
+    user_save_state["in_flight"] = True
+    user_save_state["dirty"] = False
+    stats_save_state["in_flight"] = True
+    stats_save_state["last_started"] = time.monotonic()
+    offloader.submit(lambda future: finish_snapshot(waiters, future), write_snapshot,
+                     format_user_database(users), dict(questions), question_stats.pack())
+
+
+def finish_snapshot(waiters, future):
+    user_save_state["in_flight"] = False
+    stats_save_state["in_flight"] = False
+    for conn in waiters:
+        if future.exception() is not None:
+            admin_error(conn, f"Snapshot failed: {future.exception()}")
+        else:
+            admin_reply(conn, saved=[users_file, questions_file, stats_file])
+    start_snapshot()
+    if user_save_state["dirty"]:
+        schedule_user_save()
+
+
+def read_question_chunk(file, first_line_no):
+    """
+    Reads and parses the next QUESTION_IMPORT_CHUNK lines of a questions file. Blocking, runs in the offloader.
+    Returns: ({line number: question} of the valid lines, number of lines read)
+    """
+    chunk = {}
+    lines = 0
+    for line_no, line in enumerate(itertools.islice(file, QUESTION_IMPORT_CHUNK), start=first_line_no):
+        lines += 1
+        parsed = parse_question_line(line, line_no)
+        if parsed is not None:
+            chunk[line_no] = parsed[1]
+    return chunk, lines
+
+
+def handle_admin_load_questions(conn, args):
+    """
+    Adds the questions of a file (questions.txt format) to the pool. The file is read and parsed
+    in the background QUESTION_IMPORT_CHUNK lines at a time; each chunk is added on the loop thread,
+    so a big import never holds up the game for long. Args: file path
+    """
+    if len(args) != 1:
+        admin_error(conn, "Usage: load-questions FILE")
+        return
+    if question_import["file"] is not None:
+        admin_error(conn, "A question import is already running")
+        return
+    try:
+        question_import["file"] = open(args[0], "r")
+    except OSError as e:
+        admin_error(conn, f"Cannot open {args[0]}: {e}")
+        return
+    question_import.update(conn=conn, lines=0, added=0)
+    offloader.submit(finish_question_chunk, read_question_chunk, question_import["file"], 1)
+
+
+def finish_question_chunk(future):
+    conn = question_import["conn"]
+    try:
+        chunk, lines = future.result()
+    except Exception as e:
+        end_question_import()
+        if conn is not None:
+            admin_error(conn, f"Question import failed after {question_import['added']} questions: {e}")
+        return
+
+    question_import["added"] += add_questions(chunk)
+    question_import["lines"] += lines
+    if lines and server_control["mode"] is None:
+        offloader.submit(finish_question_chunk, read_question_chunk, question_import["file"],
+                         question_import["lines"] + 1)
+        return
+
+    end_question_import()
+    print(f"Imported {question_import['added']} questions from {question_import['lines']} lines")
+    if conn is not None:
+        admin_reply(conn, added=question_import["added"], lines=question_import["lines"],
+                    complete=not lines, questions=len(questions))
+
+
+def end_question_import():
+    question_import["file"].close()
+    question_import["file"] = None
+    question_import["conn"] = None
+
+
+##### STARTUP
+
+def load_startup_data(users_path, stats_path, questions_path=None):
+    """
+    Loads the users, the questions and the question statistics. Blocking, runs in the offloader.
+    The questions are downloaded, or read from questions_path if one is given.
+    Returns: (users, questions, question statistics file data or None)
+    """
+    questions = load_questions(questions_path) if questions_path is not None else load_questions_from_web()
+    return load_user_database(users_path), questions, read_question_stats(stats_path)
+
+
+def start_loading(download=True):
+    """
+    Loads the data in the background, so the listening socket is up right away.
+    Clients can connect meanwhile; their requests are read once finish_loading() ran.
+    """
+    offloader.submit(finish_loading, load_startup_data, users_file, stats_file, None if download else questions_file)
+
+
+def finish_loading(future):
+    global users
+    global questions
+
+    try:
+        users, questions, stats_data = future.result()
+    except Exception as e:
+        print(f"Error loading the server data, shutting down: {e}")
+        server_control["mode"] = "shutdown"
+        return
+
+    if stats_data is not None:
+        try:
+            question_stats.unpack(stats_data)
+        except ValueError as e:
+            print(f"Error loading question stats file: {e}")
+    question_index.rebuild(questions)
+    question_stats.rebuild(questions)
+    server_control["ready"] = True
+
+    if shard_ring is not None:
+        foreign = sum(not owns_user(user) for user in users)
+        print(f"Shard {shard_name} of {len(shard_ring.nodes)}, {foreign} users in {users_file} belong to other shards")
+    elapsed = time.monotonic() - server_control["started_at"]
+    print(f"Server ready after {elapsed:.2f} s: {len(users)} users, {len(questions)} questions")
+
+
+##### SHUTDOWN AND RELOAD
+
+def request_drain(signum, frame):
+    """
+    Signal handler of SIGINT / SIGTERM (shutdown) and SIGUSR2 (restart into a new process).
+    Only sets the mode, the select loop does the work. A second Ctrl+C stops at once.
+    """
+    if server_control["mode"] is not None:
+        if signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        return
+    server_control["mode"] = "upgrade" if signum == getattr(signal, "SIGUSR2", None) else "shutdown"
+    offloader.wake()
+
+
+def request_reload(signum, frame):
+    """
+    Signal handler of SIGHUP
+    """
+    server_control["reload"] = True
+    offloader.wake()
+
+
+def install_signal_handlers():
+    signal.signal(signal.SIGINT, request_drain)
+    signal.signal(signal.SIGTERM, request_drain)
+    # Not available on Windows
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, request_drain)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, request_reload)
+
+
+def reload_server():
+    """
+    Hot reload: reloads the helper modules (protocol, auth, rate limits, rooms, events)
+    and adds the new questions of the questions file to the pool, without touching
+    connections or users. Code changes to server.py itself need a restart (SIGUSR2).
+    """
+    server_control["reload"] = False
+    for module in RELOADABLE_MODULES:
+        try:
+            importlib.reload(module)
+            print(f"Reloaded module {module.__name__}")
+        except Exception as e:
+            print(f"Error reloading module {module.__name__}: {e}")
+    offloader.submit(finish_question_reload, read_questions_file, questions_file)
+
+
+def finish_question_reload(future):
+    """
+    Merges the reloaded file into the pool. Questions already in the pool keep their
+    IDs (served questions can still be answered), questions only added through the web
+    or the admin channel are kept, questions new in the file are added under fresh IDs.
+    """
+    try:
+        added = add_questions(future.result())
+    except Exception as e:
+        print(f"Error reloading questions, keeping the current pool: {e}")
+        return
+    print(f"Question pool reloaded, {added} new questions, {len(questions)} in total")
+
+
+def start_drain(client_sockets):
+    """
+    Enters drain mode: no more requests are read, clients are told the server is going away
+    """
+    server_control["drain_deadline"] = time.monotonic() + DRAIN_TIMEOUT
+    # Clients still in their TLS handshake have no session to finish
+    sockets_to_close.update(c for c in client_sockets if is_handshaking(c))
+    if server_control["mode"] == "upgrade":
+        print("\nServer is restarting, handing over to a new process")
+        notice = "Server is restarting, please reconnect"
+    else:
+        print("\nServer is shutting down")
+        notice = "Server is shutting down"
+    broadcast_message(client_sockets, chatlib.PROTOCOL_SERVER["server_shutdown_msg"], notice)
+
+
+def start_successor(server_socket):
+    """
+    Starts a new server process that inherits the listening socket and starts with
+    the questions saved by this one (--no-download), so their IDs stay the same.
+    Connections arriving meanwhile wait in the listen backlog instead of being refused.
+    """
+    import subprocess  # Only needed for the handoff, not imported at startup (tls.py imports it lazily too)
+
+    listen_fd = server_socket.fileno()
+    os.set_inheritable(listen_fd, True)
+    env = dict(os.environ, **{LISTEN_FD_ENV: str(listen_fd)})
+    argv = sys.argv if "--no-download" in sys.argv else sys.argv + ["--no-download"]
+    process = subprocess.Popen([sys.executable] + argv, env=env, pass_fds=(listen_fd,))
+    print(f"Started successor process {process.pid}")
+
+
+def drain_step(client_sockets, server_socket):
+    """
+    Advances the drain. Once deferred replies and background jobs are done (or the drain
+    times out) the data is saved and, when restarting, the successor is started.
+    Returns: True when every reply was sent (or the drain timed out) and the server can exit
+    """
+    timed_out = time.monotonic() >= server_control["drain_deadline"]
+    if not server_control["persisted"] and (timed_out or (not deferred_replies and offloader.jobs_in_flight == 0)):
+        save_all_data()  # The successor loads what we save here
+        server_control["persisted"] = True
+        if server_control["mode"] == "upgrade":
+            start_successor(server_socket)
+        server_socket.close()
+
+    if not server_control["persisted"]:
+        return False
+    return timed_out or not any(connections[c]["outbox"] for c in client_sockets)
+
+
+##### EVENT PUSHES
+
+def handle_subscribe_message(conn):
+    """
+    Starts pushing EVENTS messages (logins, logouts and score changes) to the client
+    """
+    subscribers.add(conn)
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["subscribe_ok_msg"], "")
+
+
+def handle_unsubscribe_message(conn):
+    subscribers.discard(conn)
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["subscribe_ok_msg"], "")
+
+
+def push_pending_events():
+    """
+    Sends the events collected during the last coalescing window to every subscriber
+    """
+    for data in pending_events.flush():
+        if subscribers:
+            broadcast_message(subscribers, chatlib.PROTOCOL_SERVER["events_msg"], data)
+
+
+##### SHARDING
+
+def owns_user(username):
+    """
+    Returns True if the user belongs to this server (always, unless the server is one of several shards)
+    """
+    return shard_ring is None or shard_ring.node_for(username) == shard_name
+
+
+def handle_shard_top_message(conn, data):
+    """
+    Answers another shard's SHARD_TOP (count#secret) with this shard's best scores
+    """
+    import hmac  # Only sharded servers need it, not imported at startup
+
+    if shard_ring is None:
+        send_error(conn, "This server is not sharded")
+        return
+    count_data, _, secret = data.partition(chatlib.DATA_DELIMITER)
+    if not hmac.compare_digest(secret.encode(), shard_secret.encode()):
+        send_error(conn, "Only other shards may ask for the shard scores")
+        return
+    if not (count_data.isascii() and count_data.isdigit()):
+        send_error(conn, "Invalid count")
+        return
+    scores = top_scores(min(int(count_data), HIGHSCORE_TOP_K))
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["shard_top_ok_msg"], sharding.format_scores(scores))
+
+
+def request_global_highscore(conn):
+    """
+    Sends the merged high-score table of all shards. A recent table is reused,
+    otherwise the other shards are asked for their top lists in the offloader
+    and the reply is deferred until they answered (or timed out).
+    """
+    state = global_highscore
+    if state["scores"] is not None and time.monotonic() - state["fetched_at"] < HIGHSCORE_CACHE_TTL:
+        send_highscore(conn, state["scores"])
+        return
+
+    deferred_replies[conn] = "highscore"
+    state["waiters"].append(conn)
+    if state["in_flight"]:
+        return  # The running fetch answers this client too
+
+    peers = [node for node in shard_ring.nodes if node != shard_name]
+    state["in_flight"] = True
+    state["peers_left"] = len(peers)
+    state["lists"] = []
+    for peer in peers:
+        offloader.submit(lambda future, peer=peer: finish_peer_scores(peer, future),
+                         sharding.fetch_top_scores, peer, HIGHSCORE_TOP_K, shard_secret, peer_tls_context)
+    if not peers:
+        finish_global_highscore()
+
+
+def finish_peer_scores(peer, future):
+    state = global_highscore
+    try:
+        state["lists"].append(future.result())
+    except (OSError, ValueError) as e:
+        print(f"Could not get the scores of shard {peer}: {e}")  # The table is sent without them
+    state["peers_left"] -= 1
+    if state["peers_left"] == 0:
+        finish_global_highscore()
+
+
+def finish_global_highscore():
+    """
+    Merges this shard's top list with the other shards' lists and answers every waiting client
+    """
+    state = global_highscore
+    scores = sharding.merge_top_scores([top_scores(HIGHSCORE_TOP_K)] + state["lists"], HIGHSCORE_TOP_K)
+    state["in_flight"] = False
+    state["lists"] = []
+    state["scores"] = scores
+    state["fetched_at"] = time.monotonic()
+
+    waiters, state["waiters"] = state["waiters"], []
+    for conn in waiters:
+        # Skip clients that left while the shards were asked
+        if deferred_replies.pop(conn, None) is not None:
+            send_highscore(conn, scores)
+
+
+##### GAME ROOMS
+
+def room_info(room):
+    return chatlib.join_data([room.name, str(room.rounds), str(int(room.answer_time))])
+
+
+def broadcast_room_members(room):
+    members = ",".join(room.members)
+    broadcast_message(room.members.values(), chatlib.PROTOCOL_SERVER["room_members_msg"],
+                      chatlib.join_data([room.owner, members]))
+
+
+def handle_create_room_message(conn, username, room_name):
+    """
+    Creates a new room owned by the user and puts the user in it.
+    Data: the room name
+    """
+    if not room_name or chatlib.DATA_DELIMITER in room_name:
+        send_error(conn, "Invalid room name")
+        return
+    if room_name in game_rooms:
+        send_error(conn, f"Room {room_name} already exists")
+        return
+
+    leave_room(username)
+    room = rooms.Room(room_name, username, conn)
+    game_rooms[room_name] = room
+    user_rooms[username] = room_name
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["room_ok_msg"], room_info(room))
+    broadcast_room_members(room)
+
+
+def handle_join_room_message(conn, username, room_name):
+    """
+    Adds the user to an existing room. A running match is joined from its next question.
+    Data: the room name
+    """
+    room = game_rooms.get(room_name)
+    if room is None:
+        send_error(conn, f"Room {room_name} does not exist")
+        return
+
+    if user_rooms.get(username) != room_name:
+        leave_room(username)
+        room.add_member(username, conn)
+        user_rooms[username] = room_name
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["room_ok_msg"], room_info(room))
+    broadcast_room_members(room)
+
+
+def leave_room(username):
+    """
+    Takes the user out of its room (if any). Empty rooms are removed.
+    """
+    room_name = user_rooms.pop(username, None)
+    if room_name is None:
+        return
+
+    room = game_rooms[room_name]
+    if room.remove_member(username):
+        room.deadline = None  # Invalidates its scheduler entries
+        del game_rooms[room_name]
+        return
+
+    broadcast_room_members(room)
+    if room.state == rooms.QUESTION and room.everyone_answered():
+        end_room_question(room, time.monotonic())
+
+
+def handle_leave_room_message(conn, username):
+    if username not in user_rooms:
+        send_error(conn, "You are not in a room")
+        return
+    room_name = user_rooms[username]
+    leave_room(username)
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["room_ok_msg"], room_name)
+
+
+def handle_start_room_message(conn, username):
+    """
+    Starts a match in the user's room. Only the room owner may start it.
+    """
+    room = game_rooms.get(user_rooms.get(username))
+    if room is None:
+        send_error(conn, "You are not in a room")
+    elif room.owner != username:
+        send_error(conn, "Only the room owner can start the match")
+    elif room.state != rooms.WAITING:
+        send_error(conn, "The match has already started")
+    else:
+        room.start_match()
+        build_and_send_message(conn, chatlib.PROTOCOL_SERVER["room_ok_msg"], room_info(room))
+        open_room_question(room, time.monotonic())
+
+
+def pick_room_question(room):
+    """
+    Returns a random question ID not used yet in the room's match, or None
+    """
+    return question_index.random_question((room.used_questions,))
+
+
+def open_room_question(room, now):
+    """
+    Sends the same question to every member at once and starts its answer deadline.
+    """
+    question_id = pick_room_question(room)
+    if question_id is None:
+        end_room_match(room)
+        return
+
+    question = questions[question_id]
+    room.open_question(question_id, question["correct"], now)
+    question_data = chatlib.join_data([str(question_id), question["question"]] + question["answers"])
+    broadcast_message(room.members.values(), chatlib.PROTOCOL_SERVER["room_question_msg"], question_data)
+    room_scheduler.schedule(room)
+
+
+def handle_room_answer_message(conn, username, answer_data):
+    """
+    Records an answer to the room's open question. The round ends when everyone
+    has answered or the deadline passes.
+    Data: question_id#answer_number
+    """
+    room = game_rooms.get(user_rooms.get(username))
+    if room is None:
+        send_error(conn, "You are not in a room")
+        return
+
+    split_result = chatlib.split_data(answer_data, 2)
+    if split_result == [chatlib.ERROR_RETURN]:
+        send_error(conn, "Invalid answer format")
+        return
+
+    try:
+        question_id, answer = int(split_result[0]), int(split_result[1])
+    except ValueError:
+        send_error(conn, "Invalid answer format")
+        return
+
+    now = time.monotonic()
+    error = room.submit_answer(username, question_id, answer, now)
+    if error is not None:
+        send_error(conn, error)
+        return
+
+    build_and_send_message(conn, chatlib.PROTOCOL_SERVER["room_answer_ok_msg"], "")
+    if room.everyone_answered():
+        end_room_question(room, now)
+
+
+def end_room_question(room, now):
+    """
+    Scores the open question, adds the points to the players' total scores
+    and sends the round's results to every member.
+    """
+    earned = room.close_question(now)
+    for username, (answer, seconds) in room.answers.items():
+        log_event(eventlog.ANSWER, username, room.question_id, answer == room.correct, earned.get(username, 0), seconds)
+    for username, points in earned.items():
+        if points and username in users:
+            users[username]["score"] += points
+            pending_events.add_score(username, users[username]["score"])
+    if any(earned.values()):
+        schedule_user_save()
+
+    standings = "\n".join(f"{username}: {total} (+{earned.get(username, 0)})" for username, total in room.standings())
+    broadcast_message(room.members.values(), chatlib.PROTOCOL_SERVER["room_result_msg"],
+                      chatlib.join_data([str(room.correct), standings]))
+    room_scheduler.schedule(room)
+
+
+def end_room_match(room):
+    standings = "\n".join(f"{username}: {total}" for username, total in room.standings())
+    room.finish_match()
+    broadcast_message(room.members.values(), chatlib.PROTOCOL_SERVER["room_over_msg"], standings)
+
+
+def run_room_scheduler():
+    """
+    Advances the rooms whose deadline has passed: closes expired questions
+    and opens the next question (or ends the match) after the results pause.
+    """
+    now = time.monotonic()
+    for room in room_scheduler.due_rooms(now):
+        if room.state == rooms.QUESTION:
+            end_room_question(room, now)
+        elif room.state == rooms.RESULTS:
+            if room.is_last_round():
+                end_room_match(room)
+            else:
+                open_room_question(room, now)
+
+
 def handle_client_message(conn, cmd, data):
     """
     Gets message code and data and calls the right function to handle command
@@ -502,8 +2071,12 @@ def handle_client_message(conn, cmd, data):
         return 
     
     # Check if the user is logged in
-    user = logged_users.get(conn.getpeername())
-    if user is None:
+    user = logged_users.get(get_address(conn))
+    if cmd == chatlib.PROTOCOL_CLIENT["compression_msg"]:
+        handle_compression_message(conn, data)  # Allowed before login
+    elif cmd == chatlib.PROTOCOL_CLIENT["shard_top_msg"]:
+        handle_shard_top_message(conn, data)  # Sent by the other shards, which do not log in
+    elif user is None:
         if cmd == chatlib.PROTOCOL_CLIENT["login_msg"]:
             handle_login_message(conn, data)
         else:
@@ -511,7 +2084,7 @@ def handle_client_message(conn, cmd, data):
     else:
         # Handle commands once logged in
         if cmd == chatlib.PROTOCOL_CLIENT["logout_msg"]:
-            handle_logout_message(conn)
+            sockets_to_close.add(conn)
         elif cmd == chatlib.PROTOCOL_CLIENT["my_score_msg"]:
             handle_getscore_message(conn, user)
         elif cmd == chatlib.PROTOCOL_CLIENT["highscore_msg"]:
@@ -519,117 +2092,253 @@ def handle_client_message(conn, cmd, data):
         elif cmd == chatlib.PROTOCOL_CLIENT["logged_msg"]:
             handle_logged_message(conn)
         elif cmd == chatlib.PROTOCOL_CLIENT["get_question_msg"]:
-            handle_question_message(conn, user)
+            handle_question_message(conn, user, data)
+        elif cmd == chatlib.PROTOCOL_CLIENT["get_questions_msg"]:
+            handle_questions_message(conn, user, data)
         elif cmd == chatlib.PROTOCOL_CLIENT["send_answer_msg"]:
             handle_answer_message(conn, user, data)
+        elif cmd == chatlib.PROTOCOL_CLIENT["create_room_msg"]:
+            handle_create_room_message(conn, user, data)
+        elif cmd == chatlib.PROTOCOL_CLIENT["join_room_msg"]:
+            handle_join_room_message(conn, user, data)
+        elif cmd == chatlib.PROTOCOL_CLIENT["leave_room_msg"]:
+            handle_leave_room_message(conn, user)
+        elif cmd == chatlib.PROTOCOL_CLIENT["start_room_msg"]:
+            handle_start_room_message(conn, user)
+        elif cmd == chatlib.PROTOCOL_CLIENT["room_answer_msg"]:
+            handle_room_answer_message(conn, user, data)
+        elif cmd == chatlib.PROTOCOL_CLIENT["subscribe_msg"]:
+            handle_subscribe_message(conn)
+        elif cmd == chatlib.PROTOCOL_CLIENT["unsubscribe_msg"]:
+            handle_unsubscribe_message(conn)
         else:
             send_error(conn, "Unknown command after login")
 
 
+def setup_tls(cert_file, key_file):
+    """
+    Creates the TLS contexts. ssl and tls are only imported here, a server without
+    --tls-cert never loads them.
+    """
+    global tls_context
+    global peer_tls_context
+    global tls_retry_errors
+    import ssl
+    import tls
+
+    tls_context = tls.server_context(cert_file, key_file)
+    peer_tls_context = tls.client_context(cert_file)  # Shards share a certificate (or its CA)
+    tls_retry_errors = (ssl.SSLWantReadError, ssl.SSLWantWriteError)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Trivia game server")
+    parser.add_argument("--host", default=SERVER_IP, help="address to listen on")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--shards", nargs="+", metavar="HOST:PORT",
+                        help="addresses of all the servers sharing the users, this one included")
+    parser.add_argument("--shard-secret", default=os.environ.get(SHARD_SECRET_ENV),
+                        help=f"secret the shards prove themselves to each other with, defaults to ${SHARD_SECRET_ENV}")
+    parser.add_argument("--users-file", default="users.txt", help="users database of this server")
+    parser.add_argument("--stats-file", default="question_stats.bin", help="question statistics of this server")
+    parser.add_argument("--questions-file", default="questions.txt", help="questions file of this server")
+    parser.add_argument("--no-download", action="store_true",
+                        help="start with the questions saved in --questions-file instead of downloading new ones")
+    parser.add_argument("--event-log", metavar="DIR",
+                        help="append logins, questions and answers to an event log in this directory (see analytics.py)")
+    parser.add_argument("--admin-socket", metavar="PATH",
+                        help="UNIX socket of the admin control channel (see admin.py), off by default")
+    parser.add_argument("--tls-cert", help="certificate (PEM) to serve TLS with, requires --tls-key")
+    parser.add_argument("--tls-key", help="private key (PEM) of the TLS certificate")
+    args = parser.parse_args()
+    if (args.tls_cert is None) != (args.tls_key is None):
+        parser.error("--tls-cert and --tls-key must be given together")
+    if args.admin_socket is not None and not hasattr(socket, "AF_UNIX"):
+        parser.error("--admin-socket needs UNIX sockets, which this platform does not have")
+    if args.shards is not None:
+        try:
+            args.shards = [sharding.format_address(*sharding.parse_address(node)) for node in args.shards]
+        except ValueError as e:
+            parser.error(str(e))
+        if sharding.format_address(args.host, args.port) not in args.shards:
+            parser.error("--shards must include this server's own --host:--port")
+        if not args.shard_secret:
+            parser.error(f"--shards needs --shard-secret (or ${SHARD_SECRET_ENV})")
+    return args
+
+
 def main():
-    # Initializes global users and questions dicionaries using load functions, will be used later
-    global users
-    global questions
-    global messages_to_send
-    
-    # Load users and questions from text files
-    users = load_user_database()   # Load users from users.txt
-    questions = load_questions_from_web()   # Load questions from the web
+    global users_file
+    global stats_file
+    global questions_file
+    global event_log
+    global shard_ring
+    global shard_name
+    global shard_secret
+
+    server_control["started_at"] = time.monotonic()
+    args = parse_arguments()
+    if args.tls_cert is not None:
+        setup_tls(args.tls_cert, args.tls_key)
+    users_file = args.users_file
+    stats_file = args.stats_file
+    questions_file = args.questions_file
+    if args.event_log is not None:
+        event_log = eventlog.EventLog(args.event_log)
+    if args.shards is not None:
+        shard_ring = sharding.HashRing(args.shards)
+        shard_name = sharding.format_address(args.host, args.port)
+        shard_secret = args.shard_secret
+
 
     print("Welcome to Trivia Server!")
-    
-    # Set up the server socket
-    server_socket = setup_socket()
 
-    # Keep track of client sockets and messages to send
+    # Set up the server socket first, then load users (users.txt or this shard's file)
+    # and questions (from the web, or the questions file with --no-download)
+    server_socket = setup_socket(args.host, args.port)
+    admin_socket = setup_admin_socket(args.admin_socket) if args.admin_socket is not None else None
+    start_loading(download=not args.no_download)
+
+    # Keep track of client sockets
     client_sockets = []
+
+    install_signal_handlers()
     
     while True:
         try:
-            ready_to_read, ready_to_write, in_error = select.select([server_socket] + client_sockets, client_sockets, [])
+            if server_control["reload"] and server_control["ready"]:
+                reload_server()
+            if server_control["mode"] is not None and server_control["drain_deadline"] is None:
+                start_drain(client_sockets)
+            draining = server_control["drain_deadline"] is not None
+            if draining and drain_step(client_sockets, server_socket):
+                break
+
+            # Connections waiting for a deferred reply or with a full output queue are
+            # not read, so their replies stay in order and memory stays bounded.
+            # Until the startup load is done, requests wait unread in the socket buffers.
+            # While draining no new connections or requests are read at all, the admin channel included.
+            # The offloader's wake socket tells us when background jobs finish.
+            # A TLS handshake waits for whichever direction ssl asked for.
+            if draining:
+                readable_sockets = [offloader.wake_socket]
+            else:
+                readable_sockets = [server_socket, offloader.wake_socket]
+                readable_sockets += [c for c in client_sockets if c not in deferred_replies and not is_paused(c)
+                                     and not connections[c]["handshake_wants_write"]
+                                     and (server_control["ready"] or is_handshaking(c))]
+                if admin_socket is not None:
+                    readable_sockets += [admin_socket] + list(admin_connections)
+            writable_clients = [c for c in client_sockets
+                                if connections[c]["outbox"] or connections[c]["handshake_wants_write"]]
+            writable_admins = [c for c, state in admin_connections.items() if state["outbox"]]
+
+            # Wake up in time for the next room deadline, event push, handshake or drain timeout
+            timeouts = [room_scheduler.timeout(), pending_events.timeout(), expire_handshakes(client_sockets)]
+            if draining:
+                timeouts.append(max(0.0, server_control["drain_deadline"] - time.monotonic()))
+            timeouts = [t for t in timeouts if t is not None]
+            timeout = min(timeouts) if timeouts else None
+            ready_to_read, ready_to_write, in_error = select.select(readable_sockets, writable_clients + writable_admins,
+                                                                   [], timeout)
+
+            # The admin channel is served first, its sockets have no client state
+            admin_ready = [c for c in ready_to_read if c is admin_socket or c in admin_connections]
+            admin_writable = [c for c in ready_to_write if c in admin_connections]
+            ready_to_read = [c for c in ready_to_read if c not in admin_ready]
+            ready_to_write = [c for c in ready_to_write if c not in admin_writable]
+            for current_socket in admin_ready:
+                if current_socket is admin_socket:
+                    accept_admin(admin_socket)
+                elif current_socket in admin_connections:
+                    read_admin(current_socket)
+            for current_socket in admin_writable:
+                if current_socket in admin_connections:
+                    send_admin(current_socket)
 
             # Handle ready_to_read sockes
             for current_socket in ready_to_read:
-                if current_socket is server_socket:
+                if current_socket is offloader.wake_socket:
+                    # Finish the requests whose background jobs are done
+                    offloader.run_callbacks()
+                elif current_socket is server_socket:
                     # Accept new client connections
-                    client_socket, client_address = server_socket.accept()
+                    client_socket = accept_client(server_socket)
                     client_sockets.append(client_socket)
-                    print(f"New client joined! Address: {client_address}, Total clients: {len(client_sockets)}")
+                    print(f"New client joined! Address: {get_address(client_socket)}, Total clients: {len(client_sockets)}")
                     print_client_sockets(client_sockets)
+                elif is_handshaking(current_socket):
+                    advance_handshake(current_socket)
                 else:
                      # Handle data from an existing client
-                     print("New data from client")
                      try:
-                        # Receive and parse client message
-                        cmd, data = recv_message_and_parse(current_socket)
-                    
-                        # If client disconnects or sends an empty message
-                        if cmd == chatlib.ERROR_RETURN:
-                            print(f"Connection with {current_socket.getpeername()} closed")
-                            handle_logout_message(current_socket)
-                            client_sockets.remove(current_socket)
-                            print(f"Total clients: {len(client_sockets)}")
-                            print_client_sockets(client_sockets)
+                        # If client disconnects
+                        if not recv_into_inbox(current_socket):
+                            print(f"Connection with {get_address(current_socket)} closed")
+                            sockets_to_close.add(current_socket)
                             continue
-                    
-                        # If the client logs out
-                        if cmd == chatlib.PROTOCOL_CLIENT["logout_msg"]:
-                            handle_logout_message(current_socket)
-                            client_sockets.remove(current_socket)
-                            print(f"Total clients: {len(client_sockets)}")
-                            print_client_sockets(client_sockets)
-                            continue
-                    
-                        # Route the message to the appropriate handler
-                        handle_client_message(current_socket, cmd, data)                
-                
+
                      except (ConnectionResetError, ConnectionAbortedError, OSError) as e:
                         # Handle the case where the client disconnected unexpectedly
-                        print(f"Client {current_socket.getpeername()} disconnected abruptly: {e}")
-                        handle_logout_message(current_socket)
-                        client_sockets.remove(current_socket) 
-                        print(f"Total clients: {len(client_sockets)}")                       
-                        print_client_sockets(client_sockets)
+                        print(f"Client {get_address(current_socket)} disconnected abruptly: {e}")
+                        sockets_to_close.add(current_socket)
                         continue
-            
+
+            # Continue TLS handshakes that were waiting to write
+            for current_socket in ready_to_write:
+                if current_socket not in sockets_to_close and is_handshaking(current_socket):
+                    advance_handshake(current_socket)
+
+            if not draining:
+                # Close expired room questions and start the next rounds
+                run_room_scheduler()
+
+                # Handle every complete message received so far
+                for current_socket in client_sockets:
+                    process_inbox(current_socket)
+
+            # Push the events of the last coalescing window
+            push_pending_events()
+
             # Handle messages waiting to be sent
-            
-            msg_to_remove = []
-            
-            for message in messages_to_send:
-                current_socket, data = message
-                if current_socket in ready_to_write:
-                    try:
-                        current_socket.send(data.encode())
-                        msg_to_remove.append(message)
-                    except OSError as e:
-                        print(f"Error sending message to {current_socket.getpeername()}: {e}")
-                        handle_logout_message(current_socket)
-                        client_sockets.remove(current_socket)                        
-                        print(f"Total clients: {len(client_sockets)}")                       
-                        print_client_sockets(client_sockets)
-            
-            # Remove successfully sent messages
-            for message in msg_to_remove:
-                messages_to_send.remove(message)
-            
+            for current_socket in ready_to_write:
+                if current_socket in sockets_to_close or is_handshaking(current_socket):
+                    continue
+                try:
+                    send_pending(current_socket)
+                except OSError as e:
+                    print(f"Error sending message to {get_address(current_socket)}: {e}")
+                    sockets_to_close.add(current_socket)
+
+            # Drop clients that left, broke or exceeded their limits
+            for current_socket in list(sockets_to_close):
+                disconnect_client(current_socket, client_sockets)
         
         except KeyboardInterrupt:
-            # Handle server shutdown (Ctrl+C on the server)
-            print("\nServer is shutting down")
-            save_all_data()  # Save data before shutting down
-
-            # Notify connected clients about the shutdown
-            for client_socket in client_sockets:
-                try:
-                    client_socket.send("Server is shutting down...".encode())
-                    client_socket.close()
-                except OSError:
-                    pass
-
+            # Second Ctrl+C while draining - stop right away
+            print("\nServer is shutting down now")
+            if not server_control["persisted"]:
+                save_all_data()  # Save data before shutting down
+                server_control["persisted"] = True
             break
 
+    for client_socket in client_sockets:
+        client_socket.close()
+    offloader.shutdown(wait=False)
     server_socket.close()
+    if admin_socket is not None:
+        for conn in list(admin_connections):
+            close_admin(conn)
+        admin_socket.close()
+        if server_control["mode"] != "upgrade":
+            # On upgrade the successor has already replaced the socket file with its own
+            try:
+                os.unlink(args.admin_socket)
+            except FileNotFoundError:
+                pass
+    if event_log is not None:
+        event_log.close()
+    print("Server stopped")
 
 if __name__ == '__main__':
     main()
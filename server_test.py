@@ -0,0 +1,113 @@
+import os
+import re
+import signal
+import tempfile
+import time
+
+import admin
+import triviaclient
+from checks import check, catch, write_test_data, start_server, stop_server
+
+
+PORT = 5711
+RELOAD_TIMEOUT = 10  # Seconds
+
+
+def wait_for(condition, timeout=RELOAD_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def reload_checks(directory):
+    """
+    SIGHUP merges the questions file into the pool: served questions can still be
+    answered, and questions added through the admin channel are kept
+    """
+    write_test_data(directory, question_count=5)
+    admin_path = os.path.join(directory, "admin.sock")
+    process = start_server(directory, PORT, "--admin-socket", admin_path)
+    try:
+        with triviaclient.TriviaClient("127.0.0.1", PORT, reconnect=False) as client:
+            client.login("test", "test")
+            question = client.get_question()
+
+            with open(os.path.join(directory, "extra.txt"), "w") as file:
+                file.write("Added by the admin?|right|wrong|wrong|wrong|1\n")
+            check("admin import", admin.send_command(admin_path, "load-questions", ["extra.txt"])["ok"], True)
+            with open(os.path.join(directory, "questions.txt"), "a") as file:
+                file.write("99|Added to the file?|right|wrong|wrong|wrong|1|General|easy\n")
+
+            process.send_signal(signal.SIGHUP)
+            check("file question added, admin question kept",
+                  wait_for(lambda: admin.send_command(admin_path, "stats")["questions"] == 7), True)
+            check("question served before the reload answered", client.send_answer(question.id, 1), (True, None))
+            check("no second answer", catch(client.send_answer, question.id, 1), triviaclient.TriviaError)
+
+            os.remove(os.path.join(directory, "questions.txt"))
+            process.send_signal(signal.SIGHUP)
+            time.sleep(1)
+            check("missing file keeps the pool", admin.send_command(admin_path, "stats")["questions"], 7)
+    finally:
+        stop_server(process)
+
+
+def process_exited(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    return False
+
+
+def handoff_checks(directory):
+    """
+    SIGUSR2 hands the listening socket to a new process, which starts with the saved questions
+    """
+    write_test_data(directory, question_count=5)
+    process = start_server(directory, PORT)
+    successor = None
+    client = triviaclient.TriviaClient("127.0.0.1", PORT)
+    try:
+        client.connect()
+        client.login("test", "test")
+        question = client.get_question()
+        client.send_answer(question.id, 1)
+
+        process.send_signal(signal.SIGUSR2)
+        process.wait(timeout=RELOAD_TIMEOUT)
+        with open(os.path.join(directory, "server.log")) as log:
+            match = re.search(r"Started successor process (\d+)", log.read())
+        check("successor started", match is not None, True)
+        successor = int(match.group(1)) if match else None
+
+        check("score kept by the successor", client.get_score(), 5)
+        question = client.get_question()
+        check("successor serves the saved questions under their IDs",
+              question.text, f"Question {question.id}?")
+        check("first connection, then one reconnect", client.connection_count, 2)
+    finally:
+        client.close()
+        stop_server(process)
+        if successor is not None:
+            os.kill(successor, signal.SIGINT)
+            wait_for(lambda: process_exited(successor), timeout=30)
+
+
+def main():
+
+    # RELOAD
+    with tempfile.TemporaryDirectory() as directory:
+        reload_checks(directory)
+
+    # HANDOFF
+    if hasattr(signal, "SIGUSR2"):
+        with tempfile.TemporaryDirectory() as directory:
+            handoff_checks(directory)
+
+
+if __name__ == '__main__':
+    main()
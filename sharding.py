@@ -0,0 +1,159 @@
+##############################################################################
+# sharding.py
+##############################################################################
+
+import bisect
+import codecs
+import hashlib
+import heapq
+import itertools
+import os
+import socket
+import sys
+
+import chatlib
+
+
+VIRTUAL_NODES = 64  # Points per node on the ring, more points spread users more evenly
+PEER_TIMEOUT = 2  # Seconds a node waits for another node's scores
+
+
+def parse_address(address):
+    """
+    Parses a node address
+    Parameters: address (str) - "host:port"
+    Returns: (host, port). Raises ValueError if the address is invalid
+    """
+    host, separator, port = address.rpartition(":")
+    if not separator or not host or not port.isdigit():
+        raise ValueError(f"Invalid node address {address!r}, expected host:port")
+    return host, int(port)
+
+
+def format_address(host, port):
+    return f"{host}:{port}"
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of usernames to nodes. Each node is placed on the ring
+    at many points, a user belongs to the first point after its own hash.
+    Adding or removing a node only moves the users of the points it takes or
+    gives back, about 1/n of them, the other users keep their node.
+    """
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        self.nodes = sorted(set(nodes))
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def node_for(self, key):
+        """
+        Returns: the node (str) that owns the given key (e.g. a username)
+        """
+        index = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.owners[index]
+
+
+def merge_top_scores(score_lists, k):
+    """
+    Merges per-shard top lists into the global top list.
+    Parameters: score_lists (list of lists of (username, score), each sorted best first), k (int)
+    Returns: list of the k best (username, score), best first
+    """
+    merged = heapq.merge(*score_lists, key=lambda entry: entry[1], reverse=True)
+    return list(itertools.islice(merged, k))
+
+
+def format_scores(scores):
+    """
+    Returns: the data of a SHARD_TOP_OK message - one username#score per line
+    """
+    return "\n".join(chatlib.join_data([username, str(score)]) for username, score in scores)
+
+
+def parse_scores(data):
+    """
+    Parses the data of a SHARD_TOP_OK message.
+    Returns: list of (username, score). Raises ValueError if the data is invalid
+    """
+    scores = []
+    for line in data.splitlines():
+        fields = chatlib.split_data(line, 2)
+        if fields == [chatlib.ERROR_RETURN] or not fields[1].lstrip("-").isdigit():
+            raise ValueError(f"Invalid score line {line!r}")
+        scores.append((fields[0], int(fields[1])))
+    return scores
+
+
+def fetch_top_scores(address, k, secret, tls_context=None, timeout=PEER_TIMEOUT):
+    """
+    Asks another node for its k best scores. Blocking, runs in the offloader.
+    Parameters: address (str) - "host:port", k (int), secret (str) - the shards' --shard-secret,
+    tls_context (ssl.SSLContext or None), timeout (seconds)
+    Returns: list of (username, score), best first. Raises OSError or ValueError on failure
+    """
+    host, port = parse_address(address)
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        if tls_context is not None:
+            sock = tls_context.wrap_socket(sock, server_hostname=host)
+        request = chatlib.build_message(chatlib.PROTOCOL_CLIENT["shard_top_msg"], chatlib.join_data([str(k), secret]))
+        sock.sendall(request.encode())
+
+        buffer = ""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError(f"Node {address} closed the connection")
+            buffer += decoder.decode(data)
+            full_msg, buffer = chatlib.split_message(buffer)
+            if buffer is chatlib.ERROR_RETURN:
+                raise ValueError(f"Invalid reply from node {address}")
+            if full_msg is not chatlib.ERROR_RETURN:
+                break
+    finally:
+        sock.close()
+
+    code, data = chatlib.parse_message(full_msg)
+    if code != chatlib.PROTOCOL_SERVER["shard_top_ok_msg"]:
+        raise ValueError(f"Node {address} answered {code}: {data}")
+    return parse_scores(data)
+
+
+def split_users_file(file_path, nodes):
+    """
+    Splits a single-node users file into one file per node, next to it
+    (users.txt -> users-127.0.0.1-5678.txt, ...).
+    Parameters: file_path (str), nodes (list of "host:port")
+    Returns: {node: file path}
+    """
+    ring = HashRing(nodes)
+    stem, extension = os.path.splitext(file_path)
+    paths = {node: f"{stem}-{node.replace(':', '-')}{extension}" for node in ring.nodes}
+    lines = {node: [] for node in ring.nodes}
+    with open(file_path, "r") as file:
+        for line in file:
+            if line.strip():
+                lines[ring.node_for(line.split("|", 1)[0])].append(line.rstrip("\n") + "\n")
+    for node, path in paths.items():
+        with open(path, "w") as file:
+            file.writelines(lines[node])
+    return paths
+
+
+if __name__ == '__main__':
+    # python sharding.py users.txt 127.0.0.1:5678 127.0.0.1:5679 ...
+    if len(sys.argv) < 3:
+        print("Usage: python sharding.py USERS_FILE HOST:PORT [HOST:PORT ...]")
+        sys.exit(1)
+    for node, path in split_users_file(sys.argv[1], sys.argv[2:]).items():
+        print(f"{node}: {path}")
@@ -0,0 +1,118 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+import sharding
+import triviaclient
+from checks import check, catch, wait_for_port
+
+
+NODES = ["127.0.0.1:5701", "127.0.0.1:5702", "127.0.0.1:5703"]
+SECRET = "test-secret"
+
+
+def ring_checks():
+    ring = sharding.HashRing(NODES)
+    keys = [f"player{i}" for i in range(3000)]
+    owners = {key: ring.node_for(key) for key in keys}
+
+    # The same key always maps to the same node, whatever the order of the nodes
+    check("same owners with the nodes reversed",
+          all(sharding.HashRing(NODES[::-1]).node_for(key) == owner for key, owner in owners.items()), True)
+
+    # Every node gets a fair share of the users
+    shares = [list(owners.values()).count(node) / len(keys) for node in NODES]
+    check(f"shares {[round(share, 2) for share in shares]} between 0.2 and 0.5",
+          all(0.2 < share < 0.5 for share in shares), True)
+
+    # A new node only takes users, about a quarter of them, the others keep their node
+    bigger_ring = sharding.HashRing(NODES + ["127.0.0.1:5704"])
+    moved = [key for key in keys if bigger_ring.node_for(key) != owners[key]]
+    check("moved users all go to the new node",
+          all(bigger_ring.node_for(key) == "127.0.0.1:5704" for key in moved), True)
+    check(f"{len(moved)} of {len(keys)} users moved, less than 40%", len(moved) < 0.4 * len(keys), True)
+
+
+def merge_checks():
+    lists = [[("a", 90), ("b", 10)], [("c", 50), ("d", 40)], [], [("e", 95)]]
+    check("merge of per-shard top lists", sharding.merge_top_scores(lists, 3), [("e", 95), ("a", 90), ("c", 50)])
+    check("merge with fewer entries than k", sharding.merge_top_scores([[("a", 1)]], 3), [("a", 1)])
+    check("scores survive the SHARD_TOP_OK format",
+          sharding.parse_scores(sharding.format_scores([("a", 90), ("b", 0)])), [("a", 90), ("b", 0)])
+    check("invalid address", catch(sharding.parse_address, "localhost"), ValueError)
+
+
+def cluster_checks(directory):
+    """
+    Runs three shards on localhost, logs every user in through the first one and
+    checks that each lands on its own shard and that HIGHSCORE merges all shards
+    """
+    users = {f"player{i}": i * 10 for i in range(12)}
+    users_path = os.path.join(directory, "users.txt")
+    with open(users_path, "w") as file:
+        for username, score in users.items():
+            file.write(f"{username}|pw|{score}|\n")
+    files = sharding.split_users_file(users_path, NODES)
+
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    env = dict(os.environ, TRIVIA_SHARD_SECRET=SECRET)
+    processes = []
+    for node in NODES:
+        host, port = sharding.parse_address(node)
+        processes.append(subprocess.Popen([sys.executable, server, "--host", host, "--port", str(port),
+                                           "--users-file", files[node], "--questions-file", f"questions-{port}.txt",
+                                           "--shards"] + NODES,
+                                          cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    try:
+        check("all shards started", all(wait_for_port(*sharding.parse_address(node)) for node in NODES), True)
+
+        ring = sharding.HashRing(NODES)
+        landed = {}
+        for username in users:
+            with triviaclient.TriviaClient(*sharding.parse_address(NODES[0]), reconnect=False) as client:
+                client.login(username, "pw")
+                landed[username] = sharding.format_address(client.host, client.port)
+                if username == "player0":
+                    highscore = client.get_highscore()
+        check("every login ends on the user's shard", landed, {username: ring.node_for(username) for username in users})
+        check("HIGHSCORE merges every shard", highscore,
+              sorted(users.items(), key=lambda item: item[1], reverse=True))
+
+        # Clients that know the shards go straight to the right one
+        with triviaclient.TriviaClient(*sharding.parse_address(NODES[0]), reconnect=False, shards=NODES) as client:
+            client.login("player5", "pw")
+            check("client-side routing", sharding.format_address(client.host, client.port), ring.node_for("player5"))
+            check("score on the user's shard", client.get_score(), 50)
+
+        # SHARD_TOP is only answered for the shards' secret
+        check("shard scores with the secret", sharding.fetch_top_scores(NODES[1], 1, SECRET),
+              [max(((username, score) for username, score in users.items() if ring.node_for(username) == NODES[1]),
+                   key=lambda item: item[1])])
+        check("shard scores with a wrong secret", catch(sharding.fetch_top_scores, NODES[1], 1, "guess"), ValueError)
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGINT)
+        for process in processes:
+            process.wait(timeout=30)
+    check("every shard saved its own questions file",
+          all(os.path.exists(os.path.join(directory, f"questions-{sharding.parse_address(node)[1]}.txt"))
+              for node in NODES), True)
+
+
+def main():
+
+    # RING
+    ring_checks()
+
+    # MERGE
+    merge_checks()
+
+    # CLUSTER
+    with tempfile.TemporaryDirectory() as directory:
+        cluster_checks(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+##############################################################################
+# tls.py
+##############################################################################
+
+import os
+import ssl
+
+
+MINIMUM_VERSION = ssl.TLSVersion.TLSv1_2
+SESSION_TICKETS = 2  # TLS 1.3 tickets sent after each handshake, each one resumes one connection
+HANDSHAKE_TIMEOUT = 10  # Seconds a client may take to finish its handshake
+
+
+def server_context(cert_file, key_file):
+    """
+    Creates the server's TLS context. Session tickets are on, so a client that
+    kept the session of its last connection resumes it without a full handshake.
+    Ticket keys live in the context: sessions resume as long as the process runs.
+    Parameters: cert_file (str), key_file (str) - PEM files
+    Returns: ssl.SSLContext
+    """
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.minimum_version = MINIMUM_VERSION
+    context.load_cert_chain(cert_file, key_file)
+    context.num_tickets = SESSION_TICKETS
+    return context
+
+
+def client_context(ca_file=None):
+    """
+    Creates a client TLS context that verifies the server certificate, against
+    ca_file (e.g. a self-signed server certificate) or the system CAs.
+    Use the same context for every connection, sessions only resume within it.
+    Parameters: ca_file (str or None)
+    Returns: ssl.SSLContext
+    """
+    context = ssl.create_default_context(cafile=ca_file)
+    context.minimum_version = MINIMUM_VERSION
+    return context
+
+
+def create_self_signed_cert(directory, common_name="localhost"):
+    """
+    Creates a self-signed certificate for local testing with the openssl command line tool.
+    It is valid for localhost and 127.0.0.1.
+    Parameters: directory (str), common_name (str)
+    Returns: (cert_file, key_file)
+    """
+    import subprocess  # Only needed here, not by a server or client importing this module
+
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                    "-nodes", "-days", "30", "-keyout", key_file, "-out", cert_file,
+                    "-subj", f"/CN={common_name}", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+                   check=True, capture_output=True)
+    return cert_file, key_file
@@ -0,0 +1,784 @@
+##############################################################################
+# triviaclient.py
+##############################################################################
+
+import asyncio
+import codecs
+import collections
+import socket
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import chatlib
+import questionindex
+import sharding
+
+
+SERVER_IP = "127.0.0.1"
+SERVER_PORT = 5678
+DEFAULT_TIMEOUT = 10.0  # Seconds to wait for a reply
+RECONNECT_DELAYS = (0.1, 0.5, 1, 2, 5)  # Back-off between reconnect attempts, the last one repeats
+RECV_BUFFER_SIZE = 4096
+MAX_REDIRECTS = 3  # REDIRECT replies a login follows before giving up
+
+# Messages the server sends on its own, not as a reply to a request
+PUSH_CODES = {
+    chatlib.PROTOCOL_SERVER["room_members_msg"],
+    chatlib.PROTOCOL_SERVER["room_question_msg"],
+    chatlib.PROTOCOL_SERVER["room_result_msg"],
+    chatlib.PROTOCOL_SERVER["room_over_msg"],
+    chatlib.PROTOCOL_SERVER["events_msg"],
+    chatlib.PROTOCOL_SERVER["server_shutdown_msg"],
+    chatlib.PROTOCOL_SERVER["kicked_msg"],
+}
+
+Question = collections.namedtuple("Question", ["id", "text", "answers"])
+
+
+class TriviaError(Exception):
+    """
+    The server answered a request with ERROR (or with an unexpected message)
+    """
+
+
+# SHARED HELPERS (used by the sync and asyncio clients)
+
+def session_requests(client):
+    """
+    Requests that set up a new connection the way the client's session needs it.
+    Returns: list of (cmd, data, expected reply code)
+    """
+    requests = []
+    if client.compression:
+        requests.append((chatlib.PROTOCOL_CLIENT["compression_msg"], chatlib.COMPRESSION_METHOD,
+                         chatlib.PROTOCOL_SERVER["compression_ok_msg"]))
+    if client.credentials is not None:
+        requests.append((chatlib.PROTOCOL_CLIENT["login_msg"], chatlib.join_data(list(client.credentials)),
+                         chatlib.PROTOCOL_SERVER["login_ok_msg"]))
+    return requests
+
+
+def redirect_address(data):
+    """
+    Parses the data of a REDIRECT reply.
+    Returns: (host, port). Raises TriviaError if the data is invalid
+    """
+    fields = chatlib.split_data(data, 2)
+    if fields == [chatlib.ERROR_RETURN] or not fields[1].isdigit():
+        raise TriviaError(f"Invalid redirect {data!r}")
+    return fields[0], int(fields[1])
+
+
+def questions_request_data(count, category=None, difficulty=None, mode=None):
+    """
+    Returns: the data of a GET_QUESTIONS request - count#filter#filter...
+    """
+    return chatlib.join_data([str(count)] + questionindex.format_filters(category, difficulty, mode))
+
+
+def expect(reply, expected_code):
+    """
+    Checks the code of a (code, data) reply.
+    Returns: the data. Raises TriviaError if the code is not the expected one
+    """
+    code, data = reply
+    if code != expected_code:
+        raise TriviaError(data if code == chatlib.PROTOCOL_SERVER["error_msg"] else f"Unexpected reply {code}")
+    return data
+
+
+def parse_question(data):
+    """
+    Parses YOUR_QUESTION / ROOM_QUESTION data: id#question#answer1#answer2#answer3#answer4
+    Returns: Question, or None if the data is invalid
+    """
+    fields = chatlib.split_data(data, 6)
+    if fields == [chatlib.ERROR_RETURN]:
+        return None
+    q_id, text, *answers = fields
+    return Question(int(q_id), text, answers)
+
+
+def parse_question_reply(reply):
+    """
+    Returns: Question, or None if the server has no more questions for us
+    """
+    if reply[0] == chatlib.PROTOCOL_SERVER["no_questions_msg"]:
+        return None
+    question = parse_question(expect(reply, chatlib.PROTOCOL_SERVER["your_question_msg"]))
+    if question is None:
+        raise TriviaError("Invalid question format received from server")
+    return question
+
+
+def parse_questions_reply(reply):
+    """
+    Parses a GET_QUESTIONS reply (one question per line).
+    Returns: list of Question, empty if the server has no more questions for us
+    """
+    if reply[0] == chatlib.PROTOCOL_SERVER["no_questions_msg"]:
+        return []
+    data = expect(reply, chatlib.PROTOCOL_SERVER["your_questions_msg"])
+    batch = [parse_question(line) for line in data.split("\n")]
+    if None in batch:
+        raise TriviaError("Invalid question format received from server")
+    return batch
+
+
+def parse_answer_reply(reply):
+    """
+    Returns: (correct (bool), number of the correct answer or None if ours was correct)
+    """
+    code, data = reply
+    if code == chatlib.PROTOCOL_SERVER["correct_answer_msg"]:
+        return True, None
+    return False, int(expect(reply, chatlib.PROTOCOL_SERVER["wrong_answer_msg"]))
+
+
+def parse_highscore_reply(reply):
+    """
+    Returns: list of (username, score), best first
+    """
+    data = expect(reply, chatlib.PROTOCOL_SERVER["all_score_msg"])
+    table = []
+    for line in data.splitlines():
+        username, _, score = line.rpartition(": ")
+        table.append((username, int(score)))
+    return table
+
+
+def parse_logged_reply(reply):
+    """
+    Returns: list of usernames
+    """
+    data = expect(reply, chatlib.PROTOCOL_SERVER["logged_answer_msg"])
+    return data.split(",") if data else []
+
+
+class TriviaClient:
+    """
+    Blocking client library.
+
+    Requests are pipelined: request() sends right away and returns a Future that is
+    resolved by a background reader thread. The server answers in request order, so
+    replies are matched to requests first in, first out. Messages in PUSH_CODES are
+    handed to push_handler(code, data) on the reader thread instead.
+
+    If the connection drops, requests in flight fail with ConnectionError, and with
+    reconnect=True the client reconnects and logs in again with the last credentials -
+    unless the server sent KICKED (an administrator disconnected the user) first.
+
+    With compression=True, large messages in both directions are compressed
+    (see chatlib.build_message()).
+
+    With tls (an ssl.SSLContext, see tls.client_context()), the connection is
+    encrypted. The TLS session of the last connection is kept, so reconnects
+    resume it instead of doing a full handshake.
+
+    When the servers are sharded, login() follows REDIRECT replies to the shard
+    that owns the user. Given the list of shards, the client finds that shard
+    itself and saves the detour.
+    """
+
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, timeout=DEFAULT_TIMEOUT, reconnect=True, push_handler=None,
+                 compression=False, tls=None, shards=None):
+        self.host = host
+        self.port = port
+        self.ring = sharding.HashRing(shards) if shards else None
+        self.moving = False  # The connection is being moved to another shard
+        self.timeout = timeout
+        self.reconnect = reconnect
+        self.push_handler = push_handler
+        self.compression = compression  # Ask the server to compress large replies
+        self.tls = tls
+        self.tls_session = None  # ssl.SSLSession to resume on the next connection
+        self.credentials = None  # (username, password) of the last successful login
+        self.sock = None
+        self.connection_count = 0  # Connections opened so far, questions are only served to the one that asked
+        self.pending = collections.deque()  # Futures waiting for replies, oldest first
+        self.send_lock = threading.Lock()  # Keeps sends and self.pending in the same order
+        self.connected = threading.Event()
+        self.closed = False
+        self.reader = None
+
+    # Connection handling
+
+    def connect(self):
+        """
+        Connects to the server and starts the reader thread
+        """
+        self._open()
+        self._restore_session()
+        self.reader = threading.Thread(target=self._read_loop, name="trivia-reader", daemon=True)
+        self.reader.start()
+        return self
+
+    def _open(self):
+        self.sock = self._new_socket()
+        self.sock.settimeout(None)  # The reader thread blocks in recv()
+        self.connected.set()
+
+    def _new_socket(self):
+        """
+        Connects (and does the TLS handshake, resuming the last session if there is one)
+        Returns: the connected socket
+        """
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.tls is not None:
+            try:
+                sock = self.tls.wrap_socket(sock, server_hostname=self.host, session=self.tls_session)
+            except OSError:
+                sock.close()
+                raise
+        self.connection_count += 1
+        self.inbox = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.session_kept = self.tls is None
+        return sock
+
+    def _keep_tls_session(self):
+        # TLS 1.3 session tickets arrive after the handshake, before the first reply.
+        # The session must be taken while the connection is fine: once it breaks,
+        # the session can no longer be resumed.
+        self.session_kept = True
+        session = self.sock.session
+        if session is not None:
+            self.tls_session = session
+
+    def close(self):
+        """
+        Logs out (if connected) and closes the connection for good
+        """
+        self.closed = True
+        if self.connected.is_set():
+            try:
+                self._send(chatlib.PROTOCOL_CLIENT["logout_msg"], "")
+            except OSError:
+                pass
+        self.connected.clear()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            # The reader must leave recv() before the socket is closed: a new connection
+            # may get the same file descriptor, and the reader would read its data
+            if self.reader is not None and self.reader is not threading.current_thread():
+                self.reader.join(self.timeout)
+            self.sock.close()
+        self._fail_pending(ConnectionError("Client closed"))
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _fail_pending(self, error):
+        with self.send_lock:
+            while self.pending:
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    def _read_messages(self):
+        """
+        Blocks until at least one message arrives.
+        Returns: list of (code, data). Raises ConnectionError if the connection is closed
+        """
+        messages = []
+        while not messages:
+            data = self.sock.recv(RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionError("Connection closed by server")
+            if not self.session_kept:
+                self._keep_tls_session()
+            self.inbox += self.decoder.decode(data)
+            while True:
+                full_msg, rest = chatlib.split_message(self.inbox)
+                if rest is chatlib.ERROR_RETURN:
+                    raise ConnectionError("Invalid message from server")
+                if full_msg is chatlib.ERROR_RETURN:
+                    break
+                self.inbox = rest
+                messages.append(chatlib.parse_message(full_msg))
+        return messages
+
+    def _dispatch(self, code, data):
+        if code in PUSH_CODES:
+            if code == chatlib.PROTOCOL_SERVER["kicked_msg"]:
+                self.reconnect = False  # Logging in again would undo the kick
+            if self.push_handler is not None:
+                try:
+                    self.push_handler(code, data)
+                except Exception as e:
+                    print(f"Error in push handler: {e}")
+            return
+
+        with self.send_lock:
+            future = self.pending.popleft() if self.pending else None
+        if future is not None and not future.done():
+            future.set_result((code, data))
+
+    def _read_loop(self):
+        while not self.closed:
+            try:
+                for code, data in self._read_messages():
+                    self._dispatch(code, data)
+            except OSError as e:
+                self.connected.clear()
+                self._fail_pending(ConnectionError(f"Connection lost: {e}"))
+                if self.closed or not (self.reconnect or self.moving):
+                    return
+                self._reconnect()
+
+    def _reconnect(self):
+        """
+        Reconnects with back-off, then logs in again. Runs on the reader thread,
+        so user requests wait (in request()) until the session is back.
+        """
+        attempt = 0
+        while not self.closed:
+            if attempt or not self.moving:
+                time.sleep(RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)])
+            attempt += 1
+            try:
+                if self.sock is not None:
+                    self.sock.close()
+                self.sock = self._new_socket()
+                self._restore_session()
+                self.moving = False
+                self.connected.set()
+                return
+            except (OSError, TriviaError) as e:
+                print(f"Reconnect attempt {attempt} failed: {e}")
+
+    def _move_to(self, host, port):
+        """
+        Moves the connection to another server (the shard that owns the user).
+        The reader thread sees the connection end and connects to the new address.
+        """
+        self.host = host
+        self.port = port
+        self.tls_session = None  # Only the server that issued it can resume it
+        self.moving = True
+        self.connected.clear()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _restore_session(self):
+        """
+        Negotiates compression and logs in again on a new connection,
+        before any user request is sent on it.
+        """
+        requests = session_requests(self)
+        self.sock.settimeout(self.timeout)
+        for cmd, data, _ in requests:
+            self._send(cmd, data)
+        expected = [code for _, _, code in requests]
+        while expected:
+            for code, data in self._read_messages():
+                if code in PUSH_CODES:
+                    self._dispatch(code, data)
+                    continue
+                if code == chatlib.PROTOCOL_SERVER["redirect_msg"]:
+                    # The shards changed since the last login, the next attempt goes to the new one
+                    self.host, self.port = redirect_address(data)
+                    raise ConnectionError(f"Redirected to {self.host}:{self.port}")
+                expect((code, data), expected.pop(0))
+        self.sock.settimeout(None)
+
+    # Requests
+
+    def _send(self, cmd, data):
+        full_msg = chatlib.build_message(cmd, data, self.compression)
+        if full_msg is chatlib.ERROR_RETURN:
+            raise ValueError(f"Cannot build message {cmd}")
+        self.sock.sendall(full_msg.encode())
+
+    def request(self, cmd, data=""):
+        """
+        Sends a request without waiting for its reply.
+        Returns: Future resolved with the (code, data) reply
+        """
+        if not self.connected.wait(self.timeout):
+            raise ConnectionError("Not connected to the server")
+
+        future = Future()
+        with self.send_lock:
+            self._send(cmd, data)
+            self.pending.append(future)
+        return future
+
+    def call(self, cmd, data="", timeout=None):
+        """
+        Sends a request and waits for its reply.
+        Returns: (code, data). Raises TimeoutError if no reply came in time
+        """
+        try:
+            return self.request(cmd, data).result(self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"No reply to {cmd}") from None
+
+    # Typed API
+
+    def login(self, username, password):
+        """
+        Logs in, on the shard that owns the user. Raises TriviaError if the server refused the login
+        """
+        if self.ring is not None:
+            owner = sharding.parse_address(self.ring.node_for(username))
+            if owner != (self.host, self.port):
+                self._move_to(*owner)
+        for _ in range(MAX_REDIRECTS):
+            reply = self.call(chatlib.PROTOCOL_CLIENT["login_msg"], chatlib.join_data([username, password]))
+            if reply[0] != chatlib.PROTOCOL_SERVER["redirect_msg"]:
+                break
+            self._move_to(*redirect_address(reply[1]))
+        expect(reply, chatlib.PROTOCOL_SERVER["login_ok_msg"])
+        self.credentials = (username, password)
+
+    def logout(self):
+        self.close()
+
+    def get_score(self):
+        return int(expect(self.call(chatlib.PROTOCOL_CLIENT["my_score_msg"]), chatlib.PROTOCOL_SERVER["your_score_msg"]))
+
+    def get_highscore(self):
+        return parse_highscore_reply(self.call(chatlib.PROTOCOL_CLIENT["highscore_msg"]))
+
+    def get_logged_users(self):
+        return parse_logged_reply(self.call(chatlib.PROTOCOL_CLIENT["logged_msg"]))
+
+    def get_question(self, category=None, difficulty=None, mode=None):
+        """
+        Optionally only from a category (e.g. "Science: Computers") and/or a difficulty ("easy", "medium", "hard"),
+        or with mode="adaptive" a question matching our rating.
+        Returns: Question, or None if the server has no more (matching) questions for us
+        """
+        return parse_question_reply(self.call(chatlib.PROTOCOL_CLIENT["get_question_msg"],
+                                              chatlib.join_data(questionindex.format_filters(category, difficulty, mode))))
+
+    def get_questions(self, count, category=None, difficulty=None, mode=None):
+        """
+        Prefetches up to count questions, filtered like get_question(). They count as asked once answered.
+        Returns: list of Question, empty if the server has no more (matching) questions for us
+        """
+        return parse_questions_reply(self.call(chatlib.PROTOCOL_CLIENT["get_questions_msg"],
+                                               questions_request_data(count, category, difficulty, mode)))
+
+    def send_answer(self, question_id, answer):
+        """
+        Returns: (correct (bool), number of the correct answer or None if ours was correct)
+        """
+        return parse_answer_reply(self.call(chatlib.PROTOCOL_CLIENT["send_answer_msg"],
+                                            chatlib.join_data([str(question_id), str(answer)])))
+
+    def subscribe(self):
+        """
+        Starts EVENTS pushes, delivered to push_handler
+        """
+        expect(self.call(chatlib.PROTOCOL_CLIENT["subscribe_msg"]), chatlib.PROTOCOL_SERVER["subscribe_ok_msg"])
+
+
+class AsyncTriviaClient:
+    """
+    asyncio version of TriviaClient, with the same pipelining, push handling
+    and reconnect behavior. All methods must be called from the event loop.
+    TLS is supported, but asyncio does not let us pass a session to resume,
+    so every reconnect does a full handshake.
+    """
+
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, timeout=DEFAULT_TIMEOUT, reconnect=True, push_handler=None,
+                 compression=False, tls=None, shards=None):
+        self.host = host
+        self.port = port
+        self.ring = sharding.HashRing(shards) if shards else None
+        self.moving = False
+        self.timeout = timeout
+        self.reconnect = reconnect
+        self.push_handler = push_handler
+        self.compression = compression  # Ask the server to compress large replies
+        self.tls = tls
+        self.credentials = None
+        self.reader = None
+        self.writer = None
+        self.pending = collections.deque()
+        self.connected = asyncio.Event()
+        self.closed = False
+        self.read_task = None
+
+    # Connection handling
+
+    async def connect(self):
+        await self._open()
+        await self._restore_session()
+        self.connected.set()
+        self.read_task = asyncio.get_running_loop().create_task(self._read_loop())
+        return self
+
+    async def _open(self):
+        tls_options = {} if self.tls is None else {"ssl": self.tls, "server_hostname": self.host}
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port, **tls_options),
+                                                          self.timeout)
+        self.inbox = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+
+    async def close(self):
+        self.closed = True
+        if self.connected.is_set():
+            try:
+                self._send(chatlib.PROTOCOL_CLIENT["logout_msg"], "")
+                await self.writer.drain()
+            except OSError:
+                pass
+        self.connected.clear()
+        if self.writer is not None:
+            self.writer.close()
+        if self.read_task is not None:
+            self.read_task.cancel()
+        self._fail_pending(ConnectionError("Client closed"))
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _fail_pending(self, error):
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def _read_messages(self):
+        messages = []
+        while not messages:
+            data = await self.reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionError("Connection closed by server")
+            self.inbox += self.decoder.decode(data)
+            while True:
+                full_msg, rest = chatlib.split_message(self.inbox)
+                if rest is chatlib.ERROR_RETURN:
+                    raise ConnectionError("Invalid message from server")
+                if full_msg is chatlib.ERROR_RETURN:
+                    break
+                self.inbox = rest
+                messages.append(chatlib.parse_message(full_msg))
+        return messages
+
+    def _dispatch(self, code, data):
+        if code in PUSH_CODES:
+            if code == chatlib.PROTOCOL_SERVER["kicked_msg"]:
+                self.reconnect = False  # Logging in again would undo the kick
+            if self.push_handler is not None:
+                try:
+                    self.push_handler(code, data)
+                except Exception as e:
+                    print(f"Error in push handler: {e}")
+            return
+
+        future = self.pending.popleft() if self.pending else None
+        if future is not None and not future.done():
+            future.set_result((code, data))
+
+    async def _read_loop(self):
+        while not self.closed:
+            try:
+                for code, data in await self._read_messages():
+                    self._dispatch(code, data)
+            except OSError as e:
+                self.connected.clear()
+                self._fail_pending(ConnectionError(f"Connection lost: {e}"))
+                if self.closed or not (self.reconnect or self.moving):
+                    return
+                await self._reconnect()
+
+    async def _reconnect(self):
+        attempt = 0
+        while not self.closed:
+            if attempt or not self.moving:
+                await asyncio.sleep(RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)])
+            attempt += 1
+            try:
+                if self.writer is not None:
+                    self.writer.close()
+                await self._open()
+                await self._restore_session()
+                self.moving = False
+                self.connected.set()
+                return
+            except (OSError, asyncio.TimeoutError, TriviaError) as e:
+                print(f"Reconnect attempt {attempt} failed: {e}")
+
+    def _move_to(self, host, port):
+        self.host = host
+        self.port = port
+        self.moving = True
+        self.connected.clear()
+        self.writer.close()  # The read loop sees the connection end and connects to the new address
+
+    async def _restore_session(self):
+        requests = session_requests(self)
+        for cmd, data, _ in requests:
+            self._send(cmd, data)
+        expected = [code for _, _, code in requests]
+        while expected:
+            for code, data in await asyncio.wait_for(self._read_messages(), self.timeout):
+                if code in PUSH_CODES:
+                    self._dispatch(code, data)
+                    continue
+                if code == chatlib.PROTOCOL_SERVER["redirect_msg"]:
+                    self.host, self.port = redirect_address(data)
+                    raise ConnectionError(f"Redirected to {self.host}:{self.port}")
+                expect((code, data), expected.pop(0))
+
+    # Requests
+
+    def _send(self, cmd, data):
+        full_msg = chatlib.build_message(cmd, data, self.compression)
+        if full_msg is chatlib.ERROR_RETURN:
+            raise ValueError(f"Cannot build message {cmd}")
+        self.writer.write(full_msg.encode())
+
+    async def request(self, cmd, data=""):
+        """
+        Sends a request without waiting for its reply.
+        Returns: asyncio.Future resolved with the (code, data) reply
+        """
+        if not self.connected.is_set():
+            await asyncio.wait_for(self.connected.wait(), self.timeout)
+
+        future = asyncio.get_running_loop().create_future()
+        self._send(cmd, data)
+        self.pending.append(future)
+        await self.writer.drain()
+        return future
+
+    async def call(self, cmd, data="", timeout=None):
+        """
+        Sends a request and waits for its reply.
+        Returns: (code, data). Raises asyncio.TimeoutError if no reply came in time
+        """
+        future = await self.request(cmd, data)
+        # shield() keeps a timed-out future in self.pending, so later replies still line up
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+
+    # Typed API
+
+    async def login(self, username, password):
+        if self.ring is not None:
+            owner = sharding.parse_address(self.ring.node_for(username))
+            if owner != (self.host, self.port):
+                self._move_to(*owner)
+        for _ in range(MAX_REDIRECTS):
+            reply = await self.call(chatlib.PROTOCOL_CLIENT["login_msg"], chatlib.join_data([username, password]))
+            if reply[0] != chatlib.PROTOCOL_SERVER["redirect_msg"]:
+                break
+            self._move_to(*redirect_address(reply[1]))
+        expect(reply, chatlib.PROTOCOL_SERVER["login_ok_msg"])
+        self.credentials = (username, password)
+
+    async def logout(self):
+        await self.close()
+
+    async def get_score(self):
+        return int(expect(await self.call(chatlib.PROTOCOL_CLIENT["my_score_msg"]), chatlib.PROTOCOL_SERVER["your_score_msg"]))
+
+    async def get_highscore(self):
+        return parse_highscore_reply(await self.call(chatlib.PROTOCOL_CLIENT["highscore_msg"]))
+
+    async def get_logged_users(self):
+        return parse_logged_reply(await self.call(chatlib.PROTOCOL_CLIENT["logged_msg"]))
+
+    async def get_question(self, category=None, difficulty=None, mode=None):
+        return parse_question_reply(await self.call(chatlib.PROTOCOL_CLIENT["get_question_msg"],
+                                                    chatlib.join_data(questionindex.format_filters(category, difficulty,
+                                                                                                   mode))))
+
+    async def get_questions(self, count, category=None, difficulty=None, mode=None):
+        return parse_questions_reply(await self.call(chatlib.PROTOCOL_CLIENT["get_questions_msg"],
+                                                     questions_request_data(count, category, difficulty, mode)))
+
+    async def send_answer(self, question_id, answer):
+        return parse_answer_reply(await self.call(chatlib.PROTOCOL_CLIENT["send_answer_msg"],
+                                                  chatlib.join_data([str(question_id), str(answer)])))
+
+    async def subscribe(self):
+        expect(await self.call(chatlib.PROTOCOL_CLIENT["subscribe_msg"]), chatlib.PROTOCOL_SERVER["subscribe_ok_msg"])
+
+
+class QuestionPrefetcher:
+    """
+    Keeps a small local buffer of questions for a TriviaClient. When the buffer runs low,
+    the next batch is requested in the background (a pipelined GET_QUESTIONS), so by the
+    time the player has answered, the next question is usually already here.
+
+    The server only accepts answers on the connection it sent the question on, so the
+    buffer is dropped when the client reconnects.
+
+    Works with the blocking TriviaClient only. With AsyncTriviaClient, pipelining
+    already gives the same effect: create the get_questions() task early and await it
+    when the buffer runs out.
+    """
+
+    def __init__(self, client, batch_size=3, low_water=1, category=None, difficulty=None, mode=None):
+        self.client = client
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.filters = {"category": category, "difficulty": difficulty, "mode": mode}
+        self.buffer = collections.deque()
+        self.in_flight = None  # Future of the running GET_QUESTIONS
+        self.exhausted = False  # The server had nothing left to prefetch
+        self.connection = client.connection_count  # The connection the buffered questions were served on
+
+    def _check_connection(self):
+        if self.connection != self.client.connection_count:
+            self.connection = self.client.connection_count
+            self.buffer.clear()
+            self.in_flight = None  # Failed with the old connection, or its questions were served there
+            self.exhausted = False
+
+    def _collect(self, wait):
+        if self.in_flight is None or (not wait and not self.in_flight.done()):
+            return
+        future, self.in_flight = self.in_flight, None
+        try:
+            batch = parse_questions_reply(future.result(self.client.timeout))
+        except FutureTimeoutError:
+            raise TimeoutError("No reply to GET_QUESTIONS") from None
+        except (TriviaError, ConnectionError) as e:
+            # E.g. rate limited or reconnecting - next_question() falls back to GET_QUESTION
+            print(f"Prefetch failed: {e}")
+            return
+        self.buffer.extend(batch)
+        self.exhausted = not batch
+
+    def _refill(self):
+        if self.in_flight is None and not self.exhausted and len(self.buffer) <= self.low_water:
+            self.in_flight = self.client.request(chatlib.PROTOCOL_CLIENT["get_questions_msg"],
+                                                 questions_request_data(self.batch_size, **self.filters))
+
+    def next_question(self):
+        """
+        Returns: the next Question, or None if the server has no more questions for us
+        """
+        self._check_connection()
+        self._collect(wait=False)
+        if not self.buffer:
+            self._refill()
+            self._collect(wait=True)
+
+        if self.buffer:
+            question = self.buffer.popleft()
+        else:
+            # Nothing left to prefetch - GET_QUESTION lets the server fetch more
+            question = self.client.get_question(**self.filters)
+            self.exhausted = False
+
+        self._refill()
+        return question
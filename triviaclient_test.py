@@ -0,0 +1,156 @@
+import asyncio
+import socket
+import tempfile
+import time
+
+import chatlib
+import triviaclient
+from checks import check, catch, write_test_data, start_server, stop_server
+
+
+PORT = 5731
+PUSH_TIMEOUT = 5  # Seconds
+
+
+def wait_for(condition, timeout=PUSH_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def request_checks():
+    with triviaclient.TriviaClient("127.0.0.1", PORT, reconnect=False) as client:
+        check("wrong password", catch(client.login, "alice", "nope"), triviaclient.TriviaError)
+        client.login("alice", "a")
+
+        # Pipelining: every request is sent before the first reply is read, replies come back in order
+        futures = [client.request(chatlib.PROTOCOL_CLIENT[cmd])
+                   for cmd in ("my_score_msg", "logged_msg", "highscore_msg", "my_score_msg")]
+        check("pipelined replies in request order", [future.result(5)[0] for future in futures],
+              [chatlib.PROTOCOL_SERVER[code]
+               for code in ("your_score_msg", "logged_answer_msg", "all_score_msg", "your_score_msg")])
+
+        question = client.get_question()
+        check("question parsed", (question.text, len(question.answers)), (f"Question {question.id}?", 4))
+        check("right answer", client.send_answer(question.id, 1), (True, None))
+        check("answer to a question not served", catch(client.send_answer, question.id, 1), triviaclient.TriviaError)
+        check("score", client.get_score(), 5)
+
+
+def timeout_checks():
+    # A server that accepts but never answers
+    with socket.create_server(("127.0.0.1", 0)) as silent:
+        client = triviaclient.TriviaClient("127.0.0.1", silent.getsockname()[1], timeout=0.5, reconnect=False)
+        with client:
+            started = time.monotonic()
+            check("no reply in time", catch(client.call, chatlib.PROTOCOL_CLIENT["my_score_msg"]), TimeoutError)
+            check("waited for the timeout", 0.4 < time.monotonic() - started < 2, True)
+            future = client.request(chatlib.PROTOCOL_CLIENT["my_score_msg"])
+        check("pending request failed by close", type(future.exception(1)), ConnectionError)
+
+
+def push_checks():
+    pushes = []
+    push_handler = lambda code, data: pushes.append((code, data))
+    with triviaclient.TriviaClient("127.0.0.1", PORT, push_handler=push_handler) as alice:
+        alice.login("alice", "a")
+        alice.subscribe()
+        with triviaclient.TriviaClient("127.0.0.1", PORT, reconnect=False) as bob:
+            bob.login("bob", "b")
+            events = lambda: [line for code, data in pushes if code == chatlib.PROTOCOL_SERVER["events_msg"]
+                              for line in data.split("\n")]
+            check("EVENTS push for bob's login", wait_for(lambda: "login#bob" in events()), True)
+        check("replies still matched after pushes", alice.get_score(), 5)
+
+
+def prefetch_checks():
+    with triviaclient.TriviaClient("127.0.0.1", PORT, reconnect=False) as client:
+        client.login("carol", "c")
+        prefetcher = triviaclient.QuestionPrefetcher(client, batch_size=3, low_water=1)
+        first = prefetcher.next_question()
+        check("first batch fetched", (len(prefetcher.buffer), prefetcher.in_flight), (2, None))
+        client.send_answer(first.id, 1)
+        second = prefetcher.next_question()
+        check("refill requested at the low water mark", (len(prefetcher.buffer), prefetcher.in_flight is None),
+              (1, False))
+        prefetcher.in_flight.result(5)
+        third = prefetcher.next_question()
+        check("refill collected", len(prefetcher.buffer), 2)
+        check("no question twice", len({first.id, second.id, third.id}), 3)
+
+        # Prefetched but unanswered questions are still offered, e.g. on another connection
+        with triviaclient.TriviaClient("127.0.0.1", PORT, reconnect=False) as other:
+            other.login("carol", "c")
+            offered = other.get_questions(5)
+        check("only the answered question counts as asked", sorted(question.id for question in offered),
+              sorted(set(range(1, 6)) - {first.id}))
+
+
+def reconnect_checks(directory, process):
+    pushes = []
+    client = triviaclient.TriviaClient("127.0.0.1", PORT, push_handler=lambda code, data: pushes.append(code))
+    try:
+        client.connect()
+        client.login("alice", "a")
+        prefetcher = triviaclient.QuestionPrefetcher(client)
+        prefetcher.next_question()
+        stop_server(process)
+        check("told the server shuts down", chatlib.PROTOCOL_SERVER["server_shutdown_msg"] in pushes, True)
+        process = start_server(directory, PORT)
+
+        # The reader thread reconnects and logs in again, requests wait for it
+        check("score after the reconnect", client.get_score(), 5)
+        check("logged in again", client.get_logged_users(), ["alice"])
+        check("second connection", client.connection_count, 2)
+        question = prefetcher.next_question()
+        check("buffer of the old connection dropped", client.send_answer(question.id, 1), (True, None))
+    finally:
+        client.close()
+    return process
+
+
+async def async_checks():
+    async with triviaclient.AsyncTriviaClient("127.0.0.1", PORT, reconnect=False) as client:
+        await client.login("bob", "b")
+        scores = await asyncio.gather(client.get_score(), client.get_score(), client.get_highscore())
+        check("async pipelined requests", scores, [0, 0, [("alice", 10), ("carol", 5), ("bob", 0)]])
+        try:
+            await client.send_answer(12345, 1)
+            error = None
+        except triviaclient.TriviaError as e:
+            error = type(e)
+        check("async TriviaError", error, triviaclient.TriviaError)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        write_test_data(directory, question_count=5, users=(("alice", "a"), ("bob", "b"), ("carol", "c")))
+        process = start_server(directory, PORT)
+        try:
+
+            # REQUESTS
+            request_checks()
+
+            # TIMEOUTS
+            timeout_checks()
+
+            # PUSHES
+            push_checks()
+
+            # PREFETCHER
+            prefetch_checks()
+
+            # RECONNECT
+            process = reconnect_checks(directory, process)
+
+            # ASYNCIO CLIENT
+            asyncio.run(async_checks())
+        finally:
+            stop_server(process)
+
+
+if __name__ == '__main__':
+    main()